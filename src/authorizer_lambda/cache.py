@@ -0,0 +1,288 @@
+"""Thread-safe TTL and LRU cache, which the authorizer's caches are built on"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, NamedTuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    size: int
+
+
+class _Flight:
+    """A load in progress, which concurrent lookups of the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+def approximate_size(key: Any, value: Any) -> int:
+    """
+    Estimate the memory used by an entry, in bytes: the size of the key and the
+    value, and of the strings, numbers and containers they hold.
+    """
+    size = 0
+    pending = [key, value]
+    while pending:
+        obj = pending.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+    return size
+
+
+class Cache(Generic[K, V]):
+    """
+    Thread-safe cache with TTL expiry, LRU eviction and single-flight loads.
+
+    Entries expire ``ttl`` seconds after they were added, unless they are added with
+    a ttl of their own. None values are negative entries, e.g. for a key known not
+    to exist, and expire after ``negative_ttl`` seconds. At most ``max_entries``
+    entries are kept and, if ``max_bytes`` is set, at most that many bytes as
+    estimated by ``sizeof``; the least recently used entries are evicted to make
+    room. A ttl or a limit of 0 disables caching.
+
+    Concurrent misses of get_or_load() for the same key are coalesced into a single
+    load, which the other callers wait for. Loads run outside the cache lock, so
+    loads of different keys run in parallel; the lock is only held to update the
+    entries. There is a single lock rather than one per key, since all entries
+    share one LRU order and byte budget; the in-flight load of a key serves as its
+    own lock. Failed loads aren't cached; instead an expired entry is used for up to
+    ``max_stale`` seconds after it expired.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        negative_ttl: float | None = None,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        max_stale: float = 0,
+        sizeof: Callable[[Any, Any], int] = approximate_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self.sizeof = sizeof
+        self._clock = clock
+        self._entries: OrderedDict[K, _Entry] = OrderedDict()
+        self._flights: dict[K, _Flight] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """
+        Return the cached value of the key.
+
+        :param key: The key.
+        :param default: What to return if the key isn't cached (anymore).
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            return entry.value
+
+    def get_or_load(self, key: K, load: Callable[[K], V]) -> V:
+        """
+        Return the cached value of the key, loading and caching it on a miss.
+
+        :param key: The key.
+        :param load: Function returning the value of a key, or None if the key
+            doesn't exist.
+        :return: The value, which is None for a key that doesn't exist.
+        :raises Exception: The error of the load, if it failed and there is no
+            stale entry to use instead.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry.value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            self._load(key, load, flight)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def put(self, key: K, value: V, ttl: float | None = None) -> None:
+        """
+        Cache the value of a key, as the most recently used entry.
+
+        :param ttl: Seconds until the entry expires, instead of the default ttl.
+        """
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: K, value: V, ttl: float | None = None) -> bool:
+        """
+        Cache the value of a key unless it is cached already, as the least recently
+        used entry, e.g. to restore entries saved by another process.
+
+        :param ttl: Seconds until the entry expires, instead of the default ttl.
+        :return: Whether the entry was added.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > self._clock():
+                return False
+            return self._store(key, value, ttl, recent=False)
+
+    def __contains__(self, key: K) -> bool:
+        """Return whether the key is cached, without counting it as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.expires_at > self._clock()
+
+    def items(self) -> list[tuple[K, V, float]]:
+        """Return the unexpired entries as ``(key, value, seconds left)``."""
+        now = self._clock()
+        with self._lock:
+            return [
+                (key, entry.value, entry.expires_at - now)
+                for key, entry in self._entries.items()
+                if entry.expires_at > now
+            ]
+
+    def clear(self) -> None:
+        """Drop all cached entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._reset_stats()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Return the hit rate, eviction and load latency statistics of the cache, as
+        a JSON-serializable dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+                "hit_rate": (
+                    (self.hits + self.negative_hits) / lookups if lookups else 0.0
+                ),
+                "loads": self.loads,
+                "load_errors": self.load_errors,
+                "load_time_avg_ms": (
+                    self.load_time_total / self.loads * 1000 if self.loads else 0.0
+                ),
+                "load_time_max_ms": self.load_time_max * 1000,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _lookup(self, key: K) -> _Entry | None:
+        # Called with the lock held; counts hits, and drops entries past max_stale
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = self._clock()
+        if entry.expires_at > now:
+            self._entries.move_to_end(key)
+            if entry.value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry
+        if entry.expires_at + self.max_stale <= now:
+            self._remove(key)
+            self.expirations += 1
+        return None
+
+    def _load(self, key: K, load: Callable[[K], V], flight: _Flight) -> None:
+        start = time.perf_counter()
+        try:
+            flight.value = load(key)
+        except BaseException as e:
+            flight.error = e
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.loads += 1
+            self.load_time_total += elapsed
+            self.load_time_max = max(self.load_time_max, elapsed)
+            if flight.error is not None:
+                self.load_errors += 1
+                stale = self._entries.get(key)
+                if stale is not None and self._clock() < (
+                    stale.expires_at + self.max_stale
+                ):
+                    self.stale_hits += 1
+                    flight.value = stale.value
+                    flight.error = None
+            else:
+                self._store(key, flight.value, None)
+            del self._flights[key]
+        flight.done.set()
+
+    def _store(self, key: K, value: V, ttl: float | None, recent: bool = True) -> bool:
+        # Called with the lock held
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0 or self.max_bytes == 0:
+            self._remove(key)
+            return False
+        size = self.sizeof(key, value) if self.max_bytes is not None else 0
+        self._remove(key)
+        self._entries[key] = _Entry(value, self._clock() + ttl, size)
+        self._entries.move_to_end(key, last=recent)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            evicted = self._entries.popitem(last=False)[1]
+            self._bytes -= evicted.size
+            self.evictions += 1
+        return key in self._entries
+
+    def _remove(self, key: K) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _reset_stats(self) -> None:
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.load_time_total = 0.0
+        self.load_time_max = 0.0
+        self.evictions = 0
+        self.expirations = 0
@@ -0,0 +1,181 @@
+"""Clients for the services the authorizer talks to, reused across invocations"""
+
+import threading
+from typing import TYPE_CHECKING
+
+from authorizer_lambda.config import Settings, config
+
+if TYPE_CHECKING:
+    import requests
+
+
+class Clients:
+    """
+    Registry of the boto3 Lambda, DynamoDB and Secrets Manager clients and the HTTP
+    session.
+
+    The clients are created lazily on first use and then reused for the lifetime of
+    the container, so their connection pools stay warm. boto3 and requests are only
+    imported when their client is first needed. Pre-built clients can be passed in
+    to point the authorizer at local stand-ins.
+    """
+
+    def __init__(
+        self,
+        settings: Settings = config,
+        lambda_client=None,
+        http=None,
+        dynamodb_client=None,
+        secretsmanager_client=None,
+    ):
+        self.settings = settings
+        self._lambda_client = lambda_client
+        self._dynamodb_client = dynamodb_client
+        self._secretsmanager_client = secretsmanager_client
+        self._http = http
+        self._lock = threading.Lock()
+
+    @property
+    def lambda_client(self):
+        """The boto3 Lambda client."""
+        if self._lambda_client is None:
+            with self._lock:
+                if self._lambda_client is None:
+                    self._lambda_client = self._create_lambda_client()
+        return self._lambda_client
+
+    @property
+    def dynamodb_client(self):
+        """The boto3 DynamoDB client."""
+        if self._dynamodb_client is None:
+            with self._lock:
+                if self._dynamodb_client is None:
+                    self._dynamodb_client = self._create_dynamodb_client()
+        return self._dynamodb_client
+
+    @property
+    def secretsmanager_client(self):
+        """The boto3 Secrets Manager client."""
+        if self._secretsmanager_client is None:
+            with self._lock:
+                if self._secretsmanager_client is None:
+                    self._secretsmanager_client = self._create_secretsmanager_client()
+        return self._secretsmanager_client
+
+    @property
+    def http(self) -> "requests.Session":
+        """The HTTP session."""
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    self._http = self._create_http_session()
+        return self._http
+
+    @property
+    def http_timeout(self) -> tuple[float, float]:
+        """The (connect, read) timeout for HTTP requests."""
+        return (self.settings.http_connect_timeout, self.settings.http_read_timeout)
+
+    def _create_lambda_client(self):
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        settings = self.settings
+        return boto3.client(
+            "lambda",
+            region_name=settings.aws_region,
+            config=BotoConfig(
+                connect_timeout=settings.lambda_connect_timeout,
+                read_timeout=settings.lambda_read_timeout,
+                max_pool_connections=settings.lambda_max_pool_connections,
+                retries={
+                    "max_attempts": settings.lambda_max_attempts,
+                    "mode": settings.lambda_retry_mode,
+                },
+            ),
+        )
+
+    def _create_dynamodb_client(self):
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        settings = self.settings
+        return boto3.client(
+            "dynamodb",
+            region_name=settings.aws_region,
+            endpoint_url=settings.dynamodb_endpoint_url,
+            config=BotoConfig(
+                connect_timeout=settings.dynamodb_connect_timeout,
+                read_timeout=settings.dynamodb_read_timeout,
+                max_pool_connections=settings.dynamodb_max_pool_connections,
+                retries={
+                    "max_attempts": settings.dynamodb_max_attempts,
+                    "mode": settings.dynamodb_retry_mode,
+                },
+            ),
+        )
+
+    def _create_secretsmanager_client(self):
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        settings = self.settings
+        return boto3.client(
+            "secretsmanager",
+            region_name=settings.aws_region,
+            config=BotoConfig(
+                connect_timeout=settings.secretsmanager_connect_timeout,
+                read_timeout=settings.secretsmanager_read_timeout,
+                retries={
+                    "max_attempts": settings.secretsmanager_max_attempts,
+                    "mode": settings.secretsmanager_retry_mode,
+                },
+            ),
+        )
+
+    def _create_http_session(self) -> "requests.Session":
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        settings = self.settings
+        adapter = HTTPAdapter(
+            pool_connections=settings.http_pool_size,
+            pool_maxsize=settings.http_pool_size,
+            max_retries=Retry(
+                total=settings.http_max_retries,
+                backoff_factor=settings.http_retry_backoff,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                raise_on_status=False,
+            ),
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+
+_clients: Clients | None = None
+_clients_lock = threading.Lock()
+
+
+def get_clients() -> Clients:
+    """Return the process-wide client registry, creating it if needed."""
+    global _clients
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                _clients = Clients()
+    return _clients
+
+
+def set_clients(clients: Clients | None) -> None:
+    """
+    Replace the process-wide client registry.
+
+    :param clients: The new registry, or None to create a default one on next use.
+    """
+    global _clients
+    with _clients_lock:
+        _clients = clients
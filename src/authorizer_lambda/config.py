@@ -1,4 +1,21 @@
-from pydantic import BaseSettings
+from pydantic import BaseModel, BaseSettings
+
+
+class CognitoPool(BaseModel):
+    """A Cognito User Pool whose tokens are accepted."""
+
+    class Config:
+        frozen = True
+
+    user_pool_id: str
+    region: str = "us-east-1"
+    # App client ids accepted in the aud claim of ID tokens or the client_id claim of
+    # access tokens. Empty only accepts an aud of the user pool id, if there is one.
+    audience: tuple[str, ...] = ()
+    # Overrides of the JWKS URL and of the JWKS cache settings below
+    jwks_url: str | None = None
+    jwks_cache_ttl: int | None = None
+    jwks_refresh_min_interval: int | None = None
 
 
 class Settings(BaseSettings):
@@ -8,10 +25,179 @@ class Settings(BaseSettings):
         env_file = ".env"
 
     cognito_user_pool_id: str = "some_user_pool_id"
+    cognito_region: str = "us-east-1"
+    # User pools whose tokens are accepted, as a JSON list of CognitoPool objects,
+    # e.g. [{"user_pool_id": "eu-west-1_abc", "region": "eu-west-1"}]. Tokens are
+    # routed to their pool by their iss claim. Empty accepts cognito_user_pool_id in
+    # cognito_region.
+    cognito_pools: list[CognitoPool] = []
     dev_jwt_secret: str = "some_secret"
     backend_lambda_arn = (
         "arn:aws:lambda:us-east-1:11111111111:function:some-backend-lambda-dev"
     )
 
+    # Secrets dev tokens are signed with, selected by the kid header of the token.
+    # "env" uses dev_jwt_secrets, a JSON object of {"<kid>": "<secret>"}, plus
+    # dev_jwt_secret for dev_jwt_default_kid; "file" reads such an object from
+    # dev_jwt_secrets_file and "secretsmanager" from the SecretString of the
+    # dev_jwt_secret_id secret. Tokens without a kid use dev_jwt_default_kid. The
+    # secrets are reloaded in the background every dev_jwt_secrets_ttl seconds.
+    dev_jwt_secret_source: str = "env"
+    dev_jwt_secrets: dict[str, str] = {}
+    dev_jwt_secrets_file: str | None = None
+    dev_jwt_secret_id: str | None = None
+    dev_jwt_secrets_ttl: float = 300
+    dev_jwt_default_kid: str = "default"
+
+    # Where REQUEST authorizers look for the token, in this order. Configure the same
+    # identity sources in API Gateway, so it can cache the authorizer result.
+    token_header: str = "Authorization"
+    token_query_parameter: str = "token"
+    token_cookie: str = "token"
+    # Path below the stage that a REQUEST authorizer allows for the owner, so one
+    # cached result covers every route of the owner.
+    owner_resource_path: str = "api/{owner_uuid}/*"
+
+    # Tokens are rejected before any network or crypto work if they are longer
+    # than token_max_length, malformed, from an unknown issuer, signed with an
+    # unexpected algorithm, expired or not valid yet (with token_clock_skew seconds
+    # of tolerance), or have a kid the JWKS doesn't contain. They are answered with
+    # 401 Unauthorized, or with a Deny policy if reject_response is "deny".
+    token_max_length: int = 8192
+    token_clock_skew: float = 0
+    reject_response: str = "unauthorized"
+    # Snapshot of revoked tokens, built with python -m authorizer_lambda.revocation.
+    # Every token, including cached ones, is checked against it in memory, and a
+    # replaced file is picked up within revocation_check_interval seconds. None
+    # disables the check.
+    revocation_snapshot: str | None = None
+    revocation_check_interval: float = 10
+    # Library checking token signatures: "cryptography" uses it directly, and the
+    # standard library for HS256, while "pyjwt" and "jose" go through PyJWT or
+    # python-jose. Claims are validated the same way whichever is used. Compare them
+    # with python -m tests.benchmarks.verifiers.
+    token_verifier: str = "cryptography"
+
+    # Backend looking up the owner_uuid of a cognito id: "lambda" invokes
+    # backend_lambda_arn, "dynamodb" reads owner_table_name directly and "static"
+    # serves the JSON map in owner_map_file.
+    owner_resolver: str = "lambda"
+    owner_table_name: str = "owners"
+    owner_table_key: str = "cognito_id"
+    owner_table_attribute: str = "owner_uuid"
+    owner_map_file: str | None = None
+
+    # Start the owner lookup with the unverified sub of a Cognito token while its
+    # signature is verified, and wait at most speculative_owner_lookup_timeout
+    # seconds for it afterwards. The result is only used, and cached, once the
+    # token is verified. Note that forged tokens then cause owner lookups as well.
+    speculative_owner_lookup: bool = False
+    speculative_owner_lookup_timeout: float = 5
+
+    # Claim of Cognito tokens holding the owner_uuid, e.g. "custom:owner_uuid" set by
+    # a pre token generation trigger. Tokens without it fall back to the owner
+    # lookup. Only use a claim users can't write themselves. None disables it.
+    owner_claim: str | None = None
+
+    # JWKS cache: keys are fresh for jwks_cache_ttl seconds, then served stale for
+    # up to jwks_stale_ttl more seconds while they are refreshed in the background.
+    jwks_cache_ttl: int = 3600
+    jwks_stale_ttl: int = 86400
+    # Minimum number of seconds between forced refreshes for unknown kids.
+    jwks_refresh_min_interval: int = 60
+    # When refreshing fails, keep using the keys for this many seconds after the
+    # stale window.
+    jwks_max_stale: int = 86400
+
+    # Verified token cache: at most token_cache_max_entries tokens, each kept until
+    # its exp claim or for token_cache_max_ttl seconds, whichever comes first. If
+    # token_cache_max_bytes is set, the cached claims are also kept below about that
+    # many bytes.
+    token_cache_max_entries: int = 1024
+    token_cache_max_ttl: int = 300
+    token_cache_max_bytes: int | None = None
+
+    # Owner lookup cache: found owners are cached for owner_cache_ttl seconds,
+    # cognito ids without an owner for owner_negative_cache_ttl seconds.
+    owner_cache_ttl: int = 300
+    owner_negative_cache_ttl: int = 30
+    owner_cache_max_entries: int = 10000
+    # When the owner lookup fails, keep using an expired mapping for this many
+    # seconds.
+    owner_cache_max_stale: int = 3600
+
+    # Directory, e.g. /tmp/authorizer-cache, where the JWKS and the owner mappings
+    # are also kept, so a restarted process doesn't start with empty caches. The
+    # owner mappings are written at most every disk_cache_write_interval seconds.
+    # None disables the disk cache.
+    disk_cache_dir: str | None = None
+    disk_cache_write_interval: float = 10
+
+    # Deadlines, in seconds, for fetching the JWKS and looking up an owner,
+    # including retries.
+    jwks_deadline: float = 5
+    owner_lookup_deadline: float = 5
+    # Calls with a deadline run on a worker pool per dependency, so a hanging
+    # dependency only uses up its own workers. Background work, such as writing the
+    # disk cache, has a pool of its own too.
+    jwks_workers: int = 2
+    owner_lookup_workers: int = 8
+    background_workers: int = 2
+    # Circuit breakers stop calling a dependency after this many consecutive
+    # failures, and let a trial call through after breaker_reset_timeout seconds.
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30
+
+    # AWS region for the boto3 clients. None uses the region of the environment.
+    aws_region: str | None = None
+    # boto3 Lambda client used to look up owners
+    lambda_connect_timeout: float = 2
+    lambda_read_timeout: float = 5
+    lambda_max_pool_connections: int = 10
+    lambda_max_attempts: int = 2
+    lambda_retry_mode: str = "standard"
+    # boto3 DynamoDB client used by the dynamodb owner resolver. The endpoint can
+    # point at a local DynamoDB.
+    dynamodb_endpoint_url: str | None = None
+    dynamodb_connect_timeout: float = 1
+    dynamodb_read_timeout: float = 2
+    dynamodb_max_pool_connections: int = 10
+    dynamodb_max_attempts: int = 2
+    dynamodb_retry_mode: str = "standard"
+    # boto3 Secrets Manager client used to load the dev secrets
+    secretsmanager_connect_timeout: float = 1
+    secretsmanager_read_timeout: float = 2
+    secretsmanager_max_attempts: int = 2
+    secretsmanager_retry_mode: str = "standard"
+    # HTTP session used to fetch the JWKS
+    http_connect_timeout: float = 2
+    http_read_timeout: float = 3
+    http_pool_size: int = 10
+    http_max_retries: int = 2
+    http_retry_backoff: float = 0.1
+
+    # HTTP server mode (python -m authorizer_lambda.server): requests are handled
+    # on server_workers threads, while idle keep-alive connections are watched by a
+    # single thread and closed after server_keepalive_timeout seconds. Owners get
+    # access to owner_resource_path below server_path_prefix. Behind a proxy
+    # sending auth subrequests, set server_original_path_header to the header in
+    # which the proxy passes the path of the original request, e.g. X-Original-URI;
+    # the proxy must overwrite the header, since clients can send it too.
+    server_host: str = "127.0.0.1"
+    server_port: int = 8080
+    server_workers: int = 16
+    server_keepalive_timeout: float = 30
+    server_path_prefix: str = ""
+    server_original_path_header: str | None = None
+
+    # Create the clients, import the crypto libraries and fetch the JWKS while the
+    # Lambda is initialised, instead of on the first Cognito token.
+    prewarm_on_init: bool = False
+
+    # Emit stage durations and cache hits of every invocation to stdout, in
+    # CloudWatch Embedded Metric Format.
+    metrics_enabled: bool = True
+    metrics_namespace: str = "AuthorizerLambda"
+
 
 config = Settings()
@@ -0,0 +1,221 @@
+"""Secrets dev tokens are signed with, indexed by kid"""
+import abc
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from authorizer_lambda.clients import get_clients
+from authorizer_lambda.config import Settings, config
+from authorizer_lambda.verifiers import get_token_verifier
+
+logger = logging.getLogger(__name__)
+
+
+class SecretSource(abc.ABC):
+    """Loads the secrets of the dev keyring from a backend."""
+
+    @abc.abstractmethod
+    def load(self) -> dict[str, str]:
+        """
+        Load the active secrets.
+
+        :return: The secrets, indexed by kid.
+        """
+
+
+class SettingsSecretSource(SecretSource):
+    """
+    Serves ``dev_jwt_secrets`` from the settings, which are read from the
+    environment, and ``dev_jwt_secret`` as the secret of ``dev_jwt_default_kid``.
+    """
+
+    def __init__(self, settings: Settings = config):
+        self.settings = settings
+
+    def load(self) -> dict[str, str]:
+        settings = self.settings
+        return {settings.dev_jwt_default_kid: settings.dev_jwt_secret} | dict(
+            settings.dev_jwt_secrets
+        )
+
+
+class FileSecretSource(SecretSource):
+    """Reads a JSON file of ``{"<kid>": "<secret>"}``."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict[str, str]:
+        with open(self.path, "rt") as file:
+            return json.load(file)
+
+
+class SecretsManagerSecretSource(SecretSource):
+    """
+    Reads an AWS Secrets Manager secret whose SecretString is a JSON object of
+    ``{"<kid>": "<secret>"}``.
+    """
+
+    def __init__(self, secret_id: str):
+        self.secret_id = secret_id
+
+    def load(self) -> dict[str, str]:
+        response = get_clients().secretsmanager_client.get_secret_value(
+            SecretId=self.secret_id
+        )
+        return json.loads(response["SecretString"])
+
+
+class DevKeyring:
+    """
+    The secrets dev tokens may be signed with, indexed by the kid header of the
+    token, so a token is verified with a single HMAC whichever secret signed it.
+    The secrets are prepared once by the process-wide token verifier.
+
+    The secrets are loaded from the source on first use, and reloaded in the
+    background once they are ``ttl`` seconds old, so a rotated secret is picked up
+    without a redeploy and without blocking a request. If reloading fails, the
+    current secrets are kept. Tokens without a kid use the secret of
+    ``default_kid``.
+    """
+
+    def __init__(
+        self,
+        source: SecretSource,
+        ttl: float = 300,
+        default_kid: str = "default",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.source = source
+        self.ttl = ttl
+        self.default_kid = default_kid
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys: dict[str, Any] = {}
+        self._loaded_at: float | None = None
+        self._background_refresh: threading.Thread | None = None
+
+    def verify(self, kid: Any, signing_input: bytes, signature: bytes) -> bool:
+        """
+        Check the HS256 signature of a token with the secret of its kid.
+
+        :param kid: The kid header of the token, or None if it has none.
+        :param signing_input: The header and payload segments of the token.
+        :param signature: The decoded signature of the token.
+        :return: False if the signature doesn't match, or the keyring has no secret
+            for the kid.
+        """
+        if kid is None:
+            kid = self.default_kid
+        elif not isinstance(kid, str):
+            return False
+        key = self._current().get(kid)
+        if key is None:
+            return False
+        return get_token_verifier().verify_hs256(signing_input, key, signature)
+
+    def kids(self) -> set[str]:
+        """Return the kids of the loaded secrets."""
+        return set(self._current())
+
+    def refresh(self) -> None:
+        """
+        Reload the secrets from the source.
+
+        :raises ValueError: If the source doesn't return a JSON object of strings,
+            or the token verifier refuses a secret.
+        """
+        secrets = self.source.load()
+        if not isinstance(secrets, dict) or not all(
+            isinstance(kid, str) and isinstance(secret, str)
+            for kid, secret in secrets.items()
+        ):
+            raise ValueError("Dev secrets must be a JSON object of strings")
+        verifier = get_token_verifier()
+        self._keys = {
+            kid: verifier.hmac_key(secret.encode("utf-8"))
+            for kid, secret in secrets.items()
+        }
+        self._loaded_at = self._clock()
+
+    def _current(self) -> dict[str, Any]:
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.refresh()
+        elif self._clock() - self._loaded_at >= self.ttl:
+            self._refresh_in_background()
+        return self._keys
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if (
+                self._background_refresh is not None
+                and self._background_refresh.is_alive()
+            ):
+                return
+            self._background_refresh = threading.Thread(
+                target=self._refresh_quietly, daemon=True
+            )
+            self._background_refresh.start()
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("Background dev secrets refresh failed: %s", e)
+            # Keep the current secrets, and retry after another ttl
+            self._loaded_at = self._clock()
+
+
+def create_secret_source(settings: Settings = config) -> SecretSource:
+    """
+    Create the secret source selected by ``settings.dev_jwt_secret_source``.
+
+    :raises ValueError: If the source is unknown, or its setting is missing.
+    """
+    if settings.dev_jwt_secret_source == "env":
+        return SettingsSecretSource(settings)
+    if settings.dev_jwt_secret_source == "file":
+        if settings.dev_jwt_secrets_file is None:
+            raise ValueError("dev_jwt_secrets_file is required for the file source")
+        return FileSecretSource(settings.dev_jwt_secrets_file)
+    if settings.dev_jwt_secret_source == "secretsmanager":
+        if settings.dev_jwt_secret_id is None:
+            raise ValueError(
+                "dev_jwt_secret_id is required for the secretsmanager source"
+            )
+        return SecretsManagerSecretSource(settings.dev_jwt_secret_id)
+    raise ValueError(f"Unknown dev secret source: {settings.dev_jwt_secret_source}")
+
+
+_dev_keyring: DevKeyring | None = None
+_dev_keyring_lock = threading.Lock()
+
+
+def get_dev_keyring() -> DevKeyring:
+    """Return the process-wide dev keyring, creating it if needed."""
+    global _dev_keyring
+    if _dev_keyring is None:
+        with _dev_keyring_lock:
+            if _dev_keyring is None:
+                _dev_keyring = DevKeyring(
+                    create_secret_source(config),
+                    ttl=config.dev_jwt_secrets_ttl,
+                    default_kid=config.dev_jwt_default_kid,
+                )
+    return _dev_keyring
+
+
+def set_dev_keyring(keyring: DevKeyring | None) -> None:
+    """
+    Replace the process-wide dev keyring.
+
+    :param keyring: The new keyring, or None to create one from the settings on
+        next use.
+    """
+    global _dev_keyring
+    with _dev_keyring_lock:
+        _dev_keyring = keyring
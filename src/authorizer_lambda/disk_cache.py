@@ -0,0 +1,99 @@
+"""Second-level cache on local disk, which survives restarts of the process"""
+import json
+import logging
+import os
+import stat
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from authorizer_lambda.config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    Directory of JSON documents, each stored with the time it was written.
+
+    Warm Lambda containers keep ``/tmp`` across restarts of the runtime, so the
+    in-memory caches can be seeded from it instead of starting empty. Documents are
+    written to a temporary file and renamed into place, so readers never see a
+    partial write. The directory is created only accessible by the process, and
+    isn't used if other users could write to it, since they could plant documents,
+    e.g. a JWKS with their own keys. Errors are logged and otherwise ignored: the
+    disk cache is only an optimisation.
+    """
+
+    def __init__(self, directory: str | Path, clock: Callable[[], float] = time.time):
+        self.directory = Path(directory)
+        self._clock = clock
+
+    def read(self, name: str) -> tuple[Any, float] | None:
+        """
+        Read a document.
+
+        :param name: The name of the document.
+        :return: A tuple of the document and its age in seconds, or None if it
+            doesn't exist or can't be read.
+        """
+        try:
+            self._check_directory()
+            with open(self.directory / f"{name}.json", "rb") as file:
+                stored = json.load(file)
+            return stored["value"], max(0.0, self._clock() - stored["saved_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring unreadable disk cache %s: %s", name, e)
+            return None
+
+    def write(self, name: str, value: Any) -> None:
+        """
+        Atomically replace a document.
+
+        :param name: The name of the document.
+        :param value: The JSON serialisable document.
+        """
+        try:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            self._check_directory()
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(
+                        {"saved_at": self._clock(), "value": value},
+                        file,
+                        separators=(",", ":"),
+                    )
+                os.replace(temporary, self.directory / f"{name}.json")
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Writing disk cache %s failed: %s", name, e)
+
+    def _check_directory(self) -> None:
+        """
+        :raises FileNotFoundError: If the directory doesn't exist.
+        :raises PermissionError: If the directory isn't owned by the process, or
+            other users can write to it.
+        """
+        status = os.lstat(self.directory)
+        if (
+            not stat.S_ISDIR(status.st_mode)
+            or status.st_uid != os.getuid()
+            or status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+        ):
+            raise PermissionError(
+                f"{self.directory} isn't a directory owned by the process and only"
+                " writable by it"
+            )
+
+
+def disk_cache_from_settings(settings: Settings) -> DiskCache | None:
+    """Return the disk cache configured in the settings, or None if it's disabled."""
+    if settings.disk_cache_dir is None:
+        return None
+    return DiskCache(settings.disk_cache_dir)
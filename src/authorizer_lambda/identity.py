@@ -0,0 +1,45 @@
+"""Extraction of the token from the identity sources of REQUEST authorizations"""
+from authorizer_lambda.config import Settings
+from authorizer_lambda.models import RequestAuthorizationRequest
+
+
+def extract_token(request: RequestAuthorizationRequest, settings: Settings):
+    """
+    Return the token of a REQUEST authorization request.
+
+    The token is looked up in the header, the query string parameter and the cookie
+    configured in the settings, in that order. A "Bearer " prefix is removed.
+
+    :param request: The authorization request.
+    :param settings: The settings naming the identity sources.
+    :return: The token, or None if none of the identity sources contains one.
+    """
+    headers = request.headers or {}
+    token = get_header(headers, settings.token_header)
+    if token:
+        scheme, _, credentials = token.partition(" ")
+        return credentials.strip() if scheme.lower() == "bearer" else token
+
+    token = (request.queryStringParameters or {}).get(settings.token_query_parameter)
+    if token:
+        return token
+
+    cookies = get_header(headers, "Cookie")
+    if cookies:
+        for cookie in cookies.split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == settings.token_cookie and value:
+                return value
+    return None
+
+
+def get_header(headers: dict[str, str], name: str) -> str | None:
+    """Return the value of a header, matching its name case-insensitively."""
+    value = headers.get(name)
+    if value is not None:
+        return value
+    name = name.lower()
+    for header, value in headers.items():
+        if header.lower() == name:
+            return value
+    return None
@@ -1,67 +1,411 @@
+import concurrent.futures
+import logging
+import sys
+import threading
+import time
 from typing import Any
 from authorizer_lambda.config import Settings, config
 from authorizer_lambda.models import (
-    OwnerResponse,
+    AuthorizationType,
+    RequestAuthorizationRequest,
     TokenAuthorizationRequest,
-    OwnerRequest,
 )
-from authorizer_lambda import util, verify_cognito_token
-import boto3
-import json
-from botocore.exceptions import BotoCoreError, ClientError
-from authorizer_lambda.policy import generate_policy
+from authorizer_lambda import metrics, util, verify_cognito_token
+from authorizer_lambda.clients import get_clients
+from authorizer_lambda.dev_keyring import get_dev_keyring
+from authorizer_lambda.disk_cache import disk_cache_from_settings
+from authorizer_lambda.identity import extract_token
+from authorizer_lambda.owner_cache import OwnerCache
+from authorizer_lambda.owner_resolvers import get_owner_resolver
+from authorizer_lambda.resilience import (
+    OWNER_LOOKUP,
+    CircuitBreaker,
+    call_with_deadline,
+    submit,
+    wait_with_deadline,
+)
+from authorizer_lambda.policy import (
+    build_policy_response,
+    deny_policy_response,
+    owner_resource,
+)
+from authorizer_lambda.precheck import (
+    TokenRejected,
+    check_not_revoked,
+    check_owner_uuid,
+    check_token_present,
+    precheck_token,
+)
+from authorizer_lambda.token_cache import TokenCache
+from authorizer_lambda.tokens import ParsedToken
 from pydantic import ValidationError
 
+verified_tokens = TokenCache(
+    max_entries=config.token_cache_max_entries,
+    max_ttl=config.token_cache_max_ttl,
+    max_bytes=config.token_cache_max_bytes,
+)
+owners = OwnerCache(
+    ttl=config.owner_cache_ttl,
+    negative_ttl=config.owner_negative_cache_ttl,
+    max_entries=config.owner_cache_max_entries,
+    max_stale=config.owner_cache_max_stale,
+)
+owner_breaker = CircuitBreaker(
+    "owner_lookup",
+    failure_threshold=config.breaker_failure_threshold,
+    reset_timeout=config.breaker_reset_timeout,
+)
+disk_cache = disk_cache_from_settings(config)
+_owners_saved_at = 0.0
+_owners_saved_at_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def cache_stats() -> dict[str, dict[str, Any]]:
+    """Return the statistics of the process-wide caches, which can be dumped as JSON."""
+    return {"verified_tokens": verified_tokens.stats(), "owners": owners.stats()}
+
 
-def get_owner_uuid(cognito_id: str, settings: Settings) -> str:
-    """Retrieve the owner_uuid from the lambda based on the cognito id and return it."""
-    lambda_client = boto3.client("lambda")
+def restore_owners() -> None:
+    """Seed the owner cache with the mappings in the disk cache, if any."""
+    if disk_cache is None:
+        return
+    stored = disk_cache.read("owners")
+    if stored is not None:
+        try:
+            owners.restore(stored[0], time.time())
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning("Ignoring malformed owner mappings on disk: %s", e)
 
-    request = OwnerRequest(cognito_id=cognito_id)
-    input_payload = json.dumps(request.dict()).encode("utf-8")
 
-    # get this from the lambda
-    result = lambda_client.invoke(
-        FunctionName=settings.backend_lambda_arn,
-        InvocationType="RequestResponse",
-        Payload=input_payload,
+def save_owners(settings: Settings) -> "concurrent.futures.Future[None] | None":
+    """
+    Write the owner cache to the disk cache on a worker thread, at most every
+    ``disk_cache_write_interval`` seconds.
+
+    :return: The write in progress, or None if nothing is written.
+    """
+    global _owners_saved_at
+    cache = disk_cache
+    if cache is None:
+        return None
+    with _owners_saved_at_lock:
+        now = time.time()
+        if now - _owners_saved_at < settings.disk_cache_write_interval:
+            return None
+        _owners_saved_at = now
+    return submit(lambda: cache.write("owners", owners.snapshot(time.time())))
+
+
+def get_owner_uuid(
+    cognito_id: str,
+    settings: Settings,
+    speculative: "concurrent.futures.Future[str | None] | None" = None,
+) -> str:
+    """
+    Retrieve the owner_uuid based on the cognito id and return it.
+
+    The owner is looked up with the configured owner resolver. Lookups are cached,
+    and concurrent lookups for the same cognito id result in a single call to the
+    backend. The call has a deadline and goes through a circuit breaker; if it
+    fails, a recently expired mapping is used instead.
+
+    :param speculative: A lookup of the cognito id started with
+        start_owner_lookup, to use instead of a new call to the backend.
+    :raises OwnerNotFoundError: If the backend doesn't know the cognito id.
+    """
+
+    loaded = False
+
+    def load(cognito_id: str) -> str | None:
+        nonlocal loaded
+        loaded = True
+        metrics.set_flag("OwnerCacheHit", False)
+        with metrics.stage("owner_invoke"):
+            if speculative is not None:
+                return wait_with_deadline(
+                    speculative,
+                    settings.speculative_owner_lookup_timeout,
+                    "speculative owner lookup",
+                )
+            return owner_breaker.call(
+                lambda: call_with_deadline(
+                    settings.owner_lookup_deadline,
+                    get_owner_resolver().resolve,
+                    cognito_id,
+                    executor=OWNER_LOOKUP,
+                )
+            )
+
+    metrics.set_flag("OwnerCacheHit", True)
+    try:
+        return owners.get_or_load(cognito_id, load)
+    finally:
+        if loaded:
+            save_owners(settings)
+
+
+def start_owner_lookup(
+    cognito_id: Any,
+) -> "concurrent.futures.Future[str | None] | None":
+    """
+    Start looking up the owner of a cognito id on a worker thread, without caching
+    the result, so it can run while the token is still being verified.
+
+    :param cognito_id: The unverified sub of the token.
+    :return: The lookup in progress, or None if the owner is already cached or the
+        sub isn't a string.
+    """
+    if not isinstance(cognito_id, str) or owners.is_cached(cognito_id):
+        return None
+    resolver = get_owner_resolver()
+    return submit(
+        owner_breaker.call,
+        lambda: resolver.resolve(cognito_id),
+        executor=OWNER_LOOKUP,
     )
 
-    result_payload = json.loads(result["Payload"].read().decode("utf-8"))
-    response: OwnerResponse = OwnerResponse(**result_payload)
-    return response.owner.owner_uuid
+
+def owner_from_claims(payload: dict[str, Any], settings: Settings) -> str | None:
+    """
+    Return the owner_uuid from the owner claim of a verified token, or None if the
+    claim isn't configured or the token doesn't have it.
+    """
+    if settings.owner_claim is None:
+        return None
+    owner_uuid = payload.get(settings.owner_claim)
+    if not isinstance(owner_uuid, str) or not owner_uuid:
+        return None
+    return owner_uuid
+
+
+def authorize(token: str, settings: Settings = config) -> str | None:
+    """
+    Verify the token and return the owner_uuid of its principal.
+
+    Verified tokens are cached, so a token that comes back isn't verified again;
+    it's only checked against the revocation snapshot.
+
+    :param token: The JWT token string.
+    :param settings: The settings of the checks, the user pools, the owner claim
+        and lookup, and the clock skew. The verified token cache, the dev keyring
+        and the worker pools are process-wide, and configured by ``config``.
+    :return: The owner_uuid, or None if a dev token doesn't contain one.
+    :raises TokenRejected: If the token fails one of the cheap checks, or its
+        owner_uuid can't be put in a policy.
+    :raises ValueError: If the token is invalid.
+    """
+    cached = verified_tokens.get(token)
+    metrics.set_flag("TokenCacheHit", cached is not None)
+    if cached is not None:
+        metrics.set_property("TokenType", cached.token_type)
+        # The token may have been revoked since it was cached
+        check_not_revoked(cached.claims, token)
+        return cached.owner_uuid
+
+    with metrics.stage("route"):
+        # Split and decode the token once for the cheap checks, routing and
+        # verification
+        parsed = precheck_token(token, settings)
+        dev_token = util.is_dev_token(parsed)
+    token_type = "dev" if dev_token else "cognito"
+    metrics.set_property("TokenType", token_type)
+    if dev_token:
+        # For development token
+        with metrics.stage("verify"):
+            payload = util.verify_dev_token(
+                parsed, get_dev_keyring(), leeway=settings.token_clock_skew
+            )
+        owner_uuid = payload.get("owner_uuid")
+    else:
+        # For Cognito token
+        speculative = None
+        if settings.speculative_owner_lookup and not owner_from_claims(
+            parsed.payload, settings
+        ):
+            speculative = start_owner_lookup(parsed.payload.get("sub"))
+            metrics.set_flag("OwnerLookupSpeculative", speculative is not None)
+        with metrics.stage("verify"):
+            try:
+                # Route the token to the user pool that issued it
+                pool = verify_cognito_token.get_cognito_pools(settings).route(
+                    parsed.issuer
+                )
+                if pool is None:
+                    raise ValueError("Invalid issuer")
+                payload = verify_cognito_token.verify_cognito_token(
+                    parsed, pool, leeway=settings.token_clock_skew
+                )
+            except BaseException:
+                # Never use the owner of a token that isn't valid
+                if speculative is not None:
+                    speculative.cancel()
+                raise
+        owner_uuid = owner_from_claims(payload, settings)
+        metrics.set_flag("OwnerFromClaim", owner_uuid is not None)
+        if owner_uuid is None:
+            with metrics.stage("owner_lookup"):
+                owner_uuid = get_owner_uuid(
+                    cognito_id=payload["sub"],
+                    settings=settings,
+                    speculative=speculative,
+                )
+    if owner_uuid is not None:
+        check_owner_uuid(owner_uuid)
+        verified_tokens.put(token, payload, owner_uuid, token_type)
+    return owner_uuid
 
 
 def handler(event, context) -> dict[str, Any]:
     """
     Handle the incoming authorization requests, verify the token and return the
-    policy for API Gateway
+    policy for API Gateway.
+
+    TOKEN requests get a policy for the requested route. REQUEST requests get a
+    policy for every route of the owner, so API Gateway can cache it for all calls
+    with the same identity sources.
+
+    Missing tokens, and tokens rejected by the cheap checks, get a Deny policy if
+    ``reject_response`` is "deny"; otherwise the handler fails with "Unauthorized",
+    which API Gateway answers with 401.
+
+    Warm-up events, such as the scheduled pings keeping provisioned concurrency
+    warm, prewarm the caches and return the duration of every step instead.
     """
+    if is_warmup_event(event):
+        return {"warmup": True, "timings": prewarm(config)}
+
+    metrics.start_invocation(config.metrics_enabled, config.metrics_namespace)
     try:
-        token_request = TokenAuthorizationRequest(**event)
-        if util.is_dev_token(token_request.authorizationToken):
-            # For development token
-            payload = util.verify_dev_token(
-                token_request.authorizationToken, config.dev_jwt_secret
-            )
-            owner_uuid = payload.get("owner_uuid")
-        else:
-            # For Cognito token
-            payload = verify_cognito_token.verify_cognito_token(
-                token_request.authorizationToken, config.cognito_user_pool_id
-            )
-            owner_uuid = get_owner_uuid(cognito_id=payload["sub"], settings=config)
+        with metrics.stage("parse"):
+            if event.get("type") == AuthorizationType.REQUEST:
+                request = RequestAuthorizationRequest(**event)
+                token = extract_token(request, config)
+            else:
+                request = TokenAuthorizationRequest(**event)
+                token = request.authorizationToken
+        owner_uuid = check_owner_uuid(authorize(check_token_present(token)))
 
         # Generating policy and returning it
-        policy = generate_policy(
-            owner_uuid, token_request.methodArn, owner_uuid, context
-        )
-        return policy.dict()
+        with metrics.stage("policy"):
+            resource = None
+            if isinstance(request, RequestAuthorizationRequest):
+                resource = owner_resource(
+                    request.methodArn, owner_uuid, config.owner_resource_path
+                )
+            return build_policy_response(
+                owner_uuid, request.methodArn, owner_uuid, context, resource
+            )
     except ValidationError as e:
+        metrics.set_property("Error", type(e).__name__)
         return {"message": f"Validation error: {str(e)}", "statusCode": 400}
-    except BotoCoreError as e:
-        return {"message": f"AWS SDK error: {str(e)}", "statusCode": 500}
-    except ClientError as e:
-        return {"message": f"AWS client error: {str(e)}", "statusCode": 500}
+    except TokenRejected as e:
+        metrics.set_property("Error", type(e).__name__)
+        if config.reject_response == "deny":
+            return deny_policy_response(request.methodArn)
+        raise Exception("Unauthorized") from e
     except Exception as e:
-        return {"message": f"An unexpected error occurred: {str(e)}", "statusCode": 500}
+        metrics.set_property("Error", type(e).__name__)
+        return error_response(e)
+    finally:
+        metrics.end_invocation()
+
+
+def error_response(e: Exception) -> dict[str, Any]:
+    """Return the response for an error that occurred while handling a request."""
+    # botocore is only imported together with the Lambda client, so if it isn't
+    # loaded, the error can't be an AWS error.
+    botocore_exceptions = sys.modules.get("botocore.exceptions")
+    if botocore_exceptions is not None:
+        if isinstance(e, botocore_exceptions.BotoCoreError):
+            return {"message": f"AWS SDK error: {str(e)}", "statusCode": 500}
+        if isinstance(e, botocore_exceptions.ClientError):
+            return {"message": f"AWS client error: {str(e)}", "statusCode": 500}
+    return {"message": f"An unexpected error occurred: {str(e)}", "statusCode": 500}
+
+
+def is_warmup_event(event: Any) -> bool:
+    """
+    Check whether an event is a warm-up ping rather than an authorization request:
+    ``{"warmup": true}``, an event of serverless-plugin-warmup, or an EventBridge
+    scheduled event.
+    """
+    if not isinstance(event, dict):
+        return False
+    return (
+        event.get("warmup") is True
+        or event.get("source") == "serverless-plugin-warmup"
+        or (
+            event.get("source") == "aws.events"
+            and event.get("detail-type") == "Scheduled Event"
+        )
+    )
+
+
+def prewarm(settings: Settings = config) -> dict[str, float]:
+    """
+    Load everything the token paths need, so the first request doesn't have to:
+    the dev secrets, the client of the owner resolver, the HTTP session, the crypto
+    libraries and the JWKS of every user pool. Then verify a dummy token of each
+    type, which runs the verification code once without caching anything.
+
+    A step that fails is logged and skipped; the request path will retry it.
+
+    :param settings: The settings to prewarm for.
+    :return: The duration of each step that succeeded, in milliseconds.
+    """
+    clients = get_clients()
+    steps = {
+        "dev_keyring": lambda: get_dev_keyring().kids(),
+        "owner_resolver": lambda: get_owner_resolver().prewarm(),
+        "http_session": lambda: clients.http,
+        "crypto": verify_cognito_token.load_crypto,
+        "jwks": lambda: verify_cognito_token.refresh_jwks_caches(settings),
+        "verify_dev": _verify_dummy_dev_token,
+        "verify_cognito": lambda: _verify_dummy_cognito_tokens(settings),
+    }
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Prewarming %s failed: %s", name, e)
+            continue
+        timings[name] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def _dummy_token(header: dict[str, Any], payload: dict[str, Any]) -> ParsedToken:
+    """A token with a bogus signature, which fails verification."""
+    return ParsedToken("warmup", header, payload, b"warmup", b"warmup")
+
+
+def _verify_dummy_dev_token() -> None:
+    token = _dummy_token({"alg": "HS256"}, {"iss": util.DEV_ISSUER})
+    try:
+        util.verify_dev_token(token, get_dev_keyring())
+    except ValueError:
+        pass
+
+
+def _verify_dummy_cognito_tokens(settings: Settings) -> None:
+    for pool in verify_cognito_token.get_cognito_pools(settings):
+        kids = verify_cognito_token.get_pool_jwks_cache(pool).kids()
+        if not kids:
+            raise ValueError(f"No RS256 keys for {pool.user_pool_id}")
+        token = _dummy_token({"alg": "RS256", "kid": kids[0]}, {})
+        try:
+            verify_cognito_token.verify_cognito_token(token, pool)
+        except ValueError:
+            pass
+
+
+# Reading the disk cache is cheap, so it's always done during init
+restore_owners()
+
+if config.prewarm_on_init:
+    # Runs during the Lambda init phase, which isn't billed against the request
+    prewarm(config)
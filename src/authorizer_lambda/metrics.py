@@ -0,0 +1,133 @@
+"""Per-invocation latency metrics, emitted in CloudWatch Embedded Metric Format"""
+import contextvars
+import json
+import sys
+import time
+from typing import Any, TextIO
+
+_current: contextvars.ContextVar["InvocationMetrics | None"] = contextvars.ContextVar(
+    "authorizer_metrics", default=None
+)
+
+
+class _Stage:
+    """Context manager adding the time spent in it to a stage of the invocation."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "InvocationMetrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        stages = self.metrics.stages
+        stages[self.name] = stages.get(self.name, 0.0) + elapsed
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+class InvocationMetrics:
+    """
+    Stage durations, cache hit flags and properties of a single invocation.
+
+    Stages can be nested, e.g. ``jwks_fetch`` is part of ``verify``; each stage
+    reports its own total duration in milliseconds.
+    """
+
+    def __init__(self, namespace: str = "AuthorizerLambda"):
+        self.namespace = namespace
+        self.stages: dict[str, float] = {}
+        self.flags: dict[str, bool] = {}
+        self.properties: dict[str, str] = {}
+        self._start = time.perf_counter()
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def to_emf(self) -> dict[str, Any]:
+        """Return the metrics as a CloudWatch Embedded Metric Format document."""
+        total = (time.perf_counter() - self._start) * 1000
+        metrics = [{"Name": "total", "Unit": "Milliseconds"}]
+        metrics += [{"Name": name, "Unit": "Milliseconds"} for name in self.stages]
+        metrics += [{"Name": name, "Unit": "Count"} for name in self.flags]
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["TokenType"]],
+                        "Metrics": metrics,
+                    }
+                ],
+            },
+            "TokenType": "unknown",
+            **self.properties,
+            "total": round(total, 3),
+            **{name: round(value, 3) for name, value in self.stages.items()},
+            **{name: int(value) for name, value in self.flags.items()},
+        }
+
+    def emit(self, stream: TextIO | None = None) -> None:
+        """Write the metrics as a single EMF JSON line, to stdout by default."""
+        stream = stream if stream is not None else sys.stdout
+        stream.write(json.dumps(self.to_emf(), separators=(",", ":")) + "\n")
+
+
+def start_invocation(
+    enabled: bool = True, namespace: str = "AuthorizerLambda"
+) -> InvocationMetrics | None:
+    """
+    Start collecting metrics for the current invocation.
+
+    :param enabled: Whether metrics are collected at all.
+    :param namespace: The CloudWatch namespace of the metrics.
+    :return: The metrics of the invocation, or None if metrics are disabled.
+    """
+    metrics = InvocationMetrics(namespace) if enabled else None
+    _current.set(metrics)
+    return metrics
+
+
+def end_invocation() -> None:
+    """Emit the metrics of the current invocation, if any, and stop collecting."""
+    metrics = _current.get()
+    _current.set(None)
+    if metrics is not None:
+        metrics.emit()
+
+
+def stage(name: str) -> _Stage | _NoStage:
+    """Time a stage of the current invocation; a no-op if metrics are disabled."""
+    metrics = _current.get()
+    return metrics.stage(name) if metrics is not None else _no_stage
+
+
+def set_flag(name: str, value: bool) -> None:
+    """Set a flag, such as a cache hit, of the current invocation."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.flags[name] = value
+
+
+def set_property(name: str, value: str) -> None:
+    """Set a property, such as the token type, of the current invocation."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.properties[name] = value
@@ -52,6 +52,15 @@ class TokenAuthorizationRequest(ModelConfig):
     authorizationToken: str
 
 
+class RequestAuthorizationRequest(ModelConfig):
+    """REQUEST type authorization request, with the token in its identity sources"""
+
+    type: Literal[AuthorizationType.REQUEST]
+    methodArn: str
+    headers: dict[str, str] | None = None
+    queryStringParameters: dict[str, str] | None = None
+
+
 class PolicyStatement(ModelConfig):
     Action: str = "execute-api:Invoke"
     Effect: StatementEffect
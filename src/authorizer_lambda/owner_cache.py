@@ -0,0 +1,93 @@
+"""Cache of owner lookups by cognito id"""
+
+import time
+from typing import Any, Callable
+
+from authorizer_lambda.cache import Cache
+
+
+class OwnerNotFoundError(LookupError):
+    """There is no owner for the cognito id."""
+
+
+class OwnerCache:
+    """
+    TTL cache of ``cognito_id -> owner_uuid`` lookups.
+
+    Found owners are cached for ``ttl`` seconds, unknown cognito ids for
+    ``negative_ttl`` seconds. Concurrent misses for the same cognito id are
+    coalesced into a single load, which the other callers wait for. Failed loads
+    aren't cached; instead an expired entry is used for up to ``max_stale`` seconds
+    after it expired. At most ``max_entries`` entries are kept.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        max_entries: int = 10000,
+        max_stale: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._cache: Cache[str, str | None] = Cache(
+            ttl=ttl,
+            negative_ttl=negative_ttl,
+            max_entries=max_entries,
+            max_stale=max_stale,
+            clock=clock,
+        )
+
+    def get_or_load(self, cognito_id: str, load: Callable[[str], str | None]) -> str:
+        """
+        Return the owner_uuid for the cognito id, loading it if it isn't cached.
+
+        :param cognito_id: The cognito id (the sub of the token).
+        :param load: Function returning the owner_uuid for a cognito id, or None if
+            there is no owner for it.
+        :return: The owner_uuid.
+        :raises OwnerNotFoundError: If there is no owner for the cognito id.
+        """
+        owner_uuid = self._cache.get_or_load(cognito_id, load)
+        if owner_uuid is None:
+            raise OwnerNotFoundError(cognito_id)
+        return owner_uuid
+
+    def is_cached(self, cognito_id: str) -> bool:
+        """Return whether a lookup of the cognito id would be served from the cache."""
+        return cognito_id in self._cache
+
+    def snapshot(self, now: float) -> dict[str, list]:
+        """
+        Return the unexpired entries as ``{cognito_id: [owner_uuid, expires]}``, for
+        the disk cache.
+
+        :param now: The current wall clock time; ``expires`` is relative to it, so
+            the snapshot can be restored by another process.
+        """
+        return {
+            cognito_id: [owner_uuid, now + ttl]
+            for cognito_id, owner_uuid, ttl in self._cache.items()
+        }
+
+    def restore(self, snapshot: dict[str, list], now: float) -> None:
+        """
+        Add the unexpired entries of a snapshot that aren't cached yet.
+
+        :param snapshot: A snapshot returned by snapshot().
+        :param now: The current wall clock time.
+        """
+        for cognito_id, (owner_uuid, expires) in snapshot.items():
+            if expires > now:
+                self._cache.add(cognito_id, owner_uuid, expires - now)
+
+    def clear(self) -> None:
+        """Drop all cached entries and reset the statistics."""
+        self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Return the hit rate and load latency statistics of the cache."""
+        return self._cache.stats()
@@ -0,0 +1,166 @@
+"""Backends looking up the owner_uuid of a cognito id"""
+import abc
+import json
+import threading
+
+from authorizer_lambda.clients import get_clients
+from authorizer_lambda.config import Settings, config
+from authorizer_lambda.models import OwnerRequest, OwnerResponse
+
+
+class OwnerLookupError(RuntimeError):
+    """The backend failed to look up the owner, as opposed to not knowing it."""
+
+
+class OwnerResolver(abc.ABC):
+    """Looks up the owner_uuid of a cognito id in a backend."""
+
+    @abc.abstractmethod
+    def resolve(self, cognito_id: str) -> str | None:
+        """
+        Look up the owner_uuid of a cognito id.
+
+        :param cognito_id: The sub of the Cognito token.
+        :return: The owner_uuid, or None if the backend doesn't know the cognito id.
+        """
+
+    def prewarm(self) -> None:
+        """Create the client of the backend, so the first lookup doesn't have to."""
+
+
+class LambdaOwnerResolver(OwnerResolver):
+    """Invokes the backend lambda with an OwnerRequest."""
+
+    def __init__(self, settings: Settings = config):
+        self.settings = settings
+
+    def resolve(self, cognito_id: str) -> str | None:
+        request = OwnerRequest(cognito_id=cognito_id)
+        input_payload = json.dumps(request.dict()).encode("utf-8")
+
+        result = get_clients().lambda_client.invoke(
+            FunctionName=self.settings.backend_lambda_arn,
+            InvocationType="RequestResponse",
+            Payload=input_payload,
+        )
+
+        result_payload = json.loads(result["Payload"].read().decode("utf-8"))
+        if result.get("FunctionError"):
+            message = (
+                result_payload.get("errorMessage")
+                if isinstance(result_payload, dict)
+                else result_payload
+            )
+            raise OwnerLookupError(
+                f"Owner lambda failed with {result['FunctionError']}: {message}"
+            )
+        if not isinstance(result_payload, dict) or "owner" not in result_payload:
+            raise OwnerLookupError(
+                f"Unexpected owner lambda response: {result_payload}"
+            )
+        # Only an explicit {"owner": null} means the owner doesn't exist
+        if result_payload["owner"] is None:
+            return None
+        response: OwnerResponse = OwnerResponse(**result_payload)
+        return response.owner.owner_uuid
+
+    def prewarm(self) -> None:
+        get_clients().lambda_client
+
+
+class DynamoDBOwnerResolver(OwnerResolver):
+    """
+    Reads the owner_uuid straight from a DynamoDB table with GetItem, keyed by
+    cognito id, without a lambda in between.
+    """
+
+    def __init__(self, settings: Settings = config):
+        self.settings = settings
+
+    def resolve(self, cognito_id: str) -> str | None:
+        settings = self.settings
+        response = get_clients().dynamodb_client.get_item(
+            TableName=settings.owner_table_name,
+            Key={settings.owner_table_key: {"S": cognito_id}},
+            ProjectionExpression="#owner",
+            ExpressionAttributeNames={"#owner": settings.owner_table_attribute},
+        )
+        owner_uuid = response.get("Item", {}).get(settings.owner_table_attribute)
+        if owner_uuid is None:
+            return None
+        return owner_uuid["S"]
+
+    def prewarm(self) -> None:
+        get_clients().dynamodb_client
+
+
+class StaticOwnerResolver(OwnerResolver):
+    """
+    Serves owners from a fixed mapping, loaded from a JSON file of
+    ``{"<cognito id>": "<owner_uuid>"}`` on first use.
+    """
+
+    def __init__(self, owners: dict[str, str] | None = None, path: str | None = None):
+        if owners is None and path is None:
+            raise ValueError("Either owners or path is required")
+        self.path = path
+        self._owners = owners
+        self._lock = threading.Lock()
+
+    def resolve(self, cognito_id: str) -> str | None:
+        return self.owners.get(cognito_id)
+
+    @property
+    def owners(self) -> dict[str, str]:
+        if self._owners is None:
+            with self._lock:
+                if self._owners is None:
+                    with open(self.path, "rt") as file:
+                        self._owners = json.load(file)
+        return self._owners
+
+    def prewarm(self) -> None:
+        self.owners
+
+
+def create_owner_resolver(settings: Settings = config) -> OwnerResolver:
+    """
+    Create the owner resolver selected by ``settings.owner_resolver``.
+
+    :raises ValueError: If the backend is unknown, or its setting is missing.
+    """
+    if settings.owner_resolver == "lambda":
+        return LambdaOwnerResolver(settings)
+    if settings.owner_resolver == "dynamodb":
+        return DynamoDBOwnerResolver(settings)
+    if settings.owner_resolver == "static":
+        if settings.owner_map_file is None:
+            raise ValueError("owner_map_file is required for the static resolver")
+        return StaticOwnerResolver(path=settings.owner_map_file)
+    raise ValueError(f"Unknown owner resolver: {settings.owner_resolver}")
+
+
+_owner_resolver: OwnerResolver | None = None
+_owner_resolver_lock = threading.Lock()
+
+
+def get_owner_resolver() -> OwnerResolver:
+    """Return the process-wide owner resolver, creating it if needed."""
+    global _owner_resolver
+    if _owner_resolver is None:
+        with _owner_resolver_lock:
+            if _owner_resolver is None:
+                _owner_resolver = create_owner_resolver(config)
+    return _owner_resolver
+
+
+def set_owner_resolver(resolver: OwnerResolver | None) -> None:
+    """
+    Replace the process-wide owner resolver.
+
+    :param resolver: The new resolver, or None to create one from the settings on
+        next use.
+    """
+    global _owner_resolver
+    with _owner_resolver_lock:
+        _owner_resolver = resolver
@@ -1,3 +1,6 @@
+import functools
+from typing import Any
+
 from authorizer_lambda.models import (
     PolicyStatement,
     StatementEffect,
@@ -5,8 +8,21 @@ from authorizer_lambda.models import (
     AuthorizationResponse,
 )
 
+POLICY_VERSION = PolicyDocument.__fields__["Version"].default
+INVOKE_ACTION = PolicyStatement.__fields__["Action"].default
+# Characters that would make an owner_uuid in a resource ARN cover other routes
+_OWNER_UUID_WILDCARDS = frozenset("*?/")
+
+
+def generate_policy(principal_id, method_arn, owner_uuid, context, resource=None):
+    if resource is not None:
+        statement = PolicyStatement(Effect=StatementEffect.ALLOW, Resource=resource)
+        return AuthorizationResponse(
+            principalId=principal_id,
+            policyDocument=PolicyDocument(Statement=[statement]),
+            context=context,
+        )
 
-def generate_policy(principal_id, method_arn, owner_uuid, context):
     parts = method_arn.split("/")
     if len(parts) >= 3:
         # Replace the httpVerb part of the method_arn with "*"
@@ -23,3 +39,121 @@ def generate_policy(principal_id, method_arn, owner_uuid, context):
     return AuthorizationResponse(
         principalId=principal_id, policyDocument=policy_document, context=context
     )
+
+
+def build_policy_response(principal_id, method_arn, owner_uuid, context, resource=None):
+    """
+    Return the same dict as ``generate_policy(...).dict()``, without building and
+    validating the models.
+
+    The policy allows ``resource``, or the wildcarded method_arn if it isn't given.
+
+    Values the models would coerce or reject (a principal_id or context values that
+    aren't strings) go through ``generate_policy``, so the output and errors are
+    always identical to it.
+    """
+    if type(principal_id) is not str or not _is_str_dict(context):
+        return generate_policy(
+            principal_id, method_arn, owner_uuid, context, resource
+        ).dict()
+
+    return {
+        "principalId": principal_id,
+        "policyDocument": {
+            "Version": POLICY_VERSION,
+            "Statement": [
+                {
+                    "Action": INVOKE_ACTION,
+                    "Effect": StatementEffect.ALLOW.value,
+                    "Resource": resource
+                    if resource is not None
+                    else wildcard_resource(method_arn),
+                }
+            ],
+        },
+        "context": dict(context),
+    }
+
+
+def deny_policy_response(method_arn: str) -> dict[str, Any]:
+    """
+    Return a policy denying the principal every route in the API and stage of the
+    method_arn, for tokens that are rejected.
+    """
+    api_prefix, _, rest = method_arn.partition("/")
+    stage = rest.partition("/")[0]
+    return {
+        "principalId": "unauthorized",
+        "policyDocument": {
+            "Version": POLICY_VERSION,
+            "Statement": [
+                {
+                    "Action": INVOKE_ACTION,
+                    "Effect": StatementEffect.DENY.value,
+                    "Resource": f"{api_prefix}/{stage}/*",
+                }
+            ],
+        },
+    }
+
+
+def wildcard_resource(method_arn: str) -> str:
+    """
+    Replace the httpVerb and the resource path below the owner in the method_arn
+    with "*", like ``generate_policy`` does.
+    """
+    parts = method_arn.split("/", 5)
+    if len(parts) < 3:
+        return method_arn.rstrip("/")
+    return _wildcard_resource(
+        f"{parts[0]}/{parts[1]}", "/".join(parts[3:5]), len(parts) == 6
+    )
+
+
+def is_valid_owner_uuid(owner_uuid: Any) -> bool:
+    """
+    Return whether an owner_uuid can be put in a resource ARN: a non-empty string
+    without the wildcards or slashes that would widen the resource.
+    """
+    return (
+        isinstance(owner_uuid, str)
+        and owner_uuid != ""
+        and _OWNER_UUID_WILDCARDS.isdisjoint(owner_uuid)
+    )
+
+
+def owner_resource(method_arn: str, owner_uuid: str, owner_resource_path: str) -> str:
+    """
+    Return the resource covering every route of the owner, for any httpVerb, in the
+    API and stage of the method_arn.
+
+    :param method_arn: The method_arn of the request.
+    :param owner_uuid: The owner_uuid of the principal.
+    :param owner_resource_path: Path of the routes of the owner below the stage,
+        with an ``{owner_uuid}`` placeholder.
+    :raises ValueError: If the owner_uuid isn't valid, see is_valid_owner_uuid.
+    """
+    if not is_valid_owner_uuid(owner_uuid):
+        raise ValueError("Invalid owner_uuid")
+    api_prefix, _, rest = method_arn.partition("/")
+    stage = rest.partition("/")[0]
+    return _owner_resource(f"{api_prefix}/{stage}", owner_uuid, owner_resource_path)
+
+
+@functools.lru_cache(maxsize=4096)
+def _owner_resource(api_prefix: str, owner_uuid: str, owner_resource_path: str):
+    return f"{api_prefix}/*/{owner_resource_path.format(owner_uuid=owner_uuid)}"
+
+
+@functools.lru_cache(maxsize=4096)
+def _wildcard_resource(api_prefix: str, owner_path: str, child_resources: bool):
+    resource = f"{api_prefix}/*/{owner_path}"
+    if child_resources:
+        resource += "/*"
+    return resource.rstrip("/")
+
+
+def _is_str_dict(value: Any) -> bool:
+    return type(value) is dict and all(
+        type(key) is str and type(item) is str for key, item in value.items()
+    )
@@ -0,0 +1,175 @@
+"""Cheap checks rejecting bad tokens before any network or crypto work"""
+import threading
+from typing import Any
+
+from authorizer_lambda import metrics, util, verify_cognito_token
+from authorizer_lambda.config import Settings
+from authorizer_lambda.policy import is_valid_owner_uuid
+from authorizer_lambda.revocation import get_revocation_checker
+from authorizer_lambda.tokens import ParsedToken, parse_token, validate_time_claims
+
+# Reasons tokens are rejected for, in the order they are checked
+REASONS = (
+    "missing",
+    "too_long",
+    "malformed",
+    "issuer",
+    "alg",
+    "expired",
+    "not_yet_valid",
+    "kid",
+    "revoked",
+    "owner",
+)
+
+
+class TokenRejected(ValueError):
+    """A token was rejected by one of the cheap checks."""
+
+    def __init__(self, reason: str):
+        super().__init__("Expired token" if reason == "expired" else "Invalid token")
+        self.reason = reason
+
+
+class RejectionCounter:
+    """Thread-safe count of rejected tokens per reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(REASONS, 0)
+
+    def count(self, reason: str) -> None:
+        with self._lock:
+            self._counts[reason] += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(REASONS, 0)
+
+
+rejections = RejectionCounter()
+
+
+def precheck_token(token: str, settings: Settings) -> ParsedToken:
+    """
+    Parse a token and reject it early if it can't possibly be valid.
+
+    The checks run in order from cheapest to most expensive: the length of the
+    token, its structure, a known issuer (the dev issuer or one of the configured
+    user pools), the algorithm expected for that issuer,
+    the exp and nbf claims with ``token_clock_skew`` seconds of tolerance, for
+    Cognito tokens a kid that the cached key set contains or may still contain, and
+    the revocation snapshot. The signature isn't checked.
+
+    :param token: The JWT token string.
+    :param settings: The settings naming the user pool and the limits.
+    :return: The parsed token.
+    :raises TokenRejected: If one of the checks fails. The rejection is counted in
+        ``rejections`` and recorded on the metrics of the invocation.
+    """
+    try:
+        parsed = _precheck(token, settings)
+        _check_not_revoked(parsed.payload, token)
+        return parsed
+    except TokenRejected as e:
+        _record(e)
+        raise
+
+
+def check_not_revoked(claims: dict[str, Any], token: str) -> None:
+    """
+    Reject a token that has been revoked, such as a token that was verified and
+    cached before it was revoked.
+
+    :raises TokenRejected: If the token is revoked.
+    """
+    try:
+        _check_not_revoked(claims, token)
+    except TokenRejected as e:
+        _record(e)
+        raise
+
+
+def check_token_present(token: str | None) -> str:
+    """
+    Reject a request without a token, e.g. a REQUEST authorization request
+    without any of the identity sources.
+
+    :return: The token.
+    :raises TokenRejected: If the token is missing.
+    """
+    if token is None:
+        rejected = TokenRejected("missing")
+        _record(rejected)
+        raise rejected
+    return token
+
+
+def check_owner_uuid(owner_uuid: Any) -> str:
+    """
+    Reject a token whose owner_uuid, from a claim or the owner lookup, can't be put
+    in a policy, such as a missing owner or one with wildcards.
+
+    :return: The owner_uuid.
+    :raises TokenRejected: If the owner_uuid isn't valid.
+    """
+    if not is_valid_owner_uuid(owner_uuid):
+        rejected = TokenRejected("owner")
+        _record(rejected)
+        raise rejected
+    return owner_uuid
+
+
+def _record(rejected: TokenRejected) -> None:
+    rejections.count(rejected.reason)
+    metrics.set_property("RejectReason", rejected.reason)
+
+
+def _check_not_revoked(claims: dict[str, Any], token: str) -> None:
+    checker = get_revocation_checker()
+    if checker is not None and checker.is_revoked(claims, token):
+        raise TokenRejected("revoked")
+
+
+def _precheck(token: str, settings: Settings) -> ParsedToken:
+    if len(token) > settings.token_max_length:
+        raise TokenRejected("too_long")
+    if token.count(".") != 2:
+        raise TokenRejected("malformed")
+    try:
+        parsed = parse_token(token)
+    except ValueError:
+        raise TokenRejected("malformed")
+
+    pool = None
+    if parsed.issuer == util.DEV_ISSUER:
+        expected_alg = "HS256"
+    else:
+        pool = verify_cognito_token.get_cognito_pools(settings).route(parsed.issuer)
+        if pool is None:
+            raise TokenRejected("issuer")
+        expected_alg = "RS256"
+    if parsed.alg != expected_alg:
+        raise TokenRejected("alg")
+
+    try:
+        validate_time_claims(parsed.payload, leeway=settings.token_clock_skew)
+    except ValueError as e:
+        if str(e) == "Expired token":
+            raise TokenRejected("expired")
+        nbf = parsed.payload.get("nbf")
+        if isinstance(nbf, (int, float)) and not isinstance(nbf, bool):
+            raise TokenRejected("not_yet_valid")
+        raise TokenRejected("malformed")
+
+    if pool is not None:
+        kid = parsed.kid
+        if not isinstance(kid, str) or verify_cognito_token.get_pool_jwks_cache(
+            pool
+        ).is_unknown_kid(kid):
+            raise TokenRejected("kid")
+    return parsed
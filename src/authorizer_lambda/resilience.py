@@ -0,0 +1,193 @@
+"""Deadlines and circuit breakers for the services the authorizer depends on"""
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+from typing import Callable, TypeVar
+
+from authorizer_lambda.config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A call to a dependency didn't finish within its deadline."""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker of a dependency is open, so it isn't called."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker failing fast once a dependency keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens, and calls
+    raise CircuitOpenError without calling the dependency. After ``reset_timeout``
+    seconds a single trial call is let through: if it succeeds the breaker closes,
+    otherwise it opens again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._retry_due():
+                return self.HALF_OPEN
+            return self._state
+
+    def call(self, func: Callable[[], T]) -> T:
+        """
+        Call the dependency through the breaker.
+
+        :param func: Function calling the dependency.
+        :return: The result of func.
+        :raises CircuitOpenError: If the breaker is open.
+        """
+        self._before_call()
+        try:
+            result = func()
+        except BaseException:
+            self._record_failure()
+            raise
+        self._record_success()
+        return result
+
+    def reset(self) -> None:
+        """Close the breaker and forget all failures."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = 0.0
+            self._trial_running = False
+
+    def _retry_due(self) -> bool:
+        return self._clock() - self._opened_at >= self.reset_timeout
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and self._retry_due():
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+    def _record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def _record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or (
+                self._failures >= self.failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    logger.warning("Opening circuit breaker %s", self.name)
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+# The worker pools calls to dependencies run on, see get_executor
+JWKS = "jwks"
+OWNER_LOOKUP = "owner_lookup"
+BACKGROUND = "background"
+
+_executors: dict[str, concurrent.futures.ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str = BACKGROUND) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Return the process-wide worker pool of a dependency, creating it if needed.
+
+    Every dependency has a pool of its own, sized by the ``<name>_workers`` setting,
+    so calls hanging on one dependency can't hold up calls to the others.
+
+    :param name: The pool: JWKS, OWNER_LOOKUP or BACKGROUND.
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=getattr(config, f"{name}_workers"),
+                    thread_name_prefix=f"authorizer-{name}",
+                )
+    return executor
+
+
+def submit(
+    func: Callable[..., T], *args, executor: str = BACKGROUND
+) -> "concurrent.futures.Future[T]":
+    """
+    Start func on a worker thread, in a copy of the current context so it records
+    its metrics on the current invocation.
+
+    :param executor: The name of the worker pool, see get_executor.
+    """
+    context = contextvars.copy_context()
+    return get_executor(executor).submit(context.run, func, *args)
+
+
+def wait_with_deadline(
+    future: "concurrent.futures.Future[T]", timeout: float | None, name: str
+) -> T:
+    """
+    Wait at most ``timeout`` seconds for the result of a call started with submit.
+
+    :param name: Name of the call, for the error message.
+    :raises DeadlineExceeded: If the call didn't finish in time.
+    """
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(f"{name} didn't finish within {timeout}s")
+
+
+def call_with_deadline(
+    timeout: float | None, func: Callable[..., T], *args, executor: str = BACKGROUND
+) -> T:
+    """
+    Call func on a worker thread and wait at most ``timeout`` seconds for it.
+
+    The call runs in a copy of the current context, so it records its metrics on the
+    current invocation. A call that misses its deadline is abandoned; it keeps its
+    worker thread, in the pool of its dependency, until it returns.
+
+    :param timeout: The deadline in seconds, or None to call func directly.
+    :param executor: The name of the worker pool, see get_executor.
+    :raises DeadlineExceeded: If func didn't return in time.
+    """
+    if timeout is None:
+        return func(*args)
+    name = getattr(func, "__name__", repr(func))
+    return wait_with_deadline(submit(func, *args, executor=executor), timeout, name)
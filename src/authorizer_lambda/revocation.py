@@ -0,0 +1,317 @@
+"""
+In-memory check of revoked tokens, against a snapshot file.
+
+A snapshot holds a Bloom filter of the revoked tokens, and the sorted 16 byte
+digests of the same tokens as the exact set. Most tokens aren't revoked, and are
+cleared by the filter with a few bit lookups; only the tokens the filter matches
+are looked up in the exact set, so false positives of the filter never reject a
+token. Tokens are identified by their ``jti`` claim, or by the whole token if they
+don't have one.
+
+Build a snapshot with ``python -m authorizer_lambda.revocation snapshot.bin
+--jti-file revoked_jtis.txt``, and replace the file the authorizer reads to
+revoke more tokens.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from authorizer_lambda.config import config
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 16
+_MAGIC = b"RVK1"
+# Magic, number of hashes, size of the filter in bits, number of digests
+_HEADER = struct.Struct("<4sIQQ")
+
+
+def revocation_digest(claims: dict[str, Any], token: str) -> bytes:
+    """
+    Return the digest identifying a token in revocation snapshots.
+
+    :param claims: The claims of the token.
+    :param token: The JWT token string, used if the token has no jti claim.
+    """
+    jti = claims.get("jti")
+    if isinstance(jti, str) and jti:
+        return jti_digest(jti)
+    return token_digest(token)
+
+
+def jti_digest(jti: str) -> bytes:
+    """Return the digest of the token with this jti claim."""
+    return hashlib.blake2b(b"jti:" + jti.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def token_digest(token: str) -> bytes:
+    """Return the digest of a token without a jti claim."""
+    return hashlib.blake2b(b"token:" + token.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+class RevocationList:
+    """
+    A Bloom filter of revoked token digests, backed by the exact set of digests.
+
+    Both are kept as flat byte strings, so the memory use is ``filter_bytes`` plus
+    16 bytes per revoked token, without a Python object per token.
+    """
+
+    def __init__(self, hashes: int, size_bits: int, bits: bytes, digests: bytes):
+        if size_bits <= 0 or hashes <= 0 or len(bits) != (size_bits + 7) // 8:
+            raise ValueError("Invalid revocation filter")
+        if len(digests) % DIGEST_SIZE:
+            raise ValueError("Invalid revocation digests")
+        self.hashes = hashes
+        self.size_bits = size_bits
+        self._bits = bits
+        self._digests = _Digests(digests)
+
+    @classmethod
+    def build(
+        cls, digests: Iterable[bytes], false_positive_rate: float = 0.001
+    ) -> "RevocationList":
+        """
+        Build a revocation list of token digests.
+
+        :param digests: The digests of the revoked tokens.
+        :param false_positive_rate: Share of the tokens that aren't revoked, but
+            still have to be looked up in the exact set.
+        """
+        unique = sorted(set(digests))
+        if any(len(digest) != DIGEST_SIZE for digest in unique):
+            raise ValueError("Invalid revocation digests")
+        count = max(len(unique), 1)
+        size_bits = max(
+            8, math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        hashes = max(1, round(size_bits / count * math.log(2)))
+        bits = bytearray((size_bits + 7) // 8)
+        for digest in unique:
+            for position in _positions(digest, hashes, size_bits):
+                bits[position >> 3] |= 1 << (position & 7)
+        return cls(hashes, size_bits, bytes(bits), b"".join(unique))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "RevocationList":
+        """
+        Load a revocation list from a snapshot.
+
+        :raises ValueError: If the blob isn't a valid snapshot.
+        """
+        try:
+            magic, hashes, size_bits, count = _HEADER.unpack_from(blob)
+        except struct.error:
+            raise ValueError("Invalid revocation snapshot")
+        if magic != _MAGIC:
+            raise ValueError("Invalid revocation snapshot")
+        bits_end = _HEADER.size + (size_bits + 7) // 8
+        if len(blob) != bits_end + count * DIGEST_SIZE:
+            raise ValueError("Invalid revocation snapshot")
+        return cls(hashes, size_bits, blob[_HEADER.size : bits_end], blob[bits_end:])
+
+    def to_bytes(self) -> bytes:
+        """Return the snapshot of the revocation list."""
+        header = _HEADER.pack(_MAGIC, self.hashes, self.size_bits, len(self._digests))
+        return header + self._bits + self._digests.blob
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self._bits
+        for position in _positions(digest, self.hashes, self.size_bits):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        # The filter matched: confirm with the exact set
+        digests = self._digests
+        index = bisect.bisect_left(digests, digest)
+        return index < len(digests) and digests[index] == digest
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def stats(self) -> dict[str, int | float]:
+        """Return the size of the list and its memory use, in bytes."""
+        count = len(self._digests)
+        return {
+            "revoked": count,
+            "hashes": self.hashes,
+            "filter_bytes": len(self._bits),
+            "exact_bytes": len(self._digests.blob),
+            # Expected share of the tokens that aren't revoked but match the filter
+            "false_positive_rate": (1 - math.exp(-self.hashes * count / self.size_bits))
+            ** self.hashes,
+        }
+
+
+class _Digests:
+    """Sorted fixed size digests in one byte string, indexable for bisect."""
+
+    def __init__(self, blob: bytes):
+        self.blob = blob
+
+    def __getitem__(self, index: int) -> bytes:
+        start = index * DIGEST_SIZE
+        return self.blob[start : start + DIGEST_SIZE]
+
+    def __len__(self) -> int:
+        return len(self.blob) // DIGEST_SIZE
+
+
+def _positions(digest: bytes, hashes: int, size_bits: int) -> Iterable[int]:
+    # Double hashing: both halves of the digest give all the bit positions
+    first = int.from_bytes(digest[:8], "little")
+    step = int.from_bytes(digest[8:16], "little") | 1
+    return ((first + i * step) % size_bits for i in range(hashes))
+
+
+class RevocationChecker:
+    """
+    Checks tokens against the revocation snapshot in a file, and reloads it when
+    the file is replaced.
+
+    The file is checked for changes at most every ``check_interval`` seconds. A new
+    snapshot is loaded by one request while the others keep using the current one,
+    and then swapped in at once. If the file is missing or can't be read, the
+    current snapshot stays in use.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        check_interval: float = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._revoked: RevocationList | None = None
+        self._file_id: tuple[int, int, int] | None = None
+        self._next_check = clock() + check_interval
+        self._reload()
+
+    def is_revoked(self, claims: dict[str, Any], token: str) -> bool:
+        """
+        Check whether a token is revoked.
+
+        :param claims: The claims of the token.
+        :param token: The JWT token string.
+        """
+        revoked = self.current()
+        if revoked is None or not len(revoked):
+            return False
+        return revocation_digest(claims, token) in revoked
+
+    def current(self) -> RevocationList | None:
+        """Return the revocation list in use, reloading it if the file changed."""
+        now = self._clock()
+        if now >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.check_interval
+                self._reload()
+            finally:
+                self._lock.release()
+        return self._revoked
+
+    def _reload(self) -> None:
+        try:
+            stat = self.path.stat()
+            file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if file_id == self._file_id:
+                return
+            revoked = RevocationList.from_bytes(self.path.read_bytes())
+        except (OSError, ValueError) as e:
+            logger.warning("Keeping the current revocation snapshot: %s", e)
+            return
+        self._revoked = revoked
+        self._file_id = file_id
+        logger.info("Loaded %d revoked tokens from %s", len(revoked), self.path)
+
+
+_revocation_checker: RevocationChecker | None = None
+_revocation_checker_created = False
+_revocation_checker_lock = threading.Lock()
+
+
+def get_revocation_checker() -> RevocationChecker | None:
+    """
+    Return the process-wide revocation checker, creating it if needed, or None if
+    ``revocation_snapshot`` isn't configured.
+    """
+    global _revocation_checker, _revocation_checker_created
+    if not _revocation_checker_created:
+        with _revocation_checker_lock:
+            if not _revocation_checker_created:
+                if config.revocation_snapshot is not None:
+                    _revocation_checker = RevocationChecker(
+                        config.revocation_snapshot,
+                        config.revocation_check_interval,
+                    )
+                _revocation_checker_created = True
+    return _revocation_checker
+
+
+def set_revocation_checker(checker: RevocationChecker | None) -> None:
+    """
+    Replace the process-wide revocation checker.
+
+    :param checker: The new checker, or None to create one from the settings on
+        next use.
+    """
+    global _revocation_checker, _revocation_checker_created
+    with _revocation_checker_lock:
+        _revocation_checker = checker
+        _revocation_checker_created = checker is not None
+
+
+def write_snapshot(path: str | Path, revoked: RevocationList) -> None:
+    """Atomically replace the snapshot file, so readers never see a partial one."""
+    path = Path(path)
+    fd, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(revoked.to_bytes())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def main_cli(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a revocation snapshot")
+    parser.add_argument("output", type=Path)
+    parser.add_argument(
+        "--jti-file", type=Path, help="File with the jti of a revoked token per line"
+    )
+    parser.add_argument(
+        "--token-file", type=Path, help="File with a revoked token without jti per line"
+    )
+    parser.add_argument("--false-positive-rate", type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    digests = []
+    for path, digest in [(args.jti_file, jti_digest), (args.token_file, token_digest)]:
+        if path is not None:
+            lines = path.read_text().splitlines()
+            digests.extend(digest(line.strip()) for line in lines if line.strip())
+    revoked = RevocationList.build(digests, args.false_positive_rate)
+    write_snapshot(args.output, revoked)
+    stats = revoked.stats()
+    print(
+        f"Wrote {stats['revoked']} revoked tokens to {args.output}: "
+        f"{stats['filter_bytes'] + stats['exact_bytes']} bytes"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,309 @@
+"""
+Run the authorizer as a long-lived HTTP server.
+
+The server answers auth subrequests of a proxy in front of the backend, such as
+nginx ``auth_request`` or Envoy ``ext_authz``: every request is authorized with the
+token in its headers, query string or cookie, and answered with 200 and the owner in
+the ``X-Owner-Uuid`` header, 401 for a missing or invalid token, or 403 if the token
+doesn't give access to the requested path. The process keeps the JWKS, owner and
+verified token caches warm across requests.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import re
+import selectors
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from authorizer_lambda import main, metrics
+from authorizer_lambda.config import Settings, config
+from authorizer_lambda.identity import extract_token, get_header
+from authorizer_lambda.models import AuthorizationType, RequestAuthorizationRequest
+from authorizer_lambda.owner_cache import OwnerNotFoundError
+
+logger = logging.getLogger(__name__)
+
+OWNER_HEADER = "X-Owner-Uuid"
+
+
+def authorize_request(
+    path: str, headers: dict[str, str], settings: Settings = config
+) -> tuple[int, dict[str, str], dict[str, Any]]:
+    """
+    Authorize an HTTP request.
+
+    :param path: The path and query string of the request, which is replaced by
+        the ``server_original_path_header`` header if that is set.
+    :param headers: The headers of the request.
+    :param settings: The settings to authorize with.
+    :return: A tuple of the status code, the response headers and the JSON body.
+    """
+    if settings.server_original_path_header:
+        path = get_header(headers, settings.server_original_path_header) or path
+    url = urlsplit(path)
+    request = RequestAuthorizationRequest(
+        type=AuthorizationType.REQUEST,
+        methodArn="",
+        headers=headers,
+        queryStringParameters=dict(parse_qsl(url.query)),
+    )
+
+    metrics.start_invocation(settings.metrics_enabled, settings.metrics_namespace)
+    try:
+        token = extract_token(request, settings)
+        if token is None:
+            return 401, {}, {"message": "Missing token"}
+        owner_uuid = main.authorize(token, settings)
+        path = decode_path(url.path)
+        if (
+            owner_uuid is None
+            or path is None
+            or not owner_path(owner_uuid, settings).match(path)
+        ):
+            return 403, {}, {"message": "Forbidden"}
+        return 200, {OWNER_HEADER: owner_uuid}, {"principalId": owner_uuid}
+    except ValueError as e:
+        metrics.set_property("Error", type(e).__name__)
+        return 401, {}, {"message": str(e)}
+    except OwnerNotFoundError as e:
+        metrics.set_property("Error", type(e).__name__)
+        return 403, {}, {"message": "Forbidden"}
+    except Exception as e:
+        metrics.set_property("Error", type(e).__name__)
+        logger.exception("Authorizing %s failed", url.path)
+        response = main.error_response(e)
+        return response["statusCode"], {}, {"message": response["message"]}
+    finally:
+        metrics.end_invocation()
+
+
+def decode_path(path: str) -> str | None:
+    """
+    Percent-decode a request path, as the backend will.
+
+    :return: The decoded path, or None if it has ``.`` or ``..`` segments, which
+        could lead the backend outside the path that is authorized.
+    """
+    path = unquote(path)
+    if any(segment in (".", "..") for segment in path.split("/")):
+        return None
+    return path
+
+
+def owner_path(owner_uuid: str, settings: Settings) -> "re.Pattern[str]":
+    """
+    Return the pattern of the paths the owner has access to: the owner resource path
+    below ``server_path_prefix``, where ``*`` matches anything.
+    """
+    parts = [
+        re.escape(part).replace(r"\*", ".*")
+        for part in settings.owner_resource_path.split("{owner_uuid}")
+    ]
+    prefix = re.escape(settings.server_path_prefix.rstrip("/"))
+    return re.compile(prefix + "/" + re.escape(owner_uuid).join(parts) + r"\Z")
+
+
+class AuthorizerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with the result of authorize_request.
+
+    The handler lives as long as its connection, but only handles the requests the
+    server hands it one at a time with :meth:`handle_one_request`, see
+    :class:`AuthorizerServer`.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Send the headers and body of a response in one segment, instead of waiting
+    # for the ACK of the headers on keep-alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: "AuthorizerServer"
+
+    def __init__(self, request, client_address, server):
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = True
+        self.setup()
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except socket.timeout:
+            # The client stalled in the middle of a request
+            self.close_connection = True
+
+    def has_buffered_request(self) -> bool:
+        """Return whether the next request was read already, e.g. when pipelined."""
+        timeout = self.connection.gettimeout()
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def authorize(self):
+        status, headers, body = authorize_request(
+            self.path, dict(self.headers.items()), self.server.settings
+        )
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = authorize
+    do_OPTIONS = authorize
+
+    def log_message(self, format, *args):
+        logger.debug("%s " + format, self.address_string(), *args)
+
+
+class AuthorizerServer(HTTPServer):
+    """
+    HTTP/1.1 server handling requests on a fixed pool of worker threads.
+
+    Workers are dispatched per request rather than per connection: between requests,
+    keep-alive connections are watched by a single thread, which hands a connection
+    back to the pool once its next request arrives, and closes it after
+    ``server_keepalive_timeout`` idle seconds. Idle connections therefore never hold
+    on to a worker. The timeout also applies to reading and writing a request.
+    """
+
+    def __init__(self, address: tuple[str, int], settings: Settings = config):
+        self.settings = settings
+        self._workers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.server_workers, thread_name_prefix="authorizer-server"
+        )
+        self._idle: dict[AuthorizerRequestHandler, float] = {}
+        self._parked: list[AuthorizerRequestHandler] = []
+        self._parked_lock = threading.Lock()
+        self._wakeup, self._wakeup_write = socket.socketpair()
+        self._closed = False
+        self._keepalive = threading.Thread(
+            target=self._watch_idle_connections,
+            name="authorizer-server-keepalive",
+            daemon=True,
+        )
+        self._keepalive.start()
+        super().__init__(address, AuthorizerRequestHandler)
+
+    def process_request(self, request, client_address):
+        request.settimeout(self.settings.server_keepalive_timeout)
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._workers.submit(self._handle_request, handler)
+
+    def _handle_request(self, handler: AuthorizerRequestHandler) -> None:
+        try:
+            while True:
+                handler.handle_one_request()
+                if handler.close_connection or not handler.has_buffered_request():
+                    break
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.request, handler.client_address)
+        with self._parked_lock:
+            if not (handler.close_connection or self._closed):
+                self._parked.append(handler)
+                self._wakeup_write.send(b"\0")
+                return
+        self._close(handler)
+
+    def _watch_idle_connections(self) -> None:
+        # The only thread using the selector: workers pass it the connections to
+        # watch through _parked, and wake it up through the socket pair
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._wakeup, selectors.EVENT_READ)
+            while not self._closed:
+                now = time.monotonic()
+                timeout = min(self._idle.values(), default=now + 1) - now
+                for key, _ in selector.select(max(timeout, 0)):
+                    if key.fileobj is self._wakeup:
+                        self._wakeup.recv(4096)
+                        continue
+                    handler = key.data
+                    selector.unregister(handler.connection)
+                    del self._idle[handler]
+                    self._workers.submit(self._handle_request, handler)
+                with self._parked_lock:
+                    parked, self._parked = self._parked, []
+                deadline = time.monotonic() + self.settings.server_keepalive_timeout
+                for handler in parked:
+                    selector.register(handler.connection, selectors.EVENT_READ, handler)
+                    self._idle[handler] = deadline
+                now = time.monotonic()
+                for handler, deadline in list(self._idle.items()):
+                    if deadline <= now:
+                        selector.unregister(handler.connection)
+                        del self._idle[handler]
+                        self._close(handler)
+            with self._parked_lock:
+                parked, self._parked = self._parked, []
+            for handler in [*self._idle, *parked]:
+                self._close(handler)
+            self._idle.clear()
+
+    def _close(self, handler: AuthorizerRequestHandler) -> None:
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+        super().server_close()
+        with self._parked_lock:
+            self._closed = True
+            self._wakeup_write.send(b"\0")
+        self._keepalive.join()
+        self._workers.shutdown(wait=False, cancel_futures=True)
+        self._wakeup.close()
+        self._wakeup_write.close()
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=config.server_host)
+    parser.add_argument("--port", type=int, default=config.server_port)
+    parser.add_argument("--workers", type=int, default=config.server_workers)
+    parser.add_argument(
+        "--no-prewarm",
+        dest="prewarm",
+        action="store_false",
+        help="Don't fetch the JWKS and create the clients before serving",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    settings = config.copy(update={"server_workers": args.workers})
+    if args.prewarm:
+        main.prewarm(settings)
+    with AuthorizerServer((args.host, args.port), settings) as server:
+        host, port = server.server_address[:2]
+        logger.info("Authorizer listening on http://%s:%s", host, port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,90 @@
+"""In-process cache of tokens that have already been verified"""
+
+import hashlib
+import time
+from typing import Any, Callable, NamedTuple
+
+from authorizer_lambda.cache import Cache
+
+
+class VerifiedToken(NamedTuple):
+    """The result of verifying a token."""
+
+    claims: dict[str, Any]
+    owner_uuid: str
+    expires_at: float
+    # "dev" or "cognito", for the metrics of the invocations hitting the cache
+    token_type: str = "unknown"
+
+
+class TokenCache:
+    """
+    LRU cache of verified tokens, keyed by the SHA-256 digest of the token.
+
+    Entries expire at the ``exp`` claim of the token, or ``max_ttl`` seconds after
+    they were added, whichever comes first. At most ``max_entries`` entries, and
+    if ``max_bytes`` is set entries of at most that many bytes in total, are kept;
+    the least recently used ones are evicted to make room for a new one. Setting
+    either limit to 0 disables the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_ttl: float = 300,
+        max_bytes: int | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._clock = clock
+        self._cache: Cache[bytes, VerifiedToken] = Cache(
+            ttl=max_ttl, max_entries=max_entries, max_bytes=max_bytes, clock=clock
+        )
+
+    def get(self, token: str) -> VerifiedToken | None:
+        """
+        Return the cached verification result of the token, if any.
+
+        :param token: The JWT token string.
+        :return: The VerifiedToken, or None if the token isn't cached (anymore).
+        """
+        return self._cache.get(self._key(token))
+
+    def put(
+        self,
+        token: str,
+        claims: dict[str, Any],
+        owner_uuid: str,
+        token_type: str = "unknown",
+    ) -> None:
+        """
+        Cache the verification result of a token.
+
+        :param token: The JWT token string.
+        :param claims: The verified claims of the token.
+        :param owner_uuid: The owner_uuid resolved for the token.
+        :param token_type: The type of the token, "dev" or "cognito".
+        """
+        now = self._clock()
+        ttl = self.max_ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            ttl = min(ttl, exp - now)
+        self._cache.put(
+            self._key(token),
+            VerifiedToken(claims, owner_uuid, now + ttl, token_type),
+            ttl,
+        )
+
+    def clear(self) -> None:
+        """Drop all cached entries and reset the counters."""
+        self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Return the hit/miss counters and the current size of the cache."""
+        return self._cache.stats()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
@@ -0,0 +1,98 @@
+"""Parsing of JWT tokens"""
+import base64
+import binascii
+import json
+import time
+from typing import Any
+
+
+class ParsedToken:
+    """
+    A JWT token that has been split and decoded, but not verified.
+
+    The header and payload are decoded exactly once, and the signing input and
+    signature are kept so the signature can be verified without parsing the token
+    again.
+    """
+
+    __slots__ = ("raw", "header", "payload", "signing_input", "signature")
+
+    def __init__(
+        self,
+        raw: str,
+        header: dict[str, Any],
+        payload: dict[str, Any],
+        signing_input: bytes,
+        signature: bytes,
+    ):
+        self.raw = raw
+        self.header = header
+        self.payload = payload
+        self.signing_input = signing_input
+        self.signature = signature
+
+    @property
+    def alg(self) -> str | None:
+        return self.header.get("alg")
+
+    @property
+    def kid(self) -> str | None:
+        return self.header.get("kid")
+
+    @property
+    def issuer(self) -> str | None:
+        return self.payload.get("iss")
+
+
+def parse_token(token: str | ParsedToken) -> ParsedToken:
+    """
+    Split a JWT token and decode its header and payload, without verifying it.
+
+    :param token: The JWT token string. An already parsed token is returned as is.
+    :return: The ParsedToken.
+    :raises ValueError: If the token isn't a well-formed JWT.
+    """
+    if isinstance(token, ParsedToken):
+        return token
+    try:
+        signing_input, _, encoded_signature = token.rpartition(".")
+        encoded_header, _, encoded_payload = signing_input.partition(".")
+        if not encoded_header or "." in encoded_payload:
+            raise ValueError("Invalid token")
+        header = json.loads(_b64decode(encoded_header))
+        payload = json.loads(_b64decode(encoded_payload))
+        signature = _b64decode(encoded_signature)
+    except (AttributeError, UnicodeError, binascii.Error, ValueError):
+        raise ValueError("Invalid token")
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        raise ValueError("Invalid token")
+    return ParsedToken(token, header, payload, signing_input.encode("ascii"), signature)
+
+
+def validate_time_claims(payload: dict[str, Any], leeway: float = 0) -> None:
+    """
+    Check the exp, nbf and iat claims of a token, if present.
+
+    :param payload: The payload of the token.
+    :param leeway: Clock skew to tolerate, in seconds.
+    :raises ValueError: "Expired token" if the token has expired, or "Invalid token"
+        if it isn't valid yet or the claims aren't numbers.
+    """
+    now = time.time()
+    for claim in ("exp", "nbf", "iat"):
+        if claim not in payload:
+            continue
+        value = payload[claim]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Invalid token")
+    if "exp" in payload and payload["exp"] <= now - leeway:
+        raise ValueError("Expired token")
+    if "nbf" in payload and payload["nbf"] > now + leeway:
+        raise ValueError("Invalid token")
+
+
+def _b64decode(segment: str) -> bytes:
+    segment_bytes = segment.encode("ascii")
+    return base64.b64decode(
+        segment_bytes + b"=" * (-len(segment_bytes) % 4), altchars=b"-_", validate=True
+    )
@@ -1,31 +1,62 @@
-import jwt
+from authorizer_lambda.dev_keyring import DevKeyring
+from authorizer_lambda.tokens import ParsedToken, parse_token, validate_time_claims
+from authorizer_lambda.verifiers import get_token_verifier
 
+DEV_ISSUER = "dev.myapp.ai"
 
-def is_dev_token(token, dev_issuer="dev.myapp.ai"):
+
+def is_dev_token(token: str | ParsedToken, dev_issuer=DEV_ISSUER):
     """
     Check if the given JWT token is a dev token.
 
-    :param token: The JWT token string.
+    :param token: The JWT token string, or the already parsed token.
     :param dev_issuer: The issuer field value expected for dev tokens.
     :return: True if the token is a dev token, False otherwise.
     """
     try:
-        # Decode the token without verification to access the payload
-        payload = jwt.decode(token, options={"verify_signature": False})
-
-        # Check if the issuer field in the payload matches the expected dev issuer
-        return payload.get("iss") == dev_issuer
-    except jwt.DecodeError:
+        # Decode the token without verification to access the header and payload
+        parsed = parse_token(token)
+    except ValueError:
         return False
 
+    # Check if the issuer and algorithm match those of dev tokens
+    return parsed.issuer == dev_issuer and parsed.alg == "HS256"
 
-def verify_dev_token(token, secret):
-    try:
-        payload = jwt.decode(token, secret, algorithms=["HS256"])
-        if payload["iss"] != "dev.myapp.ai":
-            raise ValueError("Invalid issuer")
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise ValueError("Expired token")
-    except jwt.InvalidTokenError:
+
+def verify_dev_token(
+    token: str | ParsedToken, secret: str | bytes | DevKeyring, leeway: float = 0
+):
+    """
+    Verify a dev token and return its payload.
+
+    :param token: The JWT token string, or the already parsed token.
+    :param secret: The secret the token is signed with, or the keyring holding the
+        secret of its kid.
+    :param leeway: Clock skew to tolerate for the exp and nbf claims, in seconds.
+    :return: The payload of the token.
+    :raises ValueError: If the token is invalid, expired or not issued for dev.
+    """
+    parsed = parse_token(token)
+    if parsed.alg != "HS256":
+        raise ValueError("Invalid token")
+    if isinstance(secret, DevKeyring):
+        valid = secret.verify(parsed.kid, parsed.signing_input, parsed.signature)
+    else:
+        valid = _verify_hs256(parsed, secret)
+    if not valid:
         raise ValueError("Invalid token")
+    validate_time_claims(parsed.payload, leeway)
+    if parsed.issuer != DEV_ISSUER:
+        raise ValueError("Invalid issuer")
+    return parsed.payload
+
+
+def _verify_hs256(parsed: ParsedToken, secret: str | bytes) -> bool:
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+    verifier = get_token_verifier()
+    try:
+        key = verifier.hmac_key(secret)
+    except ValueError:
+        return False
+    return verifier.verify_hs256(parsed.signing_input, key, parsed.signature)
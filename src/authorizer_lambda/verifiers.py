@@ -0,0 +1,247 @@
+"""Signature verification of tokens, with a backend per crypto library"""
+import abc
+import base64
+import functools
+import hashlib
+import hmac
+import threading
+from typing import Any
+
+from authorizer_lambda.config import Settings, config
+
+BACKENDS = ("cryptography", "pyjwt", "jose")
+
+
+class TokenVerifier(abc.ABC):
+    """
+    Checks HS256 and RS256 token signatures with a crypto library.
+
+    Backends only check signatures: tokens are parsed and their claims validated by
+    the callers, so every backend accepts the same tokens and rejects the others the
+    same way. Keys are prepared once, when the secrets or the key set are loaded,
+    and reused for every token. The library is imported on first use.
+    """
+
+    name: str
+
+    @abc.abstractmethod
+    def load(self) -> None:
+        """Import the libraries of the backend."""
+
+    @abc.abstractmethod
+    def hmac_key(self, secret: bytes) -> Any:
+        """
+        Prepare an HS256 secret for :meth:`verify_hs256`.
+
+        :raises ValueError: If the backend refuses the secret.
+        """
+
+    @abc.abstractmethod
+    def verify_hs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        """
+        Check the HS256 signature of a token.
+
+        :param signing_input: The header and payload segments of the token.
+        :param key: The secret, prepared by :meth:`hmac_key`.
+        :param signature: The decoded signature of the token.
+        """
+
+    @abc.abstractmethod
+    def rsa_key(self, jwk: dict[str, Any]) -> Any:
+        """
+        Prepare the RSA public key of a JWK for :meth:`verify_rs256`.
+
+        :raises ValueError: If the JWK isn't a usable RSA key.
+        """
+
+    @abc.abstractmethod
+    def verify_rs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        """
+        Check the RS256 signature of a token.
+
+        :param signing_input: The header and payload segments of the token.
+        :param key: The public key, prepared by :meth:`rsa_key`.
+        :param signature: The decoded signature of the token.
+        """
+
+
+class CryptographyVerifier(TokenVerifier):
+    """
+    Uses ``cryptography`` directly for RS256, and the standard library for HS256,
+    without a JWT library in between.
+    """
+
+    name = "cryptography"
+
+    def load(self) -> None:
+        _cryptography()
+
+    def hmac_key(self, secret: bytes) -> "hmac.HMAC":
+        # The HMAC key schedule is computed once per secret and copied per token
+        return hmac.new(secret, digestmod=hashlib.sha256)
+
+    def verify_hs256(
+        self, signing_input: bytes, key: "hmac.HMAC", signature: bytes
+    ) -> bool:
+        mac = key.copy()
+        mac.update(signing_input)
+        return hmac.compare_digest(mac.digest(), signature)
+
+    def rsa_key(self, jwk: dict[str, Any]) -> Any:
+        rsa, _, _, _ = _cryptography()
+        if jwk.get("kty") != "RSA":
+            raise ValueError("Not an RSA key")
+        try:
+            numbers = rsa.RSAPublicNumbers(_b64_int(jwk["e"]), _b64_int(jwk["n"]))
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Invalid RSA key: {e!r}")
+        return numbers.public_key()
+
+    def verify_rs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        _, padding, sha256, invalid_signature = _cryptography()
+        try:
+            key.verify(signature, signing_input, padding, sha256)
+        except invalid_signature:
+            return False
+        return True
+
+
+class PyJWTVerifier(TokenVerifier):
+    """Uses the HMAC and RSA algorithms of PyJWT."""
+
+    name = "pyjwt"
+
+    def load(self) -> None:
+        _pyjwt()
+
+    def hmac_key(self, secret: bytes) -> bytes:
+        hs256, _, errors = _pyjwt()
+        try:
+            return hs256.prepare_key(secret)
+        except errors as e:
+            raise ValueError(str(e))
+
+    def verify_hs256(self, signing_input: bytes, key: bytes, signature: bytes) -> bool:
+        return _pyjwt()[0].verify(signing_input, key, signature)
+
+    def rsa_key(self, jwk: dict[str, Any]) -> Any:
+        _, rs256, errors = _pyjwt()
+        try:
+            key = rs256.from_jwk(jwk)
+        except (*errors, KeyError, TypeError) as e:
+            raise ValueError(str(e))
+        # A private JWK verifies with its public half, like with the other backends
+        return key.public_key() if hasattr(key, "public_key") else key
+
+    def verify_rs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        return _pyjwt()[1].verify(signing_input, key, signature)
+
+
+class JoseVerifier(TokenVerifier):
+    """Uses the keys of python-jose, with its cryptography backend."""
+
+    name = "jose"
+
+    def load(self) -> None:
+        _jose()
+
+    def hmac_key(self, secret: bytes) -> Any:
+        jwk, errors = _jose()
+        try:
+            return jwk.HMACKey(secret, "HS256")
+        except errors as e:
+            raise ValueError(str(e))
+
+    def verify_hs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        return key.verify(signing_input, signature)
+
+    def rsa_key(self, jwk: dict[str, Any]) -> Any:
+        jose_jwk, errors = _jose()
+        if jwk.get("kty") != "RSA":
+            raise ValueError("Not an RSA key")
+        try:
+            return jose_jwk.construct(jwk, "RS256").public_key()
+        except (*errors, KeyError, TypeError) as e:
+            raise ValueError(str(e))
+
+    def verify_rs256(self, signing_input: bytes, key: Any, signature: bytes) -> bool:
+        return key.verify(signing_input, signature)
+
+
+@functools.cache
+def _cryptography() -> tuple[Any, Any, Any, type[Exception]]:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+    return rsa, padding.PKCS1v15(), hashes.SHA256(), InvalidSignature
+
+
+@functools.cache
+def _pyjwt() -> tuple[Any, Any, tuple[type[Exception], ...]]:
+    from jwt.algorithms import HMACAlgorithm, RSAAlgorithm
+    from jwt.exceptions import PyJWTError
+
+    return (
+        HMACAlgorithm(HMACAlgorithm.SHA256),
+        RSAAlgorithm(RSAAlgorithm.SHA256),
+        (PyJWTError, ValueError),
+    )
+
+
+@functools.cache
+def _jose() -> tuple[Any, tuple[type[Exception], ...]]:
+    from jose import jwk
+    from jose.exceptions import JOSEError
+
+    return jwk, (JOSEError, ValueError)
+
+
+def _b64_int(value: str) -> int:
+    if not isinstance(value, str):
+        raise ValueError("Not a base64url string")
+    data = value.encode("ascii")
+    decoded = base64.b64decode(data + b"=" * (-len(data) % 4), b"-_", validate=True)
+    return int.from_bytes(decoded, "big")
+
+
+def create_token_verifier(settings: Settings = config) -> TokenVerifier:
+    """
+    Create the verifier selected by ``settings.token_verifier``.
+
+    :raises ValueError: If the backend is unknown.
+    """
+    if settings.token_verifier == "cryptography":
+        return CryptographyVerifier()
+    if settings.token_verifier == "pyjwt":
+        return PyJWTVerifier()
+    if settings.token_verifier == "jose":
+        return JoseVerifier()
+    raise ValueError(f"Unknown token verifier: {settings.token_verifier}")
+
+
+_token_verifier: TokenVerifier | None = None
+_token_verifier_lock = threading.Lock()
+
+
+def get_token_verifier() -> TokenVerifier:
+    """Return the process-wide token verifier, creating it if needed."""
+    global _token_verifier
+    if _token_verifier is None:
+        with _token_verifier_lock:
+            if _token_verifier is None:
+                _token_verifier = create_token_verifier(config)
+    return _token_verifier
+
+
+def set_token_verifier(verifier: TokenVerifier | None) -> None:
+    """
+    Replace the process-wide token verifier. Keys already prepared by the previous
+    one, in the dev keyring and the JWKS caches, must be reloaded as well.
+
+    :param verifier: The new verifier, or None to create one from the settings on
+        next use.
+    """
+    global _token_verifier
+    with _token_verifier_lock:
+        _token_verifier = verifier
@@ -1,36 +1,430 @@
-from jose import jwt as jose_jwt
-from jose.exceptions import JOSEError
-import requests
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator
 
+from authorizer_lambda import metrics
+from authorizer_lambda.clients import get_clients
+from authorizer_lambda.config import CognitoPool, Settings, config
+from authorizer_lambda.disk_cache import DiskCache, disk_cache_from_settings
+from authorizer_lambda.resilience import JWKS, CircuitBreaker, call_with_deadline
+from authorizer_lambda.tokens import ParsedToken, parse_token, validate_time_claims
+from authorizer_lambda.verifiers import get_token_verifier
 
-def verify_cognito_token(token, user_pool_id):
-    try:
-        jwks = fetch_jwks(user_pool_id)
-        if jwks is not None:
-            header = jose_jwt.get_unverified_header(token)
-            rsa_key = {}
-
-            for key in jwks["keys"]:
-                if key["kid"] == header["kid"]:
-                    rsa_key = {
-                        "kty": key["kty"],
-                        "kid": key["kid"],
-                        "use": key["use"],
-                        "alg": key["alg"],
-                        "e": key["e"],
-                        "n": key["n"],
-                    }
-
-            payload = jose_jwt.decode(
-                token, rsa_key, algorithms=["RS256"], audience=user_pool_id
+logger = logging.getLogger(__name__)
+
+
+class JWKSCache:
+    """
+    In-memory cache of a JSON Web Key Set, indexed by ``kid``.
+
+    Keys are served from memory for ``ttl`` seconds. After that they are served
+    stale for up to ``stale_ttl`` more seconds while a background refresh runs,
+    and once that window has passed as well the next lookup refreshes them
+    synchronously. A lookup for an unknown ``kid`` forces a single refresh, at most
+    once every ``refresh_min_interval`` seconds, so bogus kids can't hammer the
+    JWKS endpoint.
+
+    Every RSA key is turned into a ready-to-use public key of the process-wide token
+    verifier once per refresh, so verifying a signature doesn't have to parse the
+    modulus and exponent again.
+
+    Fetches go through the optional circuit breaker and must finish within
+    ``deadline`` seconds. If a synchronous refresh fails, the last known key set is
+    still served for up to ``max_stale`` seconds after the stale window.
+
+    With a ``disk_cache``, every fetched key set is also written to disk, and an
+    empty cache first tries the key set on disk before fetching it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float = 3600,
+        stale_ttl: float = 86400,
+        refresh_min_interval: float = 60,
+        max_stale: float = 0,
+        deadline: float | None = None,
+        breaker: CircuitBreaker | None = None,
+        disk_cache: DiskCache | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_min_interval = refresh_min_interval
+        self.max_stale = max_stale
+        self.deadline = deadline
+        self.breaker = breaker
+        self.disk_cache = disk_cache
+        self._disk_name = "jwks-" + hashlib.sha256(url.encode()).hexdigest()[:16]
+        self._clock = clock
+        self._keys: dict[str, dict[str, Any]] = {}
+        self._verifiers: dict[str, Any] = {}
+        self._fetched_at: float | None = None
+        self._last_refresh: float | None = None
+        self._lock = threading.Lock()
+        self._background_refresh: threading.Thread | None = None
+
+    def get_key(self, kid: str | None) -> dict[str, Any] | None:
+        """
+        Return the JWK for the given kid, or None if the key set doesn't contain it.
+
+        :param kid: The kid from the header of the token.
+        :return: The JWK as a dictionary, or None.
+        """
+        return self._lookup(kid, lambda: self._keys)
+
+    def get_verifier(self, kid: str | None) -> Any:
+        """
+        Return the pre-built RS256 public key for the given kid, or None if the key
+        set doesn't contain a usable RSA key with that kid.
+
+        :param kid: The kid from the header of the token.
+        :return: The RSA public key, or None.
+        """
+        return self._lookup(kid, lambda: self._verifiers)
+
+    def kids(self) -> list[str]:
+        """Return the kids of the usable RSA keys, loading the key set if needed."""
+        self._lookup(None, lambda: self._verifiers)
+        return list(self._verifiers)
+
+    def is_unknown_kid(self, kid: str) -> bool:
+        """
+        Return whether a lookup of the kid is certain to fail without calling
+        Cognito: the key set is loaded, doesn't contain the kid, and a refresh for
+        unknown kids isn't allowed yet.
+        """
+        return (
+            self._fetched_at is not None
+            and kid not in self._keys
+            and not self._may_force_refresh()
+        )
+
+    def _lookup(self, kid, index: Callable[[], dict[str, Any]]):
+        if self._fetched_at is None and self.disk_cache is not None:
+            self._load_from_disk()
+        now = self._clock()
+        age = None if self._fetched_at is None else now - self._fetched_at
+        if age is None or age >= self.ttl + self.stale_ttl:
+            self._refresh_or_fall_back(age)
+        elif age >= self.ttl:
+            self._refresh_in_background()
+
+        value = index().get(kid) if kid is not None else None
+        if value is None and kid is not None and self._may_force_refresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("JWKS refresh of %s for kid failed: %s", self.url, e)
+            value = index().get(kid)
+        return value
+
+    def refresh(self) -> None:
+        """Fetch the key set and replace the cached keys with it."""
+        requested_at = self._clock()
+        with self._lock:
+            if self._fetched_at is not None and self._fetched_at > requested_at:
+                # Another thread refreshed the keys while we were waiting
+                return
+            self._last_refresh = self._clock()
+            with metrics.stage("jwks_fetch"):
+                jwks = self._fetch()
+            self._set_keys(jwks, self._clock())
+        if self.disk_cache is not None:
+            self.disk_cache.write(self._disk_name, jwks)
+
+    def _set_keys(self, jwks: dict[str, Any], fetched_at: float) -> None:
+        keys = {key["kid"]: key for key in jwks["keys"]}
+        self._verifiers = _build_verifiers(keys)
+        self._keys = keys
+        self._fetched_at = fetched_at
+
+    def _load_from_disk(self) -> None:
+        disk_cache = self.disk_cache
+        if disk_cache is None:
+            return
+        stored = disk_cache.read(self._disk_name)
+        if stored is None:
+            return
+        jwks, age = stored
+        if age >= self.ttl + self.stale_ttl:
+            return
+        with self._lock:
+            if self._fetched_at is None:
+                try:
+                    self._set_keys(jwks, self._clock() - age)
+                except (KeyError, TypeError) as e:
+                    logger.warning("Ignoring malformed JWKS on disk: %s", e)
+
+    def _fetch(self) -> dict[str, Any]:
+        def fetch():
+            return call_with_deadline(
+                self.deadline, fetch_jwks_from_url, self.url, executor=JWKS
             )
 
-            return payload
-        else:
-            raise ValueError("Invalid token")
+        return self.breaker.call(fetch) if self.breaker is not None else fetch()
+
+    def _refresh_or_fall_back(self, age: float | None) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            if age is None or age >= self.ttl + self.stale_ttl + self.max_stale:
+                raise
+            logger.warning(
+                "JWKS refresh of %s failed, using stale keys: %s", self.url, e
+            )
+
+    def _may_force_refresh(self) -> bool:
+        return (
+            self._last_refresh is None
+            or self._clock() - self._last_refresh >= self.refresh_min_interval
+        )
+
+    def _refresh_in_background(self) -> None:
+        if self._background_refresh is not None and self._background_refresh.is_alive():
+            return
+        self._background_refresh = threading.Thread(
+            target=self._refresh_quietly, daemon=True
+        )
+        self._background_refresh.start()
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("Background JWKS refresh of %s failed: %s", self.url, e)
+
+
+def _build_verifiers(keys: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """Turn the RS256 signing keys of a key set into public keys, indexed by kid."""
+    token_verifier = get_token_verifier()
+    verifiers = {}
+    for kid, key in keys.items():
+        if key.get("kty") != "RSA" or key.get("alg", "RS256") != "RS256":
+            continue
+        try:
+            verifiers[kid] = token_verifier.rsa_key(key)
+        except ValueError as e:
+            logger.warning("Ignoring unusable JWK %s: %s", kid, e)
+    return verifiers
+
+
+_jwks_caches: dict[str, JWKSCache] = {}
+_jwks_caches_lock = threading.Lock()
+
+
+def load_crypto() -> None:
+    """Import the crypto libraries used to verify Cognito tokens."""
+    get_token_verifier().load()
+
+
+def get_jwks_cache(user_pool_id, region="us-east-1") -> JWKSCache:
+    """
+    Return the process-wide JWKS cache for a Cognito User Pool, creating it if needed.
+
+    :param user_pool_id: The ID of the Cognito User Pool.
+    :param region: AWS region where the Cognito User Pool is located.
+    :return: The JWKSCache for the user pool.
+    """
+    return _get_jwks_cache(
+        jwks_url(user_pool_id, region),
+        user_pool_id,
+        config.jwks_cache_ttl,
+        config.jwks_refresh_min_interval,
+    )
+
+
+def get_pool_jwks_cache(pool: CognitoPool) -> JWKSCache:
+    """
+    Return the process-wide JWKS cache for a configured user pool, creating it if
+    needed. Each pool has its own cache, refreshed on its own schedule.
+
+    :param pool: The user pool.
+    :return: The JWKSCache for the user pool.
+    """
+    return _get_jwks_cache(
+        pool.jwks_url or jwks_url(pool.user_pool_id, pool.region),
+        pool.user_pool_id,
+        config.jwks_cache_ttl if pool.jwks_cache_ttl is None else pool.jwks_cache_ttl,
+        config.jwks_refresh_min_interval
+        if pool.jwks_refresh_min_interval is None
+        else pool.jwks_refresh_min_interval,
+    )
+
+
+def _get_jwks_cache(
+    url: str, user_pool_id: str, ttl: float, refresh_min_interval: float
+) -> JWKSCache:
+    cache = _jwks_caches.get(url)
+    if cache is None:
+        with _jwks_caches_lock:
+            cache = _jwks_caches.setdefault(
+                url,
+                JWKSCache(
+                    url,
+                    ttl=ttl,
+                    stale_ttl=config.jwks_stale_ttl,
+                    refresh_min_interval=refresh_min_interval,
+                    max_stale=config.jwks_max_stale,
+                    deadline=config.jwks_deadline,
+                    breaker=CircuitBreaker(
+                        f"jwks:{user_pool_id}",
+                        failure_threshold=config.breaker_failure_threshold,
+                        reset_timeout=config.breaker_reset_timeout,
+                    ),
+                    disk_cache=disk_cache_from_settings(config),
+                ),
+            )
+    return cache
+
 
-    except JOSEError:
+def clear_jwks_caches():
+    """Drop all cached key sets."""
+    with _jwks_caches_lock:
+        _jwks_caches.clear()
+
+
+def verify_cognito_token(
+    token: str | ParsedToken, pool: str | CognitoPool, leeway: float = 0
+):
+    """
+    Verify a Cognito token against the JWKS of the user pool and return its payload.
+
+    :param token: The JWT token string, or the already parsed token.
+    :param pool: The user pool, or the ID of a Cognito User Pool in us-east-1.
+    :param leeway: Clock skew to tolerate for the exp and nbf claims, in seconds.
+    :return: The payload of the token.
+    :raises ValueError: If the token is invalid.
+    """
+    parsed = parse_token(token)
+    if parsed.alg != "RS256":
+        raise ValueError("Invalid token")
+    if isinstance(pool, CognitoPool):
+        jwks_cache = get_pool_jwks_cache(pool)
+        user_pool_id, audiences = pool.user_pool_id, pool.audience
+    else:
+        jwks_cache = get_jwks_cache(pool)
+        user_pool_id, audiences = pool, ()
+    rsa_key = jwks_cache.get_verifier(parsed.kid)
+    if rsa_key is None or not get_token_verifier().verify_rs256(
+        parsed.signing_input, rsa_key, parsed.signature
+    ):
+        raise ValueError("Invalid token")
+
+    payload = parsed.payload
+    try:
+        validate_time_claims(payload, leeway)
+    except ValueError:
         raise ValueError("Invalid token")
+    if audiences:
+        if not _has_audience(payload, audiences):
+            raise ValueError("Invalid token")
+    else:
+        audience = payload.get("aud")
+        if audience is not None and user_pool_id not in (
+            audience if isinstance(audience, list) else [audience]
+        ):
+            raise ValueError("Invalid token")
+
+    return payload
+
+
+def _has_audience(payload: dict[str, Any], audiences: tuple[str, ...]) -> bool:
+    """Check the aud claim of an ID token or the client_id of an access token."""
+    claimed = payload.get("aud", payload.get("client_id"))
+    if isinstance(claimed, str):
+        return claimed in audiences
+    return isinstance(claimed, list) and any(
+        isinstance(item, str) and item in audiences for item in claimed
+    )
+
+
+class CognitoPools:
+    """
+    The user pools whose tokens are accepted, indexed by the iss claim of their
+    tokens, so a token is routed to its pool with a single dict lookup instead of
+    being tried against every pool.
+    """
+
+    def __init__(self, pools: Iterable[CognitoPool]):
+        self._by_issuer = {
+            cognito_issuer(pool.user_pool_id, pool.region): pool for pool in pools
+        }
+
+    def route(self, issuer: Any) -> CognitoPool | None:
+        """Return the pool issuing tokens with this iss claim, if it's configured."""
+        if not isinstance(issuer, str):
+            return None
+        return self._by_issuer.get(issuer)
+
+    def __iter__(self) -> Iterator[CognitoPool]:
+        return iter(self._by_issuer.values())
+
+    def __len__(self) -> int:
+        return len(self._by_issuer)
+
+
+_cognito_pools: tuple[Any, CognitoPools] | None = None
+
+
+def get_cognito_pools(settings: Settings = config) -> CognitoPools:
+    """
+    Return the user pools configured in the settings: ``cognito_pools``, or
+    ``cognito_user_pool_id`` in ``cognito_region`` if it's empty.
+
+    The index is built once and reused until the pool settings change.
+    """
+    global _cognito_pools
+    key = (
+        settings.cognito_pools,
+        settings.cognito_user_pool_id,
+        settings.cognito_region,
+    )
+    cached = _cognito_pools
+    if cached is not None and all(a is b for a, b in zip(cached[0], key)):
+        return cached[1]
+
+    pools = CognitoPools(
+        settings.cognito_pools
+        or [
+            CognitoPool(
+                user_pool_id=settings.cognito_user_pool_id,
+                region=settings.cognito_region,
+            )
+        ]
+    )
+    _cognito_pools = (key, pools)
+    return pools
+
+
+def refresh_jwks_caches(settings: Settings = config) -> None:
+    """
+    Fetch the key sets of all configured user pools.
+
+    :raises Exception: The first error, once every pool has been tried.
+    """
+    errors = []
+    for pool in get_cognito_pools(settings):
+        try:
+            get_pool_jwks_cache(pool).refresh()
+        except Exception as e:
+            logger.warning("Refreshing the JWKS of %s failed: %s", pool.user_pool_id, e)
+            errors.append(e)
+    if errors:
+        raise errors[0]
+
+
+def cognito_issuer(user_pool_id, region="us-east-1"):
+    """Return the iss claim of the tokens of an AWS Cognito User Pool."""
+    return f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}"
+
+
+def jwks_url(user_pool_id, region="us-east-1"):
+    """Return the URL of the JWKS of an AWS Cognito User Pool."""
+    return f"{cognito_issuer(user_pool_id, region)}/.well-known/jwks.json"
 
 
 def fetch_jwks(user_pool_id, region="us-east-1"):
@@ -41,8 +435,18 @@ def fetch_jwks(user_pool_id, region="us-east-1"):
     :param region: AWS region where the Cognito User Pool is located'.
     :return: The JWKS as a dictionary.
     """
-    url = f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}/.well-known/jwks.json"
-    response = requests.get(url)
+    return fetch_jwks_from_url(jwks_url(user_pool_id, region))
+
+
+def fetch_jwks_from_url(url):
+    """
+    Fetch a JSON Web Key Set (JWKS) from the given URL.
+
+    :param url: The URL of the JWKS.
+    :return: The JWKS as a dictionary.
+    """
+    clients = get_clients()
+    response = clients.http.get(url, timeout=clients.http_timeout)
 
     if response.status_code == 200:
         return response.json()
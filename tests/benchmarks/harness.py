@@ -0,0 +1,126 @@
+"""Minimal micro-benchmark harness"""
+import gc
+import json
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_us: float
+    p99_us: float
+
+    def format(self) -> str:
+        return (
+            f"{self.name:<28} {self.ops_per_sec:>12,.0f} ops/s"
+            f"  p50 {self.p50_us:>9.1f} us  p99 {self.p99_us:>9.1f} us"
+        )
+
+
+def run_benchmark(
+    name: str,
+    func: Callable[[], object],
+    iterations: int = 1000,
+    warmup: int = 50,
+    rounds: int = 5,
+) -> BenchmarkResult:
+    """
+    Call ``func`` repeatedly and measure its throughput and latency percentiles.
+
+    The iterations are repeated for a number of rounds, and the fastest round is
+    reported, which filters out most of the noise of other processes.
+
+    :param name: Name of the benchmark.
+    :param func: The function to benchmark, called without arguments.
+    :param iterations: Number of measured calls per round.
+    :param warmup: Number of calls before measuring starts.
+    :param rounds: Number of rounds.
+    :return: The BenchmarkResult of the fastest round.
+    """
+    for _ in range(warmup):
+        func()
+
+    best = None
+    for _ in range(rounds):
+        total, timings = _run_round(func, iterations)
+        if best is None or total < best[0]:
+            best = (total, timings)
+    assert best is not None
+    total, timings = best
+
+    timings.sort()
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        ops_per_sec=iterations / (total / 1e9),
+        p50_us=percentile(timings, 50) / 1000,
+        p99_us=percentile(timings, 99) / 1000,
+    )
+
+
+def _run_round(func: Callable[[], object], iterations: int) -> tuple[int, list[int]]:
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            call_start = time.perf_counter_ns()
+            func()
+            timings.append(time.perf_counter_ns() - call_start)
+        total = time.perf_counter_ns() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return total, timings
+
+
+def find_regressions(
+    results: list[BenchmarkResult], baseline: dict[str, dict], threshold: float
+) -> list[str]:
+    """
+    Compare the throughput and median latency of results to a baseline.
+
+    The p99 latency of micro-benchmarks is too noisy to compare, so it is only
+    reported.
+
+    :param results: The results of the current run.
+    :param baseline: The baseline, as written by ``save_baseline``.
+    :param threshold: Allowed relative slowdown, e.g. 0.25 for 25%.
+    :return: A description of every regression beyond the threshold.
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if reference is None:
+            continue
+        if result.ops_per_sec < reference["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{result.name}: {result.ops_per_sec:,.0f} ops/s, baseline "
+                f"{reference['ops_per_sec']:,.0f} ops/s"
+            )
+        if result.p50_us > reference["p50_us"] * (1 + threshold):
+            regressions.append(
+                f"{result.name}: p50 {result.p50_us:.1f} us, baseline "
+                f"{reference['p50_us']:.1f} us"
+            )
+    return regressions
+
+
+def load_baseline(path: Path) -> dict[str, dict]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(path: Path, results: list[BenchmarkResult]) -> None:
+    baseline = {result.name: result._asdict() for result in results}
+    path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+def percentile(sorted_values: list[int], percentile: float) -> float:
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))
+    return sorted_values[index]
@@ -0,0 +1,396 @@
+"""
+Replay authorizer events from a JSONL file under load, against local stand-ins.
+
+Generate synthetic events with ``python -m tests.benchmarks.replay generate
+events.jsonl`` and replay them with ``python -m tests.benchmarks.replay run
+events.jsonl``. Events are TOKEN authorization requests with signed dev and Cognito
+tokens, where a few principals make most of the requests. The JWKS and the owner
+lambda are served by local stubs, so everything runs offline. ``run`` without a file
+replays freshly generated events.
+"""
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Iterator, NamedTuple
+from unittest import mock
+
+import jwt
+
+from authorizer_lambda import main, util, verify_cognito_token
+from authorizer_lambda.clients import Clients, get_clients, set_clients
+from authorizer_lambda.config import config
+from authorizer_lambda.models import StatementEffect
+from authorizer_lambda.server import AuthorizerServer
+from tests.benchmarks.harness import percentile
+from tests.stubs import JWKSServer, StubLambdaClient, make_rsa_key
+
+ARN_PREFIX = (
+    "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/backend_api_gw_stage_dev"
+)
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class Stubs(NamedTuple):
+    """What the local stand-ins serve: the JWKS and the owner of every sub."""
+
+    jwks: dict[str, Any]
+    owners: dict[str, str]
+
+
+def generate_events(
+    count: int,
+    principals: int = 100,
+    cognito_ratio: float = 0.5,
+    skew: float = 1.1,
+    seed: int = 0,
+) -> tuple[list[dict[str, Any]], Stubs]:
+    """
+    Generate TOKEN authorization events.
+
+    Every principal has a single token, and principals are picked with a Zipf
+    distribution, so a few principals make most of the requests, like in real
+    traffic.
+
+    :param count: Number of events.
+    :param principals: Number of distinct principals.
+    :param cognito_ratio: Share of the principals with a Cognito token; the others
+        have a dev token.
+    :param skew: Exponent of the Zipf distribution; 0 picks principals uniformly.
+    :param seed: Seed of the random generator.
+    :return: The events, and the stubs to replay them against.
+    """
+    rng = random.Random(seed)
+    private_key, public_jwk = make_rsa_key("replayKid")
+    issuer = verify_cognito_token.cognito_issuer(config.cognito_user_pool_id)
+    owners = {}
+    tokens = []
+    for i in range(principals):
+        owner_uuid = f"owner-{i}"
+        if rng.random() < cognito_ratio:
+            sub = f"user-{i}"
+            owners[sub] = owner_uuid
+            token = jwt.encode(
+                {"iss": issuer, "sub": sub},
+                private_key,
+                "RS256",
+                headers={"kid": "replayKid"},
+            )
+        else:
+            token = jwt.encode(
+                {"iss": util.DEV_ISSUER, "owner_uuid": owner_uuid},
+                config.dev_jwt_secret,
+                "HS256",
+            )
+        tokens.append((token, owner_uuid))
+
+    weights = list(itertools.accumulate(1 / (i + 1) ** skew for i in range(principals)))
+    events = []
+    for token, owner_uuid in rng.choices(tokens, cum_weights=weights, k=count):
+        method = rng.choice(["GET", "GET", "GET", "POST"])
+        events.append(
+            {
+                "type": "TOKEN",
+                "authorizationToken": token,
+                "methodArn": f"{ARN_PREFIX}/{method}/api/{owner_uuid}/property",
+            }
+        )
+    return events, Stubs({"keys": [public_jwk]}, owners)
+
+
+def write_events(path: Path, events: list[dict[str, Any]], stubs: Stubs) -> None:
+    """Write the events as JSONL, and the stubs next to them."""
+    with path.open("wt") as file:
+        for event in events:
+            file.write(json.dumps(event) + "\n")
+    stubs_path(path).write_text(json.dumps(stubs._asdict()))
+
+
+def read_events(path: Path) -> Iterator[dict[str, Any]]:
+    """Stream the events of a JSONL file."""
+    with path.open("rt") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_stubs(path: Path) -> Stubs:
+    """Read the stubs written next to a JSONL file, if any."""
+    location = stubs_path(path)
+    if not location.exists():
+        return Stubs({"keys": []}, {})
+    return Stubs(**json.loads(location.read_text()))
+
+
+def stubs_path(path: Path) -> Path:
+    return path.with_name(path.name + ".stubs.json")
+
+
+class Report(NamedTuple):
+    events: int
+    seconds: float
+    outcomes: dict[str, int]
+    latencies_ms: list[float]
+    token_cache_hit_ratio: float
+    owner_cache_hit_ratio: float
+    jwks_fetches: int
+    owner_invocations: int
+
+    @property
+    def throughput(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        return percentile(self.latencies_ms, p)
+
+    def histogram(self) -> dict[str, int]:
+        """Return the number of events per latency bucket."""
+        counts = dict.fromkeys([f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS], 0)
+        counts[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+        labels = list(counts)
+        bucket = 0
+        for latency in self.latencies_ms:
+            while (
+                bucket < len(HISTOGRAM_BUCKETS_MS)
+                and latency > HISTOGRAM_BUCKETS_MS[bucket]
+            ):
+                bucket += 1
+            counts[labels[bucket]] += 1
+        return counts
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "events": self.events,
+            "seconds": round(self.seconds, 3),
+            "throughput": round(self.throughput, 1),
+            "outcomes": self.outcomes,
+            "latency_ms": {
+                f"p{p}": round(self.percentile(p), 3) for p in (50, 90, 99, 100)
+            },
+            "histogram": self.histogram(),
+            "token_cache_hit_ratio": round(self.token_cache_hit_ratio, 4),
+            "owner_cache_hit_ratio": round(self.owner_cache_hit_ratio, 4),
+            "jwks_fetches": self.jwks_fetches,
+            "owner_invocations": self.owner_invocations,
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"{self.events} events in {self.seconds:.2f}s: "
+            f"{self.throughput:,.0f} events/s",
+            "outcomes: "
+            + ", ".join(f"{k} {v}" for k, v in sorted(self.outcomes.items())),
+            "latency: "
+            + "  ".join(f"p{p} {self.percentile(p):.3f} ms" for p in (50, 90, 99)),
+            f"token cache hit ratio {self.token_cache_hit_ratio:.1%}, "
+            f"owner cache hit ratio {self.owner_cache_hit_ratio:.1%}, "
+            f"{self.jwks_fetches} JWKS fetches, "
+            f"{self.owner_invocations} owner invocations",
+        ]
+        histogram = self.histogram()
+        widest = max(histogram.values()) or 1
+        for label, count in histogram.items():
+            lines.append(f"{label:>10} {count:>8} {'#' * round(40 * count / widest)}")
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def offline_authorizer(stubs: Stubs, owner_latency: float = 0.0) -> Iterator[Any]:
+    """
+    Point the authorizer at local stand-ins serving the stubs, with empty caches.
+
+    :param owner_latency: Seconds every invoke of the stub owner lambda takes.
+    :return: A tuple of the JWKS server and the stub Lambda client.
+    """
+    lambda_client = StubLambdaClient(stubs.owners, latency=owner_latency)
+    previous_clients = get_clients()
+    with contextlib.ExitStack() as stack:
+        server = stack.enter_context(JWKSServer(stubs.jwks))
+        stack.enter_context(
+            mock.patch.object(
+                verify_cognito_token, "jwks_url", lambda *args, **kwargs: server.url
+            )
+        )
+        stack.enter_context(mock.patch.object(config, "metrics_enabled", False))
+        for clear in _caches():
+            clear()
+            stack.callback(clear)
+        stack.callback(set_clients, previous_clients)
+        set_clients(Clients(lambda_client=lambda_client))
+        yield server, lambda_client
+
+
+def _caches():
+    return [
+        verify_cognito_token.clear_jwks_caches,
+        main.verified_tokens.clear,
+        main.owners.clear,
+        main.owner_breaker.reset,
+    ]
+
+
+def replay(
+    events: Iterable[dict[str, Any]],
+    stubs: Stubs,
+    workers: int = 4,
+    target: str = "handler",
+    owner_latency: float = 0.0,
+) -> Report:
+    """
+    Replay events through the authorizer with concurrent workers.
+
+    :param events: The authorization events.
+    :param stubs: What the local stand-ins serve.
+    :param workers: Number of concurrent workers.
+    :param target: "handler" to call main.handler, or "server" to send the events
+        to an HTTP server in this process, over a keep-alive connection per worker.
+    :param owner_latency: Seconds every invoke of the stub owner lambda takes.
+    :return: The Report.
+    """
+    if target not in ("handler", "server"):
+        raise ValueError(f"Unknown target: {target}")
+    lock = threading.Lock()
+    events = iter(events)
+    latencies: list[float] = []
+    outcomes: dict[str, int] = {}
+
+    def next_event():
+        with lock:
+            return next(events, None)
+
+    def run_worker(send):
+        worker_latencies = []
+        worker_outcomes: dict[str, int] = {}
+        while (event := next_event()) is not None:
+            start = time.perf_counter()
+            outcome = send(event)
+            worker_latencies.append((time.perf_counter() - start) * 1000)
+            worker_outcomes[outcome] = worker_outcomes.get(outcome, 0) + 1
+        with lock:
+            latencies.extend(worker_latencies)
+            for outcome, count in worker_outcomes.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+
+    with offline_authorizer(stubs, owner_latency) as (jwks_server, lambda_client):
+        with contextlib.ExitStack() as stack:
+            if target == "server":
+                settings = config.copy(update={"server_workers": workers})
+                server = stack.enter_context(
+                    AuthorizerServer(("127.0.0.1", 0), settings)
+                )
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                stack.callback(server.shutdown)
+                senders = [
+                    _server_sender(server.server_address[1]) for _ in range(workers)
+                ]
+            else:
+                senders = [_handler_sender] * workers
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(run_worker, send) for send in senders]:
+                    future.result()
+            seconds = time.perf_counter() - start
+
+        latencies.sort()
+        return Report(
+            events=len(latencies),
+            seconds=seconds,
+            outcomes=outcomes,
+            latencies_ms=latencies,
+            token_cache_hit_ratio=main.verified_tokens.stats()["hit_rate"],
+            owner_cache_hit_ratio=main.owners.stats()["hit_rate"],
+            jwks_fetches=jwks_server.requests,
+            owner_invocations=lambda_client.invocations,
+        )
+
+
+def _handler_sender(event: dict[str, Any]) -> str:
+    try:
+        response = main.handler(event, {})
+    except Exception as e:
+        # How the handler rejects a token, unless reject_response is "deny"
+        if str(e) != "Unauthorized":
+            raise
+        return "unauthorized"
+    if "principalId" in response:
+        effect = response["policyDocument"]["Statement"][0]["Effect"]
+        return "allow" if effect == StatementEffect.ALLOW.value else "deny"
+    return f"status {response.get('statusCode')}"
+
+
+def _server_sender(port: int):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def send(event: dict[str, Any]) -> str:
+        # The path of the request is the path of the methodArn below its stage
+        path = "/" + event["methodArn"].split("/", 3)[3]
+        connection.request(
+            "GET", path, headers={"Authorization": event["authorizationToken"]}
+        )
+        response = connection.getresponse()
+        response.read()
+        return "allow" if response.status == 200 else f"status {response.status}"
+
+    return send
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write synthetic events")
+    generate.add_argument("events", type=Path)
+    run = commands.add_parser("run", help="Replay events")
+    run.add_argument("events", type=Path, nargs="?")
+    run.add_argument("--workers", type=int, default=4)
+    run.add_argument("--target", choices=["handler", "server"], default="handler")
+    run.add_argument(
+        "--owner-latency-ms",
+        type=float,
+        default=0.0,
+        help="Latency of every invoke of the stub owner lambda",
+    )
+    run.add_argument("--json", action="store_true", help="Print the report as JSON")
+    for command in (generate, run):
+        command.add_argument("--count", type=int, default=10000)
+        command.add_argument("--principals", type=int, default=100)
+        command.add_argument("--cognito-ratio", type=float, default=0.5)
+        command.add_argument("--skew", type=float, default=1.1)
+        command.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate" or args.events is None:
+        events, stubs = generate_events(
+            args.count, args.principals, args.cognito_ratio, args.skew, args.seed
+        )
+        if args.command == "generate":
+            write_events(args.events, events, stubs)
+            print(f"Wrote {len(events)} events to {args.events}")
+            return 0
+    else:
+        events, stubs = read_events(args.events), read_stubs(args.events)
+
+    report = replay(
+        events,
+        stubs,
+        workers=args.workers,
+        target=args.target,
+        owner_latency=args.owner_latency_ms / 1000,
+    )
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
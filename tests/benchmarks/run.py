@@ -0,0 +1,204 @@
+"""
+Micro-benchmarks of every authorization path, against local stand-ins.
+
+Run with ``python -m tests.benchmarks.run``. Results are compared to
+``baseline.json`` and the run fails when a benchmark regressed beyond the
+threshold. Use ``--save-baseline`` to record a new baseline.
+"""
+import argparse
+import contextlib
+import sys
+from pathlib import Path
+from typing import Callable, Iterator
+from unittest import mock
+
+import jwt
+
+from authorizer_lambda import main, util, verify_cognito_token
+from authorizer_lambda.clients import Clients, get_clients, set_clients
+from authorizer_lambda.config import config
+from authorizer_lambda.dev_keyring import get_dev_keyring
+from authorizer_lambda.owner_resolvers import LambdaOwnerResolver
+from authorizer_lambda.policy import build_policy_response, generate_policy
+from authorizer_lambda.revocation import (
+    RevocationList,
+    jti_digest,
+    revocation_digest,
+)
+from tests.benchmarks.harness import (
+    find_regressions,
+    load_baseline,
+    run_benchmark,
+    save_baseline,
+)
+from tests.stubs import JWKSServer, StubLambdaClient, make_rsa_key
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+METHOD_ARN = (
+    "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/"
+    "backend_api_gw_stage_dev/GET/api/a-b-c-d/property/sub"
+)
+
+
+def revocation_list(count: int) -> RevocationList:
+    """Build a revocation list of ``count`` revoked jtis."""
+    return RevocationList.build(jti_digest(f"revoked-{i}") for i in range(count))
+
+
+@contextlib.contextmanager
+def authorizer_benchmarks(
+    owner_latency: float = 0.0, revoked: RevocationList | None = None
+) -> Iterator[dict[str, Callable[[], object]]]:
+    """
+    Set up local stand-ins for Cognito and the owner lambda, and yield the
+    benchmarks by name.
+
+    :param owner_latency: Seconds every invoke of the stub owner lambda takes.
+    :param revoked: The revocation list to check tokens against; 1000 revoked jtis
+        by default.
+    """
+    if revoked is None:
+        revoked = revocation_list(1000)
+    private_key, public_jwk = make_rsa_key("benchKid")
+    dev_token = jwt.encode(
+        {"iss": util.DEV_ISSUER, "owner_uuid": "a-b-c-d"},
+        config.dev_jwt_secret,
+        algorithm="HS256",
+    )
+    cognito_token = jwt.encode(
+        {"sub": "bench-sub"},
+        private_key,
+        algorithm="RS256",
+        headers={"kid": "benchKid"},
+    )
+    lambda_client = StubLambdaClient({"bench-sub": "a-b-c-d"}, latency=owner_latency)
+    previous_clients = get_clients()
+
+    with contextlib.ExitStack() as stack:
+        server = stack.enter_context(JWKSServer({"keys": [public_jwk]}))
+        stack.enter_context(
+            mock.patch.object(
+                verify_cognito_token, "jwks_url", lambda *args, **kwargs: server.url
+            )
+        )
+        stack.enter_context(mock.patch.object(config, "metrics_enabled", False))
+        stack.callback(set_clients, previous_clients)
+        stack.callback(verify_cognito_token.clear_jwks_caches)
+        stack.callback(main.owners.clear)
+        stack.callback(main.verified_tokens.clear)
+        set_clients(Clients(lambda_client=lambda_client))
+
+        def handler_uncached():
+            main.verified_tokens.clear()
+            return main.handler(
+                {
+                    "type": "TOKEN",
+                    "authorizationToken": dev_token,
+                    "methodArn": METHOD_ARN,
+                },
+                {},
+            )
+
+        yield {
+            "dev_token": lambda: util.verify_dev_token(
+                dev_token, config.dev_jwt_secret
+            ),
+            "dev_token_keyring": lambda: util.verify_dev_token(
+                dev_token, get_dev_keyring()
+            ),
+            "cognito_token": lambda: verify_cognito_token.verify_cognito_token(
+                cognito_token, config.cognito_user_pool_id
+            ),
+            "owner_lookup_invoke": lambda: LambdaOwnerResolver(config).resolve(
+                "bench-sub"
+            ),
+            "owner_lookup_cached": lambda: main.get_owner_uuid("bench-sub", config),
+            "generate_policy": lambda: generate_policy(
+                "a-b-c-d", METHOD_ARN, "a-b-c-d", {}
+            ),
+            "build_policy_response": lambda: build_policy_response(
+                "a-b-c-d", METHOD_ARN, "a-b-c-d", {}
+            ),
+            "revocation_miss": lambda: revocation_digest(
+                {"jti": "not-revoked"}, dev_token
+            )
+            in revoked,
+            "revocation_hit": lambda: revocation_digest({"jti": "revoked-0"}, dev_token)
+            in revoked,
+            "handler_dev_token": handler_uncached,
+            "handler_cached": lambda: main.handler(
+                {
+                    "type": "TOKEN",
+                    "authorizationToken": dev_token,
+                    "methodArn": METHOD_ARN,
+                },
+                {},
+            ),
+        }
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown compared to the baseline",
+    )
+    parser.add_argument(
+        "--owner-latency-ms",
+        type=float,
+        default=0.0,
+        help="Latency of every invoke of the stub owner lambda",
+    )
+    parser.add_argument(
+        "--revoked",
+        type=int,
+        default=100_000,
+        help="Number of revoked tokens in the revocation benchmarks",
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("-k", dest="only", help="Only run benchmarks containing this")
+    args = parser.parse_args(argv)
+
+    revoked = revocation_list(args.revoked)
+    stats = revoked.stats()
+    print(
+        f"{'revocation_memory':<28} {stats['revoked']:>12,} tokens"
+        f"  filter {stats['filter_bytes'] / 1024:,.1f} KiB"
+        f"  exact {stats['exact_bytes'] / 1024:,.1f} KiB"
+        f"  fp rate {stats['false_positive_rate']:.2%}"
+    )
+
+    results = []
+    with authorizer_benchmarks(
+        owner_latency=args.owner_latency_ms / 1000, revoked=revoked
+    ) as benches:
+        for name, func in benches.items():
+            if args.only and args.only not in name:
+                continue
+            result = run_benchmark(
+                name, func, iterations=args.iterations, rounds=args.rounds
+            )
+            print(result.format())
+            results.append(result)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = find_regressions(
+        results, load_baseline(args.baseline), args.threshold
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,140 @@
+"""
+Compare the token verifier backends on HS256 and RS256.
+
+Run with ``python -m tests.benchmarks.verifiers``. For every backend this reports
+the throughput of preparing a key and of checking a signature, and the time and
+number of modules it takes to import the backend's libraries in a fresh
+interpreter, which is paid on every cold start.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Callable, NamedTuple
+
+import jwt
+
+from authorizer_lambda.config import config
+from authorizer_lambda.tokens import parse_token
+from authorizer_lambda.verifiers import BACKENDS, TokenVerifier, create_token_verifier
+from tests.benchmarks.harness import run_benchmark
+from tests.stubs import make_rsa_key
+
+SECRET = "benchmark-secret" * 4
+
+_IMPORT_SCRIPT = """
+import sys, time
+from authorizer_lambda.config import config
+from authorizer_lambda.verifiers import create_token_verifier
+verifier = create_token_verifier(config.copy(update={"token_verifier": %r}))
+modules = len(sys.modules)
+start = time.perf_counter()
+verifier.load()
+print(time.perf_counter() - start, len(sys.modules) - modules)
+"""
+
+
+class ImportCost(NamedTuple):
+    backend: str
+    import_ms: float
+    modules: int
+
+    def format(self) -> str:
+        return (
+            f"{self.backend + '_import':<28} {self.import_ms:>12,.1f} ms"
+            f"  {self.modules:>4} modules"
+        )
+
+
+def create_verifier(backend: str) -> TokenVerifier:
+    """Create the verifier of a backend."""
+    return create_token_verifier(config.copy(update={"token_verifier": backend}))
+
+
+def verifier_benchmarks(
+    verifier: TokenVerifier, rsa_key: tuple[str, dict] | None = None
+) -> dict[str, Callable[[], object]]:
+    """
+    Return the benchmarks of a verifier by name.
+
+    :param verifier: The verifier to benchmark.
+    :param rsa_key: The PEM private key and public JWK to sign RS256 tokens with,
+        from ``make_rsa_key``; a new one by default.
+    """
+    private_key, public_jwk = rsa_key or make_rsa_key("benchKid")
+    hs256 = parse_token(jwt.encode({"sub": "bench-sub"}, SECRET, algorithm="HS256"))
+    rs256 = parse_token(
+        jwt.encode({"sub": "bench-sub"}, private_key, algorithm="RS256")
+    )
+    secret = SECRET.encode("utf-8")
+    hmac_key = verifier.hmac_key(secret)
+    public_key = verifier.rsa_key(public_jwk)
+    name = verifier.name
+    return {
+        f"{name}_hs256_key": lambda: verifier.hmac_key(secret),
+        f"{name}_hs256": lambda: verifier.verify_hs256(
+            hs256.signing_input, hmac_key, hs256.signature
+        ),
+        f"{name}_rs256_key": lambda: verifier.rsa_key(public_jwk),
+        f"{name}_rs256": lambda: verifier.verify_rs256(
+            rs256.signing_input, public_key, rs256.signature
+        ),
+    }
+
+
+def import_cost(backend: str, runs: int = 3) -> ImportCost:
+    """
+    Measure the import of a backend's libraries in fresh interpreters.
+
+    :param backend: The name of the backend.
+    :param runs: Number of interpreters; the fastest import is reported.
+    """
+    costs = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT % backend],
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        seconds, modules = result.stdout.split()
+        costs.append((float(seconds) * 1000, int(modules)))
+    import_ms, modules = min(costs)
+    return ImportCost(backend, import_ms, modules)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument(
+        "--backend", action="append", choices=BACKENDS, help="Default: all of them"
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args(argv)
+
+    rsa_key = make_rsa_key("benchKid")
+    report = {}
+    for backend in args.backend or BACKENDS:
+        cost = import_cost(backend, args.import_runs)
+        report[f"{backend}_import"] = cost._asdict()
+        if not args.json:
+            print(cost.format())
+        benches = verifier_benchmarks(create_verifier(backend), rsa_key)
+        for name, func in benches.items():
+            result = run_benchmark(
+                name, func, iterations=args.iterations, rounds=args.rounds
+            )
+            report[name] = result._asdict()
+            if not args.json:
+                print(result.format())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
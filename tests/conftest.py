@@ -0,0 +1,32 @@
+import pytest
+
+from authorizer_lambda import main, verify_cognito_token
+from authorizer_lambda.clients import set_clients
+from authorizer_lambda.dev_keyring import set_dev_keyring
+from authorizer_lambda.owner_resolvers import set_owner_resolver
+from authorizer_lambda.revocation import set_revocation_checker
+from authorizer_lambda.verifiers import set_token_verifier
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Make sure no process-wide cache leaks between tests."""
+    verify_cognito_token.clear_jwks_caches()
+    main.verified_tokens.clear()
+    main.owners.clear()
+    main.owner_breaker.reset()
+    set_clients(None)
+    set_owner_resolver(None)
+    set_dev_keyring(None)
+    set_revocation_checker(None)
+    set_token_verifier(None)
+    yield
+    verify_cognito_token.clear_jwks_caches()
+    main.verified_tokens.clear()
+    main.owners.clear()
+    main.owner_breaker.reset()
+    set_clients(None)
+    set_owner_resolver(None)
+    set_dev_keyring(None)
+    set_revocation_checker(None)
+    set_token_verifier(None)
@@ -0,0 +1,170 @@
+"""Local stand-ins for the external services the authorizer talks to."""
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JWKSServer:
+    """
+    A local HTTP server serving a JSON Web Key Set.
+
+    Use it as a context manager. ``jwks`` can be replaced at any time to simulate
+    key rotation, and ``status`` and ``delay`` (in seconds) to simulate failures.
+    ``requests`` counts the number of requests served.
+    """
+
+    def __init__(self, jwks):
+        self.jwks = jwks
+        self.status = 200
+        self.delay = 0.0
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                body = json.dumps(stub.jwks).encode("utf-8")
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/.well-known/jwks.json"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_rsa_key(kid):
+    """
+    Generate an RS256 key pair.
+
+    :param kid: The kid of the key.
+    :return: A tuple of the PEM encoded private key and the public key as a JWK.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jwt.algorithms import RSAAlgorithm
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode("utf-8")
+    public_jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return private_pem, {**public_jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+class StubLambdaClient:
+    """
+    Stand-in for the boto3 Lambda client, serving the owner lambda.
+
+    :param owners: Mapping of cognito id to owner_uuid. Unknown cognito ids get a
+        response without an owner.
+    :param latency: Seconds every invoke takes.
+    :param error: Exception every invoke raises, to simulate failures.
+    :param function_error: FunctionError every invoke returns, with ``payload`` or
+        an errorMessage as its payload, to simulate a failing owner lambda.
+    :param payload: Payload every invoke returns instead of the owner.
+    """
+
+    def __init__(
+        self, owners, latency=0.0, error=None, function_error=None, payload=None
+    ):
+        self.owners = owners
+        self.latency = latency
+        self.error = error
+        self.function_error = function_error
+        self.payload = payload
+        self.invocations = 0
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.invocations += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        cognito_id = json.loads(Payload)["cognito_id"]
+        owner_uuid = self.owners.get(cognito_id)
+        result = {"StatusCode": 200}
+        if self.function_error is not None:
+            result["FunctionError"] = self.function_error
+        if self.payload is not None:
+            response = self.payload
+        elif self.function_error is not None:
+            response = {"errorMessage": "boom", "errorType": "RuntimeError"}
+        elif owner_uuid is None:
+            response = {"owner": None}
+        else:
+            response = {
+                "owner": {
+                    "first_name": "John",
+                    "last_name": "Doe",
+                    "email_address": "john.doe@example.com",
+                    "phone_number": "1234567890",
+                    "owner_uuid": owner_uuid,
+                }
+            }
+        return {**result, "Payload": io.BytesIO(json.dumps(response).encode())}
+
+
+class StubDynamoDBClient:
+    """
+    Stand-in for the boto3 DynamoDB client, serving GetItem from a single table.
+
+    :param items: Mapping of key to item, in DynamoDB attribute value format.
+    :param key: Name of the partition key of the table.
+    """
+
+    def __init__(self, items, key="cognito_id"):
+        self.items = items
+        self.key = key
+        self.requests = []
+
+    def get_item(self, TableName, Key, **kwargs):
+        self.requests.append({"TableName": TableName, "Key": Key, **kwargs})
+        item = self.items.get(Key[self.key]["S"])
+        return {} if item is None else {"Item": item}
+
+
+class StubSecretsManagerClient:
+    """
+    Stand-in for the boto3 Secrets Manager client, serving GetSecretValue.
+
+    :param secrets: Mapping of secret id to SecretString. It can be changed at any
+        time to simulate a rotation. ``requests`` counts the requests served.
+    """
+
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.requests = 0
+
+    def get_secret_value(self, SecretId):
+        from botocore.exceptions import ClientError
+
+        self.requests += 1
+        if SecretId not in self.secrets:
+            raise ClientError(
+                {"Error": {"Code": "ResourceNotFoundException"}}, "GetSecretValue"
+            )
+        return {"Name": SecretId, "SecretString": self.secrets[SecretId]}
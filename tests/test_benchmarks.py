@@ -0,0 +1,198 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+import jwt
+
+from authorizer_lambda import util
+from authorizer_lambda.config import config
+from tests.benchmarks import replay, verifiers
+from tests.benchmarks.harness import (
+    BenchmarkResult,
+    find_regressions,
+    load_baseline,
+    run_benchmark,
+    save_baseline,
+)
+from tests.benchmarks.run import authorizer_benchmarks, main_cli
+
+
+class TestHarness(unittest.TestCase):
+    def test_run_benchmark(self):
+        calls = []
+        result = run_benchmark(
+            "append", lambda: calls.append(1), 100, warmup=10, rounds=2
+        )
+        self.assertEqual(len(calls), 210)
+        self.assertEqual(result.name, "append")
+        self.assertEqual(result.iterations, 100)
+        self.assertGreater(result.ops_per_sec, 0)
+        self.assertLessEqual(result.p50_us, result.p99_us)
+        self.assertIn("append", result.format())
+
+    def test_find_regressions(self):
+        baseline = {
+            "fast": {"ops_per_sec": 1000.0, "p50_us": 10.0},
+            "slow": {"ops_per_sec": 1000.0, "p50_us": 10.0},
+        }
+        results = [
+            BenchmarkResult("fast", 100, 900.0, 11.0, 50.0),
+            BenchmarkResult("slow", 100, 700.0, 20.0, 50.0),
+            BenchmarkResult("new", 100, 1.0, 1000.0, 1000.0),
+        ]
+        regressions = find_regressions(results, baseline, threshold=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(r.startswith("slow:") for r in regressions))
+
+    def test_baseline_roundtrip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "baseline.json"
+            self.assertEqual(load_baseline(path), {})
+            result = BenchmarkResult("bench", 10, 100.0, 1.0, 2.0)
+            save_baseline(path, [result])
+            self.assertEqual(load_baseline(path), {"bench": result._asdict()})
+
+
+class TestAuthorizerBenchmarks(unittest.TestCase):
+    def test_every_path_runs(self):
+        with authorizer_benchmarks() as benches:
+            self.assertEqual(
+                set(benches),
+                {
+                    "dev_token",
+                    "dev_token_keyring",
+                    "cognito_token",
+                    "owner_lookup_invoke",
+                    "owner_lookup_cached",
+                    "generate_policy",
+                    "build_policy_response",
+                    "revocation_miss",
+                    "revocation_hit",
+                    "handler_dev_token",
+                    "handler_cached",
+                },
+            )
+            for name, func in benches.items():
+                with self.subTest(name=name):
+                    run_benchmark(name, func, iterations=5, warmup=1, rounds=1)
+            self.assertEqual(
+                benches["handler_cached"]()["principalId"],
+                "a-b-c-d",
+            )
+            self.assertFalse(benches["revocation_miss"]())
+            self.assertTrue(benches["revocation_hit"]())
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = str(Path(directory) / "baseline.json")
+            args = ["--iterations", "5", "--rounds", "1", "-k", "dev_token"]
+            args += ["--baseline", baseline]
+            self.assertEqual(main_cli(args + ["--save-baseline"]), 0)
+            self.assertEqual(main_cli(args + ["--threshold", "1000"]), 0)
+
+
+class TestVerifierBenchmarks(unittest.TestCase):
+    def test_every_backend_runs(self):
+        for backend in verifiers.BACKENDS:
+            with self.subTest(backend=backend):
+                benches = verifiers.verifier_benchmarks(
+                    verifiers.create_verifier(backend)
+                )
+                self.assertEqual(
+                    set(benches),
+                    {
+                        f"{backend}_hs256_key",
+                        f"{backend}_hs256",
+                        f"{backend}_rs256_key",
+                        f"{backend}_rs256",
+                    },
+                )
+                self.assertTrue(benches[f"{backend}_hs256"]())
+                self.assertTrue(benches[f"{backend}_rs256"]())
+
+    def test_import_cost(self):
+        cost = verifiers.import_cost("pyjwt", runs=1)
+        self.assertGreater(cost.import_ms, 0)
+        # PyJWT isn't imported by the verifiers module itself
+        self.assertGreater(cost.modules, 0)
+        self.assertIn("pyjwt_import", cost.format())
+
+    def test_cli(self):
+        args = ["--iterations", "5", "--rounds", "1", "--import-runs", "1"]
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(
+                verifiers.main_cli(args + ["--backend", "cryptography", "--json"]), 0
+            )
+        report = json.loads(output.getvalue())
+        self.assertEqual(
+            set(report),
+            {
+                "cryptography_import",
+                "cryptography_hs256_key",
+                "cryptography_hs256",
+                "cryptography_rs256_key",
+                "cryptography_rs256",
+            },
+        )
+
+
+class TestReplay(unittest.TestCase):
+    def test_generate_events(self):
+        events, stubs = replay.generate_events(200, principals=10, seed=1)
+        self.assertEqual(len(events), 200)
+        tokens = Counter(event["authorizationToken"] for event in events)
+        self.assertLessEqual(len(tokens), 10)
+        # A few principals make most of the requests
+        self.assertGreater(tokens.most_common(1)[0][1], 200 / 10)
+        self.assertEqual(len(stubs.jwks["keys"]), 1)
+
+    def test_replay_through_handler(self):
+        events, stubs = replay.generate_events(300, principals=20, seed=2)
+        report = replay.replay(events, stubs, workers=3)
+
+        self.assertEqual(report.events, 300)
+        self.assertEqual(report.outcomes, {"allow": 300})
+        self.assertEqual(report.jwks_fetches, 1 if stubs.owners else 0)
+        self.assertEqual(report.owner_invocations, len(stubs.owners))
+        self.assertGreater(report.token_cache_hit_ratio, 0.9)
+        self.assertEqual(sum(report.histogram().values()), 300)
+        self.assertIn("events/s", report.format())
+
+    def test_rejected_tokens_are_counted(self):
+        events, stubs = replay.generate_events(50, principals=5, seed=4)
+        expired = jwt.encode(
+            {"iss": util.DEV_ISSUER, "owner_uuid": "owner-0", "exp": 1},
+            config.dev_jwt_secret,
+            "HS256",
+        )
+        events.append(dict(events[0], authorizationToken="invalid"))
+        events.append(dict(events[0], authorizationToken=expired))
+        report = replay.replay(events, stubs, workers=2)
+        self.assertEqual(report.outcomes, {"allow": 50, "unauthorized": 2})
+
+        with patch.object(config, "reject_response", "deny"):
+            report = replay.replay(events, stubs, workers=2)
+        self.assertEqual(report.outcomes, {"allow": 50, "deny": 2})
+
+    def test_replay_through_server(self):
+        events, stubs = replay.generate_events(50, principals=5, seed=3)
+        events.append(dict(events[0], authorizationToken="invalid"))
+        report = replay.replay(events, stubs, workers=2, target="server")
+        self.assertEqual(report.outcomes, {"allow": 50, "status 401": 1})
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "events.jsonl"
+            args = ["--count", "40", "--principals", "4"]
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(replay.main_cli(["generate", str(path)] + args), 0)
+                self.assertEqual(len(path.read_text().splitlines()), 40)
+                self.assertEqual(replay.main_cli(["run", str(path), "--json"]), 0)
+            report = json.loads(output.getvalue().split("\n", 1)[1])
+            self.assertEqual(report["events"], 40)
+            self.assertEqual(report["outcomes"], {"allow": 40})
@@ -0,0 +1,252 @@
+import json
+import random
+import threading
+import time
+import unittest
+from collections import Counter
+from unittest.mock import Mock
+
+from authorizer_lambda import main
+from authorizer_lambda.cache import Cache, approximate_size
+
+THREADS = 16
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_threads(target, count=THREADS):
+    """Run the target in count threads, started at once, and re-raise any error."""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(index):
+        barrier.wait()
+        try:
+            target(index)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    if errors:
+        raise errors[0]
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = Cache(ttl=60, negative_ttl=5, max_entries=3, clock=self.clock)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("a", "default"), "default")
+        self.cache.put("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIn("a", self.cache)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3)
+
+    def test_ttl(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2, ttl=10)
+        self.cache.put("none", None)
+        self.clock.now = 5
+        self.assertNotIn("none", self.cache)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["expirations"], 2)
+        self.assertEqual(self.cache.stats()["size"], 1)
+
+    def test_zero_ttl_isnt_cached(self):
+        self.cache.put("a", 1)
+        self.cache.put("a", 2, ttl=0)
+        self.assertNotIn("a", self.cache)
+        cache = Cache(max_entries=0)
+        cache.put("a", 1)
+        self.assertNotIn("a", cache)
+
+    def test_least_recently_used_is_evicted(self):
+        for key in "abc":
+            self.cache.put(key, key)
+        self.cache.get("a")
+        self.cache.put("d", "d")
+        self.assertEqual([key for key, _, _ in self.cache.items()], ["c", "a", "d"])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_max_bytes(self):
+        cache = Cache(max_entries=100, max_bytes=100, sizeof=lambda key, value: 30)
+        for key in "abcd":
+            cache.put(key, key)
+        self.assertEqual([key for key, _, _ in cache.items()], ["b", "c", "d"])
+        self.assertEqual(cache.stats()["bytes"], 90)
+        cache.put("b", "b" * 10)
+        self.assertEqual(cache.stats()["bytes"], 90)
+        cache.clear()
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_approximate_size(self):
+        small = approximate_size("key", {"sub": "a"})
+        large = approximate_size("key", {"sub": "a", "groups": ["x" * 1000]})
+        self.assertGreater(large - small, 1000)
+
+    def test_add_keeps_cached_entries(self):
+        self.cache.put("a", 1)
+        self.assertFalse(self.cache.add("a", 2))
+        self.assertTrue(self.cache.add("b", 2, ttl=10))
+        self.assertEqual(self.cache.get("a"), 1)
+        # Added entries are the least recently used ones
+        self.cache.put("c", 3)
+        self.cache.put("d", 4)
+        self.assertNotIn("b", self.cache)
+
+    def test_items(self):
+        self.cache.put("a", 1)
+        self.clock.now = 20
+        self.assertEqual(self.cache.items(), [("a", 1, 40)])
+
+    def test_get_or_load(self):
+        load = Mock(return_value="value")
+        self.assertEqual(self.cache.get_or_load("a", load), "value")
+        self.assertEqual(self.cache.get_or_load("a", load), "value")
+        load.assert_called_once_with("a")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["loads"]), (1, 1, 1))
+
+    def test_negative_entries(self):
+        load = Mock(return_value=None)
+        self.assertIsNone(self.cache.get_or_load("a", load))
+        self.assertIsNone(self.cache.get_or_load("a", load))
+        load.assert_called_once()
+        self.assertEqual(self.cache.stats()["negative_hits"], 1)
+
+    def test_stale_entry_is_used_when_load_fails(self):
+        cache = Cache(ttl=60, max_stale=30, clock=self.clock)
+        cache.put("a", 1)
+        load = Mock(side_effect=RuntimeError("boom"))
+        self.clock.now = 89
+        self.assertEqual(cache.get_or_load("a", load), 1)
+        self.clock.now = 90
+        with self.assertRaises(RuntimeError):
+            cache.get_or_load("a", load)
+        stats = cache.stats()
+        self.assertEqual((stats["stale_hits"], stats["load_errors"]), (1, 2))
+
+    def test_stats_are_json(self):
+        self.cache.get_or_load("a", str.upper)
+        stats = json.loads(json.dumps(self.cache.stats()))
+        self.assertEqual(stats["loads"], 1)
+        self.assertGreaterEqual(stats["load_time_max_ms"], stats["load_time_avg_ms"])
+
+    def test_process_wide_cache_stats(self):
+        stats = json.loads(json.dumps(main.cache_stats()))
+        self.assertEqual(set(stats), {"verified_tokens", "owners"})
+        self.assertEqual(stats["owners"]["size"], 0)
+
+
+class TestCacheUnderLoad(unittest.TestCase):
+    def test_concurrent_misses_load_once_per_key(self):
+        cache = Cache(ttl=3600, max_entries=1000)
+        loads = Counter()
+        lock = threading.Lock()
+
+        def load(key):
+            with lock:
+                loads[key] += 1
+            time.sleep(0.001)
+            return f"value-{key}"
+
+        def hammer(index):
+            rng = random.Random(index)
+            for _ in range(500):
+                key = rng.randrange(50)
+                self.assertEqual(cache.get_or_load(key, load), f"value-{key}")
+
+        run_threads(hammer)
+        self.assertEqual(set(loads.values()), {1})
+        stats = cache.stats()
+        self.assertEqual(stats["loads"], 50)
+        self.assertEqual(
+            stats["hits"] + stats["misses"] + stats["coalesced"], THREADS * 500
+        )
+
+    def test_loads_of_different_keys_run_in_parallel(self):
+        cache = Cache()
+        # Every load waits for all the others, so this deadlocks if they're serialized
+        barrier = threading.Barrier(4)
+
+        def load(key):
+            barrier.wait(5)
+            return key
+
+        run_threads(lambda index: cache.get_or_load(index, load), count=4)
+        self.assertEqual(cache.stats()["loads"], 4)
+
+    def test_bounds_hold_under_churn(self):
+        cache = Cache(
+            ttl=0.01, max_entries=64, max_bytes=64 * 40, sizeof=lambda k, v: 40
+        )
+
+        def churn(index):
+            rng = random.Random(index)
+            for i in range(2000):
+                key = rng.randrange(500)
+                operation = rng.random()
+                if operation < 0.4:
+                    cache.put(key, i, ttl=rng.choice([None, 0.001, 1]))
+                elif operation < 0.8:
+                    cache.get(key)
+                elif operation < 0.95:
+                    cache.get_or_load(key, lambda key: None if key % 7 else key)
+                else:
+                    self.assertIsInstance(key in cache, bool)
+                if i % 100 == 0:
+                    stats = cache.stats()
+                    self.assertLessEqual(stats["size"], 64)
+                    self.assertLessEqual(stats["bytes"], 64 * 40)
+
+        run_threads(churn)
+        stats = cache.stats()
+        self.assertEqual(stats["bytes"], stats["size"] * 40)
+        self.assertLessEqual(len(cache.items()), stats["size"])
+
+    def test_waiters_get_the_error_of_a_failed_load(self):
+        cache = Cache()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def load(key):
+            started.set()
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        def lookup(index):
+            if index:
+                started.wait(5)
+            try:
+                cache.get_or_load("a", load)
+            except RuntimeError as e:
+                errors.append(e)
+
+        def release_when_coalesced():
+            while cache.stats()["coalesced"] < THREADS - 1:
+                time.sleep(0.001)
+            release.set()
+
+        threading.Thread(target=release_when_coalesced, daemon=True).start()
+        run_threads(lookup)
+        self.assertEqual(len(errors), THREADS)
+        self.assertEqual(cache.stats()["loads"], 1)
@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import Mock, patch
+from authorizer_lambda import clients
+from authorizer_lambda.config import Settings
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        self.settings = Settings(
+            aws_region="us-east-1",
+            lambda_connect_timeout=1,
+            lambda_read_timeout=4,
+            lambda_max_pool_connections=7,
+            lambda_max_attempts=3,
+            http_connect_timeout=0.5,
+            http_read_timeout=1.5,
+            http_pool_size=4,
+            http_max_retries=1,
+        )
+
+    def test_lambda_client_is_created_once(self):
+        registry = clients.Clients(self.settings)
+        lambda_client = registry.lambda_client
+        self.assertIs(registry.lambda_client, lambda_client)
+
+        client_config = lambda_client.meta.config
+        self.assertEqual(client_config.connect_timeout, 1)
+        self.assertEqual(client_config.read_timeout, 4)
+        self.assertEqual(client_config.max_pool_connections, 7)
+        self.assertEqual(client_config.retries["mode"], "standard")
+        self.assertEqual(lambda_client.meta.region_name, "us-east-1")
+
+    def test_dynamodb_client_is_created_once(self):
+        registry = clients.Clients(
+            self.settings.copy(
+                update={"dynamodb_endpoint_url": "http://localhost:8000"}
+            )
+        )
+        dynamodb_client = registry.dynamodb_client
+        self.assertIs(registry.dynamodb_client, dynamodb_client)
+
+        self.assertEqual(dynamodb_client.meta.endpoint_url, "http://localhost:8000")
+        self.assertEqual(dynamodb_client.meta.config.read_timeout, 2)
+
+    def test_dynamodb_client_has_its_own_settings(self):
+        registry = clients.Clients(
+            self.settings.copy(
+                update={
+                    "dynamodb_max_pool_connections": 3,
+                    "dynamodb_max_attempts": 5,
+                    "dynamodb_retry_mode": "adaptive",
+                }
+            )
+        )
+        client_config = registry.dynamodb_client.meta.config
+        self.assertEqual(client_config.max_pool_connections, 3)
+        # botocore counts the first attempt too
+        self.assertEqual(client_config.retries["total_max_attempts"], 6)
+        self.assertEqual(client_config.retries["mode"], "adaptive")
+
+    def test_secretsmanager_client_is_created_once(self):
+        registry = clients.Clients(self.settings)
+        secretsmanager_client = registry.secretsmanager_client
+        self.assertIs(registry.secretsmanager_client, secretsmanager_client)
+
+        self.assertEqual(
+            secretsmanager_client.meta.service_model.service_name, "secretsmanager"
+        )
+        self.assertEqual(secretsmanager_client.meta.config.connect_timeout, 1)
+
+    def test_secretsmanager_client_has_its_own_settings(self):
+        registry = clients.Clients(
+            self.settings.copy(
+                update={
+                    "secretsmanager_max_attempts": 4,
+                    "secretsmanager_retry_mode": "legacy",
+                }
+            )
+        )
+        client_config = registry.secretsmanager_client.meta.config
+        # botocore counts the first attempt too
+        self.assertEqual(client_config.retries["total_max_attempts"], 5)
+        self.assertEqual(client_config.retries["mode"], "legacy")
+
+    def test_http_session_is_created_once(self):
+        registry = clients.Clients(self.settings)
+        session = registry.http
+        self.assertIs(registry.http, session)
+
+        adapter = session.get_adapter("https://cognito-idp.us-east-1.amazonaws.com")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 1)
+        self.assertEqual(registry.http_timeout, (0.5, 1.5))
+
+    def test_injected_clients(self):
+        lambda_client = Mock()
+        http = Mock()
+        registry = clients.Clients(lambda_client=lambda_client, http=http)
+        self.assertIs(registry.lambda_client, lambda_client)
+        self.assertIs(registry.http, http)
+
+
+class TestGetClients(unittest.TestCase):
+    def test_registry_is_shared(self):
+        registry = clients.get_clients()
+        self.assertIs(clients.get_clients(), registry)
+
+    def test_set_clients(self):
+        registry = clients.Clients()
+        clients.set_clients(registry)
+        self.assertIs(clients.get_clients(), registry)
+
+        clients.set_clients(None)
+        self.assertIsNot(clients.get_clients(), registry)
+
+    @patch("boto3.client")
+    def test_lambda_client_is_lazy(self, mock_boto3_client):
+        registry = clients.Clients()
+        mock_boto3_client.assert_not_called()
+        registry.lambda_client
+        registry.lambda_client
+        mock_boto3_client.assert_called_once()
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# Budget for the cumulative import time of authorizer_lambda.main, in milliseconds
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "250"))
+
+# Modules that are only needed on the Cognito token path
+LAZY_MODULES = ["boto3", "botocore", "requests", "jwt", "jose", "cryptography"]
+
+
+def import_times(module):
+    """
+    Import the module in a fresh interpreter with ``-X importtime``.
+
+    :return: A dict of the cumulative import time of every imported module, in
+        microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestColdStart(unittest.TestCase):
+    def test_heavy_dependencies_are_imported_lazily(self):
+        times = import_times("authorizer_lambda.main")
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_import_time_budget(self):
+        # The fastest of a few imports, so other tests running in parallel don't
+        # make it fail
+        import_time_ms = min(
+            import_times("authorizer_lambda.main")["authorizer_lambda.main"] / 1000
+            for _ in range(3)
+        )
+        self.assertLessEqual(import_time_ms, IMPORT_TIME_BUDGET_MS)
@@ -0,0 +1,207 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import jwt
+from botocore.exceptions import ClientError
+
+from authorizer_lambda import util
+from authorizer_lambda.clients import Clients, set_clients
+from authorizer_lambda.config import config
+from authorizer_lambda.dev_keyring import (
+    DevKeyring,
+    FileSecretSource,
+    SecretSource,
+    SecretsManagerSecretSource,
+    SettingsSecretSource,
+    create_secret_source,
+    get_dev_keyring,
+)
+from tests.stubs import StubSecretsManagerClient
+
+SECRET_A = "a" * 32
+SECRET_B = "b" * 32
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DictSecretSource(SecretSource):
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.loads = 0
+        self.error = None
+
+    def load(self):
+        self.loads += 1
+        if self.error is not None:
+            raise self.error
+        return dict(self.secrets)
+
+
+def dev_token(secret, kid=None):
+    headers = {"kid": kid} if kid is not None else None
+    payload = {"iss": util.DEV_ISSUER, "owner_uuid": "a-b-c-d"}
+    return jwt.encode(payload, secret, algorithm="HS256", headers=headers)
+
+
+class TestDevKeyring(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.source = DictSecretSource({"a": SECRET_A, "b": SECRET_B})
+        self.keyring = DevKeyring(self.source, ttl=60, clock=self.clock)
+
+    def test_secret_is_selected_by_kid(self):
+        for kid, secret in [("a", SECRET_A), ("b", SECRET_B)]:
+            with self.subTest(kid=kid):
+                payload = util.verify_dev_token(dev_token(secret, kid), self.keyring)
+                self.assertEqual(payload["owner_uuid"], "a-b-c-d")
+        self.assertEqual(self.source.loads, 1)
+
+    def test_wrong_secret_for_kid(self):
+        with self.assertRaises(ValueError):
+            util.verify_dev_token(dev_token(SECRET_B, "a"), self.keyring)
+
+    def test_unknown_kid(self):
+        with self.assertRaises(ValueError):
+            util.verify_dev_token(dev_token(SECRET_A, "c"), self.keyring)
+        for kid in [1, ["a"]]:
+            with self.subTest(kid=kid):
+                self.assertFalse(self.keyring.verify(kid, b"header.payload", b""))
+
+    def test_token_without_kid_uses_default_kid(self):
+        self.source.secrets["default"] = SECRET_A
+        util.verify_dev_token(dev_token(SECRET_A), self.keyring)
+        keyring = DevKeyring(self.source, default_kid="b")
+        util.verify_dev_token(dev_token(SECRET_B), keyring)
+
+    def test_refresh_in_background_after_ttl(self):
+        self.assertEqual(self.keyring.kids(), {"a", "b"})
+        self.source.secrets = {"b": SECRET_B, "c": SECRET_A}
+
+        self.clock.now = 59
+        self.assertEqual(self.keyring.kids(), {"a", "b"})
+        self.clock.now = 60
+        self.keyring.kids()
+        self.keyring._background_refresh.join()
+        self.assertEqual(self.keyring.kids(), {"b", "c"})
+        self.assertEqual(self.source.loads, 2)
+
+    def test_failed_refresh_keeps_secrets(self):
+        self.keyring.kids()
+        self.source.error = RuntimeError("Secrets Manager is down")
+        self.clock.now = 60
+        with self.assertLogs("authorizer_lambda.dev_keyring", "WARNING"):
+            self.keyring.kids()
+            self.keyring._background_refresh.join()
+        self.assertEqual(self.keyring.kids(), {"a", "b"})
+        # The next attempt waits for another ttl
+        self.assertEqual(self.source.loads, 2)
+
+    def test_first_load_errors_are_raised(self):
+        self.source.error = RuntimeError("Secrets Manager is down")
+        with self.assertRaises(RuntimeError):
+            util.verify_dev_token(dev_token(SECRET_A, "a"), self.keyring)
+
+    def test_invalid_secrets(self):
+        for secrets in [["a"], {"a": 1}]:
+            with self.subTest(secrets=secrets):
+                self.source.load = lambda: secrets
+                with self.assertRaises(ValueError):
+                    DevKeyring(self.source).kids()
+
+    def test_concurrent_first_use_loads_once(self):
+        keyring = DevKeyring(self.source)
+        barrier = threading.Barrier(8)
+
+        def verify():
+            barrier.wait()
+            util.verify_dev_token(dev_token(SECRET_A, "a"), keyring)
+
+        threads = [threading.Thread(target=verify) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.source.loads, 1)
+
+
+class TestSecretSources(unittest.TestCase):
+    def test_settings(self):
+        settings = config.copy(update={"dev_jwt_secrets": {"a": SECRET_A}})
+        self.assertEqual(
+            SettingsSecretSource(settings).load(),
+            {"default": config.dev_jwt_secret, "a": SECRET_A},
+        )
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "secrets.json"
+            path.write_text(json.dumps({"a": SECRET_A}))
+            self.assertEqual(FileSecretSource(str(path)).load(), {"a": SECRET_A})
+
+    def test_secrets_manager(self):
+        client = StubSecretsManagerClient({"dev-secrets": json.dumps({"a": SECRET_A})})
+        set_clients(Clients(secretsmanager_client=client))
+        source = SecretsManagerSecretSource("dev-secrets")
+        self.assertEqual(source.load(), {"a": SECRET_A})
+        with self.assertRaises(ClientError):
+            SecretsManagerSecretSource("other").load()
+
+    def test_rotation_through_secrets_manager(self):
+        client = StubSecretsManagerClient({"dev-secrets": json.dumps({"a": SECRET_A})})
+        set_clients(Clients(secretsmanager_client=client))
+        clock = FakeClock()
+        keyring = DevKeyring(
+            SecretsManagerSecretSource("dev-secrets"), ttl=300, clock=clock
+        )
+        util.verify_dev_token(dev_token(SECRET_A, "a"), keyring)
+
+        client.secrets["dev-secrets"] = json.dumps({"a": SECRET_A, "b": SECRET_B})
+        clock.now = 300
+        keyring.kids()
+        keyring._background_refresh.join()
+        util.verify_dev_token(dev_token(SECRET_B, "b"), keyring)
+        self.assertEqual(client.requests, 2)
+
+    def test_create_secret_source(self):
+        settings = config.copy(
+            update={
+                "dev_jwt_secrets_file": "secrets.json",
+                "dev_jwt_secret_id": "dev-secrets",
+            }
+        )
+        for name, cls in [
+            ("env", SettingsSecretSource),
+            ("file", FileSecretSource),
+            ("secretsmanager", SecretsManagerSecretSource),
+        ]:
+            with self.subTest(name=name):
+                source = create_secret_source(
+                    settings.copy(update={"dev_jwt_secret_source": name})
+                )
+                self.assertIsInstance(source, cls)
+        with self.assertRaises(ValueError):
+            create_secret_source(config.copy(update={"dev_jwt_secret_source": "x"}))
+
+    def test_create_secret_source_requires_its_setting(self):
+        for name in ["file", "secretsmanager"]:
+            with self.subTest(name=name):
+                with self.assertRaises(ValueError):
+                    create_secret_source(
+                        config.copy(update={"dev_jwt_secret_source": name})
+                    )
+
+    def test_default_keyring_verifies_the_configured_secret(self):
+        token = jwt.encode(
+            {"iss": util.DEV_ISSUER}, config.dev_jwt_secret, algorithm="HS256"
+        )
+        self.assertIs(get_dev_keyring(), get_dev_keyring())
+        util.verify_dev_token(token, get_dev_keyring())
@@ -0,0 +1,93 @@
+import json
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from authorizer_lambda.config import Settings
+from authorizer_lambda.disk_cache import DiskCache, disk_cache_from_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name) / "cache"
+        self.clock = FakeClock()
+        self.cache = DiskCache(self.directory, clock=self.clock)
+
+    def test_write_and_read(self):
+        self.assertIsNone(self.cache.read("owners"))
+        self.cache.write("owners", {"sub": ["owner", 1300.0]})
+        self.clock.now = 1030
+
+        self.assertEqual(self.cache.read("owners"), ({"sub": ["owner", 1300.0]}, 30))
+        self.assertEqual(
+            [path.name for path in self.directory.iterdir()], ["owners.json"]
+        )
+
+    def test_write_replaces_document(self):
+        self.cache.write("owners", {"sub": ["owner", 1300.0]})
+        self.cache.write("owners", {})
+        self.assertEqual(self.cache.read("owners"), ({}, 0))
+
+    def test_unreadable_document(self):
+        self.directory.mkdir()
+        (self.directory / "owners.json").write_text("{not json")
+        self.assertIsNone(self.cache.read("owners"))
+        (self.directory / "owners.json").write_text(json.dumps({"value": {}}))
+        self.assertIsNone(self.cache.read("owners"))
+
+    def test_failed_write_is_ignored(self):
+        self.directory.parent.joinpath("cache").write_text("not a directory")
+        with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+            self.cache.write("owners", {})
+
+    def test_unserialisable_document_leaves_no_file(self):
+        with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+            self.cache.write("owners", {"sub": object()})
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_directory_is_private(self):
+        self.cache.write("owners", {})
+        self.assertEqual(stat.S_IMODE(self.directory.stat().st_mode) & 0o077, 0)
+
+    def test_directory_writable_by_others_isnt_used(self):
+        self.cache.write("jwks", {"keys": []})
+        self.directory.chmod(0o777)
+        with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+            self.assertIsNone(self.cache.read("jwks"))
+        with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+            self.cache.write("jwks", {"keys": []})
+
+    def test_directory_of_other_user_isnt_used(self):
+        self.cache.write("jwks", {"keys": []})
+        with patch.object(os, "getuid", return_value=os.getuid() + 1):
+            with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+                self.assertIsNone(self.cache.read("jwks"))
+
+    def test_symlinked_directory_isnt_used(self):
+        self.cache.write("jwks", {"keys": []})
+        link = self.directory.with_name("link")
+        link.symlink_to(self.directory)
+        with self.assertLogs("authorizer_lambda.disk_cache", "WARNING"):
+            self.assertIsNone(DiskCache(link).read("jwks"))
+
+
+class TestDiskCacheFromSettings(unittest.TestCase):
+    def test_disabled_by_default(self):
+        self.assertIsNone(disk_cache_from_settings(Settings()))
+
+    def test_enabled(self):
+        cache = disk_cache_from_settings(Settings(disk_cache_dir="/tmp/authorizer"))
+        self.assertEqual(cache.directory, Path("/tmp/authorizer"))
@@ -1,9 +1,15 @@
 from pathlib import Path
+import base64
+import tempfile
+import threading
+import time
 import unittest
 import json
 from authorizer_lambda import main, util, verify_cognito_token
-from authorizer_lambda.config import config
-from unittest.mock import patch, MagicMock
+from authorizer_lambda.config import CognitoPool, config
+from unittest.mock import MagicMock, patch
+from authorizer_lambda.clients import Clients, set_clients
+from authorizer_lambda.disk_cache import DiskCache
 from authorizer_lambda.models import (
     AuthorizationResponse,
     PolicyDocument,
@@ -13,10 +19,42 @@ from authorizer_lambda.models import (
     Owner,
 )
 import io
+import jwt
+import pytest
+from authorizer_lambda.owner_cache import OwnerNotFoundError
+from authorizer_lambda.precheck import TokenRejected
+from authorizer_lambda.owner_resolvers import (
+    OwnerLookupError,
+    OwnerResolver,
+    StaticOwnerResolver,
+    set_owner_resolver,
+)
+from authorizer_lambda.resilience import CircuitOpenError, DeadlineExceeded
+from tests.stubs import JWKSServer, StubLambdaClient, make_rsa_key
 from jwt.exceptions import InvalidTokenError
 from botocore.exceptions import BotoCoreError, ClientError
 
 
+def unsigned_cognito_token(payload):
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=")
+
+    header = encode({"alg": "RS256", "kid": "testKid"})
+    return b".".join([header, encode(payload), b"c2ln"]).decode()
+
+
+def cognito_request(name):
+    """Load a request of tests/data, with a token issued by the configured pool."""
+    request = json.load((Path(__file__).parent / "data" / name).open("rt"))
+    issuer = verify_cognito_token.cognito_issuer(config.cognito_user_pool_id)
+    token = unsigned_cognito_token({"iss": issuer, "sub": "some_sub"})
+    if request["type"] == "REQUEST":
+        request["headers"]["Authorization"] = f"Bearer {token}"
+    else:
+        request["authorizationToken"] = token
+    return request
+
+
 def test_handler(mocker):
     mock_verify_dev_token = mocker.patch.object(util, "verify_dev_token")
     mock_verify_dev_token.return_value = {"owner_uuid": "a-b-c-d"}
@@ -39,7 +77,7 @@ def test_handler(mocker):
     assert response == expected
     assert mock_verify_dev_token.call_count == 1
     assert len(mock_verify_dev_token.call_args[0]) == 2
-    assert mock_verify_dev_token.call_args[0][0] == token
+    assert mock_verify_dev_token.call_args[0][0].raw == token
 
 
 def test_handler_cognito_token(mocker):
@@ -47,11 +85,156 @@ def test_handler_cognito_token(mocker):
         verify_cognito_token, "verify_cognito_token"
     )
     mock_verify_cognito_token.return_value = {"sub": "some_sub"}
-    mocker.patch.object(util, "is_dev_token", return_value=False)
     mocker.patch.object(main, "get_owner_uuid", return_value="owner_uuid")
+    request = cognito_request("authorization_request.json")
+    response = main.handler(request, {})
+    expected = AuthorizationResponse(
+        principalId="owner_uuid",
+        policyDocument=PolicyDocument(
+            Statement=[
+                PolicyStatement(
+                    Effect=StatementEffect.ALLOW,
+                    Action="execute-api:Invoke",
+                    Resource="arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/backend_api_gw_stage_dev/*/api/a-b-c-d/*",
+                )
+            ]
+        ),
+    ).dict()
+    assert response == expected
+
+
+def test_handler_owner_from_claim(mocker, capsys):
+    mocker.patch.object(config, "owner_claim", "custom:owner_uuid")
+    mocker.patch.object(
+        verify_cognito_token,
+        "verify_cognito_token",
+        return_value={"sub": "some_sub", "custom:owner_uuid": "claimed_owner"},
+    )
+    mock_get_owner_uuid = mocker.patch.object(main, "get_owner_uuid")
+    request = cognito_request("authorization_request.json")
+    response = main.handler(request, {})
+
+    assert response["principalId"] == "claimed_owner"
+    assert mock_get_owner_uuid.call_count == 0
+    document = json.loads(capsys.readouterr().out)
+    assert document["OwnerFromClaim"] == 1
+    assert "owner_lookup" not in document
+
+
+@pytest.mark.parametrize("owner", ["*", "other/*", "a?c", ""])
+def test_handler_wildcard_owner_claim_is_rejected(mocker, owner):
+    mocker.patch.object(config, "owner_claim", "custom:owner_uuid")
+    mocker.patch.object(
+        verify_cognito_token,
+        "verify_cognito_token",
+        return_value={"sub": "some_sub", "custom:owner_uuid": owner},
+    )
+    mocker.patch.object(main, "get_owner_uuid", return_value=owner)
+    request = cognito_request("request_authorization_request.json")
+    with pytest.raises(Exception, match="^Unauthorized$"):
+        main.handler(request, {})
+    assert main.verified_tokens.stats()["size"] == 0
+
+
+@pytest.mark.parametrize("claims", [{"owner_uuid": "a/*"}, {}])
+def test_handler_invalid_dev_owner_is_denied(mocker, claims):
+    mocker.patch.object(config, "reject_response", "deny")
+    request = cognito_request("request_authorization_request.json")
+    request["headers"]["Authorization"] = jwt.encode(
+        {"iss": util.DEV_ISSUER, **claims}, config.dev_jwt_secret, "HS256"
+    )
+    response = main.handler(request, {})
+    statement = response["policyDocument"]["Statement"][0]
+    assert statement["Effect"] == "Deny"
+
+
+def test_handler_owner_claim_missing(mocker):
+    mocker.patch.object(config, "owner_claim", "custom:owner_uuid")
+    mocker.patch.object(
+        verify_cognito_token,
+        "verify_cognito_token",
+        return_value={"sub": "some_sub", "custom:owner_uuid": ""},
+    )
+    mock_get_owner_uuid = mocker.patch.object(
+        main, "get_owner_uuid", return_value="owner_uuid"
+    )
+    request = cognito_request("authorization_request.json")
+    response = main.handler(request, {})
+
+    assert response["principalId"] == "owner_uuid"
+    mock_get_owner_uuid.assert_called_once_with(
+        cognito_id="some_sub", settings=config, speculative=None
+    )
+
+
+def test_owner_from_claims():
+    settings = config.copy(update={"owner_claim": "custom:owner_uuid"})
+    assert main.owner_from_claims({"custom:owner_uuid": "owner"}, settings) == "owner"
+    assert main.owner_from_claims({"custom:owner_uuid": 1}, settings) is None
+    assert main.owner_from_claims({}, settings) is None
+    assert main.owner_from_claims({"custom:owner_uuid": "owner"}, config) is None
+
+
+def test_handler_caches_verified_token(mocker):
+    mock_verify_cognito_token = mocker.patch.object(
+        verify_cognito_token, "verify_cognito_token"
+    )
+    mock_verify_cognito_token.return_value = {"sub": "some_sub"}
+    mock_get_owner_uuid = mocker.patch.object(
+        main, "get_owner_uuid", return_value="owner_uuid"
+    )
+    request = cognito_request("authorization_request.json")
+    first = main.handler(request, {})
+    second = main.handler(request, {})
+
+    assert first == second
+    assert mock_verify_cognito_token.call_count == 1
+    assert mock_get_owner_uuid.call_count == 1
+    assert main.verified_tokens.stats()["hits"] == 1
+
+
+def test_handler_emits_metrics(mocker, capsys):
+    mocker.patch.object(
+        verify_cognito_token, "verify_cognito_token", return_value={"sub": "some_sub"}
+    )
+    set_owner_resolver(StaticOwnerResolver({"some_sub": "owner_uuid"}))
+    request = cognito_request("authorization_request.json")
+    main.handler(request, {})
+    main.handler(request, {})
+
+    first, second = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert first["TokenType"] == "cognito"
+    assert first["TokenCacheHit"] == 0
+    assert first["OwnerCacheHit"] == 0
+    for stage in ["parse", "route", "verify", "owner_lookup", "owner_invoke", "policy"]:
+        assert stage in first
+    assert second["TokenCacheHit"] == 1
+    assert second["TokenType"] == "cognito"
+    assert "verify" not in second
+
+
+def test_handler_metrics_for_errors(capsys):
+    main.handler({"type": "TOKEN"}, {})
+    document = json.loads(capsys.readouterr().out)
+    assert document["Error"] == "ValidationError"
+
+
+def test_handler_metrics_disabled(mocker, capsys):
+    mocker.patch.object(config, "metrics_enabled", False)
+    mocker.patch.object(util, "verify_dev_token", return_value={"owner_uuid": "a"})
     request = json.load(
         (Path(__file__).parent / "data/authorization_request.json").open("rt")
     )
+    main.handler(request, {})
+    assert capsys.readouterr().out == ""
+
+
+def test_handler_request_authorizer(mocker):
+    mocker.patch.object(
+        verify_cognito_token, "verify_cognito_token", return_value={"sub": "some_sub"}
+    )
+    mocker.patch.object(main, "get_owner_uuid", return_value="owner_uuid")
+    request = cognito_request("request_authorization_request.json")
     response = main.handler(request, {})
     expected = AuthorizationResponse(
         principalId="owner_uuid",
@@ -60,7 +243,7 @@ def test_handler_cognito_token(mocker):
                 PolicyStatement(
                     Effect=StatementEffect.ALLOW,
                     Action="execute-api:Invoke",
-                    Resource="arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/backend_api_gw_stage_dev/*/api/a-b-c-d/*",
+                    Resource="arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/backend_api_gw_stage_dev/*/api/owner_uuid/*",
                 )
             ]
         ),
@@ -68,6 +251,35 @@ def test_handler_cognito_token(mocker):
     assert response == expected
 
 
+def test_handler_request_authorizer_dev_token():
+    request = json.load(
+        (Path(__file__).parent / "data/request_authorization_request.json").open("rt")
+    )
+    response = main.handler(request, {})
+    assert response["principalId"] == "a-b-c-d"
+
+
+def test_handler_request_authorizer_missing_token(capsys):
+    request = json.load(
+        (Path(__file__).parent / "data/request_authorization_request.json").open("rt")
+    )
+    del request["headers"]["Authorization"]
+    with pytest.raises(Exception, match="^Unauthorized$"):
+        main.handler(request, {})
+    document = json.loads(capsys.readouterr().out)
+    assert document["RejectReason"] == "missing"
+
+
+def test_handler_request_authorizer_missing_token_deny(mocker):
+    mocker.patch.object(config, "reject_response", "deny")
+    request = json.load(
+        (Path(__file__).parent / "data/request_authorization_request.json").open("rt")
+    )
+    del request["headers"]["Authorization"]
+    response = main.handler(request, {})
+    assert response["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
 def test_handler_invalid_token_error(mocker):
     mocker.patch.object(util, "verify_dev_token", side_effect=InvalidTokenError)
     request = {"type": "TOKEN"}  # missing methodArn and authorizationToken
@@ -109,6 +321,44 @@ def test_handler_general_exception(mocker):
     }
 
 
+def test_handler_rejected_token(mocker, capsys):
+    mock_verify_dev_token = mocker.patch.object(util, "verify_dev_token")
+    request = json.load(
+        (Path(__file__).parent / "data/authorization_request.json").open("rt")
+    )
+    request["authorizationToken"] = "not-a-token"
+    with pytest.raises(Exception, match="^Unauthorized$"):
+        main.handler(request, {})
+    mock_verify_dev_token.assert_not_called()
+    document = json.loads(capsys.readouterr().out)
+    assert document["RejectReason"] == "malformed"
+
+
+@pytest.mark.parametrize("claim", ["exp", "nbf", "iat"])
+def test_handler_null_time_claim(claim):
+    request = json.load(
+        (Path(__file__).parent / "data/authorization_request.json").open("rt")
+    )
+    request["authorizationToken"] = jwt.encode(
+        {"iss": util.DEV_ISSUER, "owner_uuid": "a-b-c-d", claim: None},
+        config.dev_jwt_secret,
+        "HS256",
+    )
+    with pytest.raises(Exception, match="^Unauthorized$"):
+        main.handler(request, {})
+
+
+def test_handler_rejected_token_deny(mocker):
+    mocker.patch.object(config, "reject_response", "deny")
+    request = json.load(
+        (Path(__file__).parent / "data/authorization_request.json").open("rt")
+    )
+    request["authorizationToken"] = "not-a-token"
+    response = main.handler(request, {})
+    assert response["principalId"] == "unauthorized"
+    assert response["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
 def test_handler_unsupported_authorization_type():
     request = {"type": "FOO", "authorizationToken": "bar", "methodArn": "some-arn"}
     response = main.handler(request, {})
@@ -135,18 +385,14 @@ def test_handler_missing_payload_keys(mocker):
         verify_cognito_token, "verify_cognito_token"
     )
     mock_verify_cognito_token.return_value = {}  # Return an empty payload
-    mocker.patch.object(util, "is_dev_token", return_value=False)
-    request_cognito_token = json.load(
-        (Path(__file__).parent / "data/authorization_request.json").open("rt")
-    )
+    request_cognito_token = cognito_request("authorization_request.json")
     response_cognito_token = main.handler(request_cognito_token, {})
     assert response_cognito_token["message"].startswith("An unexpected error occurred:")
     assert response_cognito_token["statusCode"] == 500
 
 
 class TestGetOwnerUuid(unittest.TestCase):
-    @patch("authorizer_lambda.main.boto3.client")
-    def test_get_owner_uuid_success(self, mock_boto3_client):
+    def test_get_owner_uuid_success(self):
         cognito_id = "testCognitoId"
         owner_uuid = "testOwnerUuid"
 
@@ -165,22 +411,336 @@ class TestGetOwnerUuid(unittest.TestCase):
         mock_lambda_client.invoke.return_value = {
             "Payload": io.BytesIO(owner_response.json().encode("utf-8"))
         }
-        mock_boto3_client.return_value = mock_lambda_client
+        set_clients(Clients(lambda_client=mock_lambda_client))
 
         result = main.get_owner_uuid(cognito_id=cognito_id, settings=config)
 
         self.assertEqual(result, owner_uuid)
 
-    @patch("authorizer_lambda.main.boto3.client")
-    def test_get_owner_uuid_failure(self, mock_boto3_client):
+    def test_get_owner_uuid_failure(self):
         cognito_id = "testCognitoId"
 
         # Creating a MagicMock for the lambda client
         mock_lambda_client = MagicMock()
         mock_lambda_client.invoke.side_effect = Exception("Lambda invocation failed")
 
-        mock_boto3_client.return_value = mock_lambda_client
+        set_clients(Clients(lambda_client=mock_lambda_client))
 
         with self.assertRaises(Exception) as context:
             main.get_owner_uuid(cognito_id=cognito_id, settings=config)
         self.assertTrue("Lambda invocation failed" in str(context.exception))
+
+    def test_get_owner_uuid_is_cached(self):
+        owner_response = OwnerResponse(
+            owner=Owner(
+                owner_uuid="testOwnerUuid",
+                first_name="John",
+                last_name="Doe",
+                email_address="john.doe@example.com",
+                phone_number="1234567890",
+            )
+        )
+        mock_lambda_client = MagicMock()
+        mock_lambda_client.invoke.return_value = {
+            "Payload": io.BytesIO(owner_response.json().encode("utf-8"))
+        }
+        set_clients(Clients(lambda_client=mock_lambda_client))
+
+        for _ in range(3):
+            result = main.get_owner_uuid(cognito_id="testCognitoId", settings=config)
+            self.assertEqual(result, "testOwnerUuid")
+        mock_lambda_client.invoke.assert_called_once()
+
+    def test_get_owner_uuid_not_found(self):
+        mock_lambda_client = MagicMock()
+        mock_lambda_client.invoke.return_value = {
+            "Payload": io.BytesIO(json.dumps({"owner": None}).encode("utf-8"))
+        }
+        set_clients(Clients(lambda_client=mock_lambda_client))
+
+        for _ in range(2):
+            with self.assertRaises(OwnerNotFoundError):
+                main.get_owner_uuid(cognito_id="testCognitoId", settings=config)
+        mock_lambda_client.invoke.assert_called_once()
+
+
+class TestPrewarm(unittest.TestCase):
+    def test_prewarm(self):
+        mock_lambda_client = MagicMock()
+        mock_http = MagicMock()
+        mock_http.get.return_value.status_code = 200
+        _, public_jwk = make_rsa_key("testKid")
+        mock_http.get.return_value.json.return_value = {"keys": [public_jwk]}
+        set_clients(Clients(lambda_client=mock_lambda_client, http=mock_http))
+
+        timings = main.prewarm(config)
+
+        self.assertEqual(
+            set(timings),
+            {
+                "dev_keyring",
+                "owner_resolver",
+                "http_session",
+                "crypto",
+                "jwks",
+                "verify_dev",
+                "verify_cognito",
+            },
+        )
+        mock_http.get.assert_called_once()
+        self.assertEqual(
+            mock_http.get.call_args[0][0],
+            verify_cognito_token.jwks_url(config.cognito_user_pool_id),
+        )
+
+    def test_prewarm_failing_step_is_skipped(self):
+        mock_http = MagicMock()
+        mock_http.get.side_effect = Exception("Cognito is down")
+        set_clients(Clients(lambda_client=MagicMock(), http=mock_http))
+
+        timings = main.prewarm(config)
+
+        self.assertEqual(
+            set(timings),
+            {"dev_keyring", "owner_resolver", "http_session", "crypto", "verify_dev"},
+        )
+
+
+class TestWarmup(unittest.TestCase):
+    def test_is_warmup_event(self):
+        for event in [
+            {"warmup": True},
+            {"source": "serverless-plugin-warmup"},
+            {"source": "aws.events", "detail-type": "Scheduled Event", "detail": {}},
+        ]:
+            with self.subTest(event=event):
+                self.assertTrue(main.is_warmup_event(event))
+        for event in [
+            {"warmup": "true"},
+            {"source": "aws.events", "detail-type": "EC2 Instance State-change"},
+            {"type": "TOKEN", "authorizationToken": "x", "methodArn": "y"},
+            [],
+        ]:
+            with self.subTest(event=event):
+                self.assertFalse(main.is_warmup_event(event))
+
+    def test_handler_warmup(self):
+        with patch.object(main, "prewarm", return_value={"crypto": 1.5}) as prewarm:
+            response = main.handler({"warmup": True}, {})
+        prewarm.assert_called_once_with(config)
+        self.assertEqual(response, {"warmup": True, "timings": {"crypto": 1.5}})
+
+    def test_dummy_verifications_cache_nothing(self):
+        _, public_jwk = make_rsa_key("testKid")
+        mock_http = MagicMock()
+        mock_http.get.return_value.status_code = 200
+        mock_http.get.return_value.json.return_value = {"keys": [public_jwk]}
+        set_clients(Clients(lambda_client=MagicMock(), http=mock_http))
+        set_owner_resolver(StaticOwnerResolver({}))
+
+        response = main.handler({"warmup": True}, {})
+
+        self.assertIn("verify_dev", response["timings"])
+        self.assertIn("verify_cognito", response["timings"])
+        self.assertEqual(main.verified_tokens.stats()["size"], 0)
+        self.assertEqual(main.owners.stats()["size"], 0)
+
+
+class TestGetOwnerUuidResilience(unittest.TestCase):
+    def setUp(self):
+        self.lambda_client = StubLambdaClient({"sub": "owner"})
+        set_clients(Clients(lambda_client=self.lambda_client))
+
+    def test_breaker_opens_when_lambda_keeps_failing(self):
+        self.lambda_client.error = Exception("Lambda invocation failed")
+        for _ in range(config.breaker_failure_threshold):
+            with self.assertRaises(Exception):
+                main.get_owner_uuid("sub", config)
+        invocations = self.lambda_client.invocations
+
+        with self.assertRaises(CircuitOpenError):
+            main.get_owner_uuid("sub", config)
+        self.assertEqual(self.lambda_client.invocations, invocations)
+
+    def test_function_error_isnt_cached_as_unknown_owner(self):
+        self.lambda_client.function_error = "Unhandled"
+        for _ in range(config.breaker_failure_threshold):
+            with self.assertRaises(OwnerLookupError):
+                main.get_owner_uuid("sub", config)
+        self.assertEqual(
+            self.lambda_client.invocations, config.breaker_failure_threshold
+        )
+        self.assertEqual(main.owner_breaker.state, "open")
+        self.assertFalse(main.owners.is_cached("sub"))
+
+    def test_stale_owner_is_used_while_lambda_fails(self):
+        self.assertEqual(main.get_owner_uuid("sub", config), "owner")
+        entries = main.owners._cache._entries
+        # Expired a second ago, well within the owner_cache_max_stale window
+        entries["sub"] = entries["sub"]._replace(expires_at=time.monotonic() - 1)
+        self.lambda_client.error = Exception("Lambda invocation failed")
+        self.assertEqual(main.get_owner_uuid("sub", config), "owner")
+
+    def test_slow_lambda_misses_the_deadline(self):
+        self.lambda_client.latency = 1
+        settings = config.copy(update={"owner_lookup_deadline": 0.05})
+        with self.assertRaises(DeadlineExceeded):
+            main.get_owner_uuid("sub", settings)
+
+
+class SlowOwnerResolver(OwnerResolver):
+    def __init__(self, owners, latency):
+        self.owners = owners
+        self.latency = latency
+        self.lookups = []
+
+    def resolve(self, cognito_id):
+        self.lookups.append(cognito_id)
+        time.sleep(self.latency)
+        return self.owners.get(cognito_id)
+
+
+class TestSpeculativeOwnerLookup(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(config, "speculative_owner_lookup", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resolver = SlowOwnerResolver({"sub": "owner"}, latency=0.2)
+        set_owner_resolver(self.resolver)
+        issuer = verify_cognito_token.cognito_issuer(config.cognito_user_pool_id)
+        self.token = unsigned_cognito_token({"iss": issuer, "sub": "sub"})
+
+    def slow_verify(self, token, user_pool_id, leeway=0):
+        time.sleep(0.2)
+        return token.payload
+
+    def test_lookup_overlaps_verification(self):
+        with patch.object(
+            verify_cognito_token, "verify_cognito_token", side_effect=self.slow_verify
+        ):
+            start = time.monotonic()
+            self.assertEqual(main.authorize(self.token), "owner")
+            elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(self.resolver.lookups, ["sub"])
+        self.assertTrue(main.owners.is_cached("sub"))
+
+    def test_lookup_is_discarded_when_verification_fails(self):
+        with patch.object(
+            verify_cognito_token,
+            "verify_cognito_token",
+            side_effect=ValueError("Invalid token"),
+        ):
+            with self.assertRaises(ValueError):
+                main.authorize(self.token)
+        time.sleep(0.3)
+
+        self.assertFalse(main.owners.is_cached("sub"))
+        self.assertEqual(main.owners.stats()["loads"], 0)
+        self.assertEqual(main.verified_tokens.stats()["size"], 0)
+
+    def test_lookup_timeout(self):
+        self.resolver.latency = 1
+        with patch.object(
+            verify_cognito_token, "verify_cognito_token", side_effect=self.slow_verify
+        ), patch.object(config, "speculative_owner_lookup_timeout", 0.05):
+            with self.assertRaises(DeadlineExceeded):
+                main.authorize(self.token)
+        self.assertFalse(main.owners.is_cached("sub"))
+
+    def test_cached_owner_isnt_looked_up(self):
+        main.get_owner_uuid("sub", config)
+        self.resolver.lookups.clear()
+        self.assertIsNone(main.start_owner_lookup("sub"))
+        self.assertIsNone(main.start_owner_lookup(None))
+        self.assertEqual(self.resolver.lookups, [])
+
+
+class TestOwnersOnDisk(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = patch.object(main, "disk_cache", DiskCache(directory.name))
+        self.disk_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        set_owner_resolver(StaticOwnerResolver({"sub": "owner"}))
+
+    def test_owners_are_saved_and_restored(self):
+        settings = config.copy(update={"disk_cache_write_interval": 0})
+        main.get_owner_uuid("sub", settings)
+        main.save_owners(settings).result()
+        main.owners.clear()
+
+        main.restore_owners()
+        self.assertTrue(main.owners.is_cached("sub"))
+
+    def test_owners_are_saved_after_loads(self):
+        with patch.object(main, "save_owners") as save_owners:
+            main.get_owner_uuid("sub", config)
+            main.get_owner_uuid("sub", config)
+        save_owners.assert_called_once_with(config)
+
+    def test_saves_are_throttled(self):
+        with patch.object(main, "_owners_saved_at", time.time()):
+            self.assertIsNone(main.save_owners(config))
+
+    def test_concurrent_saves_write_once(self):
+        barrier = threading.Barrier(8)
+        writes = []
+
+        def save():
+            barrier.wait(5)
+            writes.append(main.save_owners(config))
+
+        with patch.object(main, "_owners_saved_at", 0.0):
+            threads = [threading.Thread(target=save) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len([write for write in writes if write is not None]), 1)
+
+    def test_malformed_owners_on_disk_are_ignored(self):
+        self.disk_cache.write("owners", ["not", "a", "snapshot"])
+        with self.assertLogs("authorizer_lambda.main", "WARNING"):
+            main.restore_owners()
+        self.assertEqual(main.owners.stats()["size"], 0)
+
+
+class TestMultiplePools(unittest.TestCase):
+    def setUp(self):
+        self.tokens = {}
+        pools = []
+        for name, region in [("pool_a", "us-east-1"), ("pool_b", "ap-southeast-2")]:
+            private_key, public_jwk = make_rsa_key(f"{name}Kid")
+            server = JWKSServer({"keys": [public_jwk]}).__enter__()
+            self.addCleanup(server.__exit__, None, None, None)
+            pools.append(
+                CognitoPool(user_pool_id=name, region=region, jwks_url=server.url)
+            )
+            self.tokens[name] = jwt.encode(
+                {
+                    "iss": verify_cognito_token.cognito_issuer(name, region),
+                    "sub": f"{name}_sub",
+                },
+                private_key,
+                algorithm="RS256",
+                headers={"kid": f"{name}Kid"},
+            )
+        patcher = patch.object(config, "cognito_pools", pools)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        set_owner_resolver(
+            StaticOwnerResolver({"pool_a_sub": "owner_a", "pool_b_sub": "owner_b"})
+        )
+
+    def test_tokens_are_routed_to_their_pool(self):
+        self.assertEqual(main.authorize(self.tokens["pool_a"]), "owner_a")
+        self.assertEqual(main.authorize(self.tokens["pool_b"]), "owner_b")
+
+    def test_unconfigured_pool_is_rejected(self):
+        with patch.object(config, "cognito_pools", config.cognito_pools[:1]):
+            with self.assertRaises(TokenRejected) as cm:
+                main.authorize(self.tokens["pool_b"])
+        self.assertEqual(cm.exception.reason, "issuer")
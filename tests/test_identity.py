@@ -0,0 +1,65 @@
+import unittest
+from authorizer_lambda.config import Settings
+from authorizer_lambda.identity import extract_token
+from authorizer_lambda.models import RequestAuthorizationRequest
+
+
+def request(headers=None, query=None):
+    return RequestAuthorizationRequest(
+        type="REQUEST",
+        methodArn="some_method_arn",
+        headers=headers,
+        queryStringParameters=query,
+    )
+
+
+class TestExtractToken(unittest.TestCase):
+    settings = Settings()
+
+    def test_header(self):
+        for headers in [
+            {"Authorization": "abc"},
+            {"authorization": "abc"},
+            {"Authorization": "Bearer abc"},
+            {"AUTHORIZATION": "bearer abc"},
+        ]:
+            with self.subTest(headers=headers):
+                self.assertEqual(extract_token(request(headers), self.settings), "abc")
+
+    def test_query_string(self):
+        self.assertEqual(
+            extract_token(request(query={"token": "abc"}), self.settings), "abc"
+        )
+
+    def test_cookie(self):
+        headers = {"cookie": "session=1; token=abc; other=2"}
+        self.assertEqual(extract_token(request(headers), self.settings), "abc")
+
+    def test_order(self):
+        headers = {"Authorization": "header", "Cookie": "token=cookie"}
+        query = {"token": "query"}
+        self.assertEqual(
+            extract_token(request(headers, query), self.settings), "header"
+        )
+        del headers["Authorization"]
+        self.assertEqual(extract_token(request(headers, query), self.settings), "query")
+        self.assertEqual(extract_token(request(headers), self.settings), "cookie")
+
+    def test_configured_sources(self):
+        settings = Settings(
+            token_header="X-Token", token_query_parameter="t", token_cookie="jwt"
+        )
+        self.assertEqual(extract_token(request({"x-token": "a"}), settings), "a")
+        self.assertEqual(extract_token(request(query={"t": "b"}), settings), "b")
+        self.assertEqual(extract_token(request({"Cookie": "jwt=c"}), settings), "c")
+        self.assertIsNone(extract_token(request({"Authorization": "a"}), settings))
+
+    def test_missing(self):
+        for headers, query in [
+            (None, None),
+            ({}, {}),
+            ({"Authorization": ""}, {"token": ""}),
+            ({"Cookie": "session=1; token="}, None),
+        ]:
+            with self.subTest(headers=headers, query=query):
+                self.assertIsNone(extract_token(request(headers, query), self.settings))
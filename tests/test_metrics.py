@@ -0,0 +1,66 @@
+import io
+import json
+import unittest
+from authorizer_lambda import metrics
+
+
+class TestInvocationMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.start_invocation(enabled=False)
+
+    def test_emf_document(self):
+        invocation = metrics.start_invocation(namespace="TestNamespace")
+        with metrics.stage("verify"):
+            with metrics.stage("jwks_fetch"):
+                pass
+        with metrics.stage("verify"):
+            pass
+        metrics.set_flag("TokenCacheHit", False)
+        metrics.set_property("TokenType", "cognito")
+
+        stream = io.StringIO()
+        invocation.emit(stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        document = json.loads(lines[0])
+
+        directive = document["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Namespace"], "TestNamespace")
+        self.assertEqual(directive["Dimensions"], [["TokenType"]])
+        self.assertEqual(
+            directive["Metrics"],
+            [
+                {"Name": "total", "Unit": "Milliseconds"},
+                {"Name": "jwks_fetch", "Unit": "Milliseconds"},
+                {"Name": "verify", "Unit": "Milliseconds"},
+                {"Name": "TokenCacheHit", "Unit": "Count"},
+            ],
+        )
+        self.assertIsInstance(document["_aws"]["Timestamp"], int)
+        self.assertEqual(document["TokenType"], "cognito")
+        self.assertEqual(document["TokenCacheHit"], 0)
+        self.assertGreaterEqual(document["verify"], document["jwks_fetch"])
+        self.assertGreaterEqual(document["total"], document["verify"])
+
+    def test_token_type_defaults_to_unknown(self):
+        invocation = metrics.start_invocation()
+        self.assertEqual(invocation.to_emf()["TokenType"], "unknown")
+
+    def test_disabled(self):
+        self.assertIsNone(metrics.start_invocation(enabled=False))
+        with metrics.stage("verify"):
+            pass
+        metrics.set_flag("TokenCacheHit", True)
+        metrics.set_property("TokenType", "dev")
+        metrics.end_invocation()
+
+
+def test_end_invocation_writes_to_stdout(capsys):
+    metrics.start_invocation()
+    metrics.set_property("TokenType", "dev")
+    metrics.end_invocation()
+    metrics.end_invocation()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["TokenType"] == "dev"
@@ -0,0 +1,175 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from authorizer_lambda.owner_cache import OwnerCache, OwnerNotFoundError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestOwnerCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = OwnerCache(ttl=60, negative_ttl=5, max_entries=2, clock=self.clock)
+
+    def test_found_owner_is_cached_for_ttl(self):
+        load = Mock(return_value="owner")
+        self.assertEqual(self.cache.get_or_load("sub", load), "owner")
+        self.clock.now = 59
+        self.assertEqual(self.cache.get_or_load("sub", load), "owner")
+        load.assert_called_once_with("sub")
+
+        self.clock.now = 60
+        self.cache.get_or_load("sub", load)
+        self.assertEqual(load.call_count, 2)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["loads"], 2)
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3)
+
+    def test_unknown_owner_is_cached_for_negative_ttl(self):
+        load = Mock(return_value=None)
+        with self.assertRaises(OwnerNotFoundError):
+            self.cache.get_or_load("sub", load)
+        self.clock.now = 4
+        with self.assertRaises(OwnerNotFoundError):
+            self.cache.get_or_load("sub", load)
+        load.assert_called_once()
+        self.assertEqual(self.cache.stats()["negative_hits"], 1)
+
+        self.clock.now = 5
+        load.return_value = "owner"
+        self.assertEqual(self.cache.get_or_load("sub", load), "owner")
+
+    def test_failed_load_is_not_cached(self):
+        load = Mock(side_effect=[RuntimeError("boom"), "owner"])
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_load("sub", load)
+        self.assertEqual(self.cache.get_or_load("sub", load), "owner")
+        self.assertEqual(self.cache.stats()["load_errors"], 1)
+
+    def test_stale_owner_is_used_when_load_fails(self):
+        cache = OwnerCache(ttl=60, max_stale=30, clock=self.clock)
+        cache.get_or_load("sub", lambda cognito_id: "owner")
+
+        def load(cognito_id):
+            raise RuntimeError("boom")
+
+        self.clock.now = 89
+        self.assertEqual(cache.get_or_load("sub", load), "owner")
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+        self.clock.now = 90
+        with self.assertRaises(RuntimeError):
+            cache.get_or_load("sub", load)
+
+    def test_snapshot_and_restore(self):
+        cache = OwnerCache(ttl=60, negative_ttl=5, clock=self.clock)
+        cache.get_or_load("sub", lambda cognito_id: "owner")
+        self.clock.now = 30
+        with self.assertRaises(OwnerNotFoundError):
+            cache.get_or_load("unknown", lambda cognito_id: None)
+        self.clock.now = 40
+        snapshot = cache.snapshot(now=1000)
+        self.assertEqual(snapshot, {"sub": ["owner", 1020]})
+
+        restored = OwnerCache(ttl=60, clock=self.clock)
+        restored.restore(snapshot, now=1000)
+        load = Mock()
+        self.assertEqual(restored.get_or_load("sub", load), "owner")
+        self.clock.now = 60
+        self.assertFalse(restored.is_cached("sub"))
+        load.assert_not_called()
+
+    def test_restore_skips_expired_and_cached_entries(self):
+        self.cache.get_or_load("sub", lambda cognito_id: "owner")
+        self.cache.restore(
+            {"sub": ["stale", 2000], "expired": ["other", 999], "new": [None, 1010]},
+            now=1000,
+        )
+        self.assertEqual(self.cache.get_or_load("sub", Mock()), "owner")
+        self.assertFalse(self.cache.is_cached("expired"))
+        with self.assertRaises(OwnerNotFoundError):
+            self.cache.get_or_load("new", Mock())
+
+    def test_least_recently_used_is_evicted(self):
+        for cognito_id in ["a", "b", "c"]:
+            self.cache.get_or_load(cognito_id, str.upper)
+        self.assertEqual(self.cache.stats()["size"], 2)
+        load = Mock(return_value="A")
+        self.cache.get_or_load("a", load)
+        load.assert_called_once()
+
+    def test_concurrent_misses_are_coalesced(self):
+        release = threading.Event()
+        started = threading.Event()
+        calls = []
+
+        def load(cognito_id):
+            calls.append(cognito_id)
+            started.set()
+            release.wait(5)
+            return "owner"
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.cache.get_or_load("sub", load))
+            )
+            for _ in range(8)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while self.cache.stats()["coalesced"] < 7:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(calls, ["sub"])
+        self.assertEqual(results, ["owner"] * 8)
+
+    def test_concurrent_waiters_get_the_load_error(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def load(cognito_id):
+            started.set()
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        errors = []
+
+        def lookup():
+            try:
+                self.cache.get_or_load("sub", load)
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=lookup) for _ in range(3)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while self.cache.stats()["coalesced"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 3)
+
+    def test_clear(self):
+        self.cache.get_or_load("sub", str.upper)
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["size"], 0)
+        self.assertEqual(self.cache.stats()["loads"], 0)
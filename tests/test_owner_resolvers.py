@@ -0,0 +1,118 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from authorizer_lambda import owner_resolvers
+from authorizer_lambda.clients import Clients, set_clients
+from authorizer_lambda.config import Settings
+from authorizer_lambda.owner_resolvers import (
+    DynamoDBOwnerResolver,
+    LambdaOwnerResolver,
+    OwnerLookupError,
+    StaticOwnerResolver,
+    create_owner_resolver,
+)
+from tests.stubs import StubDynamoDBClient, StubLambdaClient
+
+
+class TestLambdaOwnerResolver(unittest.TestCase):
+    def test_resolve(self):
+        lambda_client = StubLambdaClient({"sub": "owner"})
+        set_clients(Clients(lambda_client=lambda_client))
+        resolver = LambdaOwnerResolver(Settings())
+
+        self.assertEqual(resolver.resolve("sub"), "owner")
+        self.assertIsNone(resolver.resolve("unknown"))
+        self.assertEqual(lambda_client.invocations, 2)
+
+    def test_function_error_is_raised(self):
+        set_clients(
+            Clients(lambda_client=StubLambdaClient({}, function_error="Unhandled"))
+        )
+        with self.assertRaisesRegex(OwnerLookupError, "boom"):
+            LambdaOwnerResolver(Settings()).resolve("sub")
+
+    def test_unexpected_payload_is_raised(self):
+        for payload in [["owner"], "owner", {"errorMessage": "boom"}]:
+            with self.subTest(payload=payload):
+                set_clients(
+                    Clients(lambda_client=StubLambdaClient({}, payload=payload))
+                )
+                with self.assertRaises(OwnerLookupError):
+                    LambdaOwnerResolver(Settings()).resolve("sub")
+
+
+class TestDynamoDBOwnerResolver(unittest.TestCase):
+    def test_resolve(self):
+        dynamodb_client = StubDynamoDBClient(
+            {"sub": {"cognito_id": {"S": "sub"}, "owner_uuid": {"S": "owner"}}}
+        )
+        set_clients(Clients(dynamodb_client=dynamodb_client))
+        resolver = DynamoDBOwnerResolver(Settings(owner_table_name="test-owners"))
+
+        self.assertEqual(resolver.resolve("sub"), "owner")
+        self.assertIsNone(resolver.resolve("unknown"))
+        self.assertEqual(dynamodb_client.requests[0]["TableName"], "test-owners")
+        self.assertEqual(
+            dynamodb_client.requests[0]["ExpressionAttributeNames"],
+            {"#owner": "owner_uuid"},
+        )
+
+    def test_item_without_owner(self):
+        set_clients(
+            Clients(
+                dynamodb_client=StubDynamoDBClient(
+                    {"sub": {"cognito_id": {"S": "sub"}}}
+                )
+            )
+        )
+        self.assertIsNone(DynamoDBOwnerResolver(Settings()).resolve("sub"))
+
+
+class TestStaticOwnerResolver(unittest.TestCase):
+    def test_resolve(self):
+        resolver = StaticOwnerResolver({"sub": "owner"})
+        self.assertEqual(resolver.resolve("sub"), "owner")
+        self.assertIsNone(resolver.resolve("unknown"))
+
+    def test_loaded_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "owners.json"
+            path.write_text(json.dumps({"sub": "owner"}))
+            resolver = StaticOwnerResolver(path=str(path))
+            resolver.prewarm()
+            path.unlink()
+            self.assertEqual(resolver.resolve("sub"), "owner")
+
+    def test_requires_owners(self):
+        with self.assertRaises(ValueError):
+            StaticOwnerResolver()
+
+
+class TestCreateOwnerResolver(unittest.TestCase):
+    def test_backends(self):
+        self.assertIsInstance(create_owner_resolver(Settings()), LambdaOwnerResolver)
+        self.assertIsInstance(
+            create_owner_resolver(Settings(owner_resolver="dynamodb")),
+            DynamoDBOwnerResolver,
+        )
+        self.assertIsInstance(
+            create_owner_resolver(
+                Settings(owner_resolver="static", owner_map_file="owners.json")
+            ),
+            StaticOwnerResolver,
+        )
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_owner_resolver(Settings(owner_resolver="ldap"))
+
+    def test_static_backend_requires_owner_map_file(self):
+        with self.assertRaises(ValueError):
+            create_owner_resolver(Settings(owner_resolver="static"))
+
+    def test_resolver_is_shared(self):
+        resolver = owner_resolvers.get_owner_resolver()
+        self.assertIs(owner_resolvers.get_owner_resolver(), resolver)
+        owner_resolvers.set_owner_resolver(None)
+        self.assertIsNot(owner_resolvers.get_owner_resolver(), resolver)
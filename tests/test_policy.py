@@ -1,6 +1,17 @@
+import json
 import unittest
-from authorizer_lambda.policy import generate_policy
-from authorizer_lambda.models import PolicyDocument, StatementEffect
+from authorizer_lambda.policy import (
+    build_policy_response,
+    deny_policy_response,
+    generate_policy,
+    owner_resource,
+)
+from authorizer_lambda.models import (
+    AuthorizationResponse,
+    PolicyDocument,
+    StatementEffect,
+)
+from pydantic import ValidationError
 
 
 class TestGeneratePolicy(unittest.TestCase):
@@ -25,3 +36,123 @@ class TestGeneratePolicy(unittest.TestCase):
 
         # Assert the context in the AuthorizationResponse
         self.assertDictEqual(policy.context, {"owner_uuid": owner_uuid})
+
+
+class TestBuildPolicyResponse(unittest.TestCase):
+    method_arns = [
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/backend_api_gw_stage_dev/GET/api/a-b-c-d/property/sub",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/POST/api/a-b-c-d/x",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/GET/api/a-b-c-d",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/GET/api/",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/GET/api",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/GET/",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/GET",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/",
+        "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage",
+        "some_method_arn",
+        "a/b/c///",
+        "a/b/c/d/e/f/g/h/",
+        "",
+    ]
+
+    def test_identical_to_generate_policy(self):
+        contexts = [{}, {"owner_uuid": "owner123"}, {"a": "1", "b": ""}]
+        for method_arn in self.method_arns:
+            for context in contexts:
+                with self.subTest(method_arn=method_arn, context=context):
+                    expected = generate_policy(
+                        "user123", method_arn, "owner123", context
+                    ).dict()
+                    response = build_policy_response(
+                        "user123", method_arn, "owner123", context
+                    )
+                    self.assertEqual(response, expected)
+                    self.assertEqual(json.dumps(response), json.dumps(expected))
+
+    def test_values_the_models_coerce(self):
+        for principal_id, context in [
+            (123, {}),
+            ("user123", {"admin": True, "count": 5}),
+            ("user123", {1: "a"}),
+        ]:
+            with self.subTest(principal_id=principal_id, context=context):
+                expected = generate_policy(
+                    principal_id, "a/b/GET/api/c/d", "owner", context
+                ).dict()
+                response = build_policy_response(
+                    principal_id, "a/b/GET/api/c/d", "owner", context
+                )
+                self.assertEqual(json.dumps(response), json.dumps(expected))
+
+    def test_values_the_models_reject(self):
+        for principal_id, context in [(None, {}), ("user123", object())]:
+            with self.subTest(principal_id=principal_id, context=context):
+                with self.assertRaises(ValidationError):
+                    build_policy_response(principal_id, "a/b/GET", "owner", context)
+
+    def test_responses_are_independent(self):
+        context = {"owner_uuid": "owner123"}
+        first = build_policy_response("user123", "a/b/GET/api/c/d", "c", context)
+        second = build_policy_response("user123", "a/b/GET/api/c/d", "c", context)
+        first["policyDocument"]["Statement"][0]["Resource"] = "changed"
+        first["context"]["owner_uuid"] = "changed"
+        self.assertEqual(
+            second["policyDocument"]["Statement"][0]["Resource"], "a/b/*/api/c/*"
+        )
+        self.assertEqual(context, {"owner_uuid": "owner123"})
+
+
+class TestOwnerResource(unittest.TestCase):
+    def test_owner_resource(self):
+        method_arn = (
+            "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/"
+            "stage/GET/api/other/property"
+        )
+        self.assertEqual(
+            owner_resource(method_arn, "a-b-c-d", "api/{owner_uuid}/*"),
+            "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/*/api/a-b-c-d/*",
+        )
+        self.assertEqual(
+            owner_resource(method_arn, "a-b-c-d", "v2/owners/{owner_uuid}/*"),
+            "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/stage/*/v2/owners/a-b-c-d/*",
+        )
+
+    def test_owner_uuid_cant_widen_the_resource(self):
+        for owner_uuid in ["*", "a*", "a/b", "a?", "", None]:
+            with self.subTest(owner_uuid=owner_uuid):
+                with self.assertRaises(ValueError):
+                    owner_resource("a/stage/GET/x", owner_uuid, "api/{owner_uuid}/*")
+
+    def test_resource_override_is_identical_to_generate_policy(self):
+        for principal_id, context in [("user123", {}), (123, {"admin": True})]:
+            with self.subTest(principal_id=principal_id):
+                expected = generate_policy(
+                    principal_id, "a/b/GET/c", "owner", context, "a/b/*/api/owner/*"
+                ).dict()
+                response = build_policy_response(
+                    principal_id, "a/b/GET/c", "owner", context, "a/b/*/api/owner/*"
+                )
+                self.assertEqual(json.dumps(response), json.dumps(expected))
+
+
+class TestDenyPolicyResponse(unittest.TestCase):
+    def test_deny_policy_response(self):
+        method_arn = (
+            "arn:aws:execute-api:us-east-1:349228585176:aovoxtdoh3/"
+            "stage/GET/api/a-b-c-d/property"
+        )
+        response = deny_policy_response(method_arn)
+        self.assertEqual(response["principalId"], "unauthorized")
+        self.assertEqual(
+            response["policyDocument"]["Statement"],
+            [
+                {
+                    "Action": "execute-api:Invoke",
+                    "Effect": "Deny",
+                    "Resource": "arn:aws:execute-api:us-east-1:349228585176:"
+                    "aovoxtdoh3/stage/*",
+                }
+            ],
+        )
+        # The response is a valid policy
+        AuthorizationResponse(**response)
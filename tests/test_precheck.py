@@ -0,0 +1,153 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import jwt
+
+from authorizer_lambda import metrics, util, verify_cognito_token
+from authorizer_lambda.config import config
+from authorizer_lambda.precheck import (
+    TokenRejected,
+    precheck_token,
+    rejections,
+)
+from tests.stubs import JWKSServer, make_rsa_key
+
+ISSUER = verify_cognito_token.cognito_issuer(config.cognito_user_pool_id)
+PRIVATE_KEY, PUBLIC_JWK = make_rsa_key("knownKid")
+SECRET = "secret" * 8
+
+
+def dev_token(**claims):
+    return jwt.encode({"iss": util.DEV_ISSUER, **claims}, SECRET, "HS256")
+
+
+def cognito_token(kid="knownKid", **claims):
+    return jwt.encode(
+        {"iss": ISSUER, "sub": "sub", **claims},
+        PRIVATE_KEY,
+        "RS256",
+        headers={"kid": kid},
+    )
+
+
+class TestPrecheckToken(unittest.TestCase):
+    def setUp(self):
+        rejections.clear()
+        self.addCleanup(rejections.clear)
+
+    def assertRejected(self, token, reason, settings=config):
+        with self.assertRaises(TokenRejected) as cm:
+            precheck_token(token, settings)
+        self.assertEqual(cm.exception.reason, reason)
+        self.assertEqual(rejections.stats()[reason], 1)
+        return cm.exception
+
+    def test_valid_tokens(self):
+        parsed = precheck_token(dev_token(owner_uuid="owner"), config)
+        self.assertEqual(parsed.payload["owner_uuid"], "owner")
+        parsed = precheck_token(cognito_token(), config)
+        self.assertEqual(parsed.kid, "knownKid")
+        self.assertEqual(sum(rejections.stats().values()), 0)
+
+    def test_too_long(self):
+        settings = config.copy(update={"token_max_length": 64})
+        self.assertRejected(dev_token(pad="x" * 64), "too_long", settings)
+
+    def test_malformed(self):
+        for token in ["", "a.b", "a.b.c.d", "not.a.token", "e30.!!.c2ln"]:
+            with self.subTest(token=token):
+                with self.assertRaises(TokenRejected) as cm:
+                    precheck_token(token, config)
+                self.assertEqual(cm.exception.reason, "malformed")
+        self.assertEqual(rejections.stats()["malformed"], 5)
+
+    def test_malformed_time_claims(self):
+        self.assertRejected(dev_token(exp="tomorrow"), "malformed")
+
+    def test_null_time_claims(self):
+        for claim in ["exp", "nbf", "iat"]:
+            with self.subTest(claim=claim):
+                with self.assertRaises(TokenRejected) as cm:
+                    precheck_token(dev_token(**{claim: None}), config)
+                self.assertEqual(cm.exception.reason, "malformed")
+
+    def test_unknown_issuer(self):
+        token = jwt.encode({"iss": "https://example.com"}, SECRET, "HS256")
+        self.assertRejected(token, "issuer")
+
+    def test_missing_issuer(self):
+        self.assertRejected(jwt.encode({"sub": "sub"}, SECRET, "HS256"), "issuer")
+
+    def test_alg_must_match_issuer(self):
+        token = jwt.encode({"iss": ISSUER}, SECRET, "HS256")
+        self.assertRejected(token, "alg")
+
+    def test_dev_issuer_with_rs256(self):
+        token = jwt.encode({"iss": util.DEV_ISSUER}, PRIVATE_KEY, "RS256")
+        self.assertRejected(token, "alg")
+
+    def test_expired(self):
+        error = self.assertRejected(dev_token(exp=int(time.time()) - 10), "expired")
+        self.assertEqual(str(error), "Expired token")
+
+    def test_not_yet_valid(self):
+        error = self.assertRejected(
+            dev_token(nbf=int(time.time()) + 60), "not_yet_valid"
+        )
+        self.assertEqual(str(error), "Invalid token")
+
+    def test_clock_skew(self):
+        settings = config.copy(update={"token_clock_skew": 30})
+        precheck_token(dev_token(exp=int(time.time()) - 10), settings)
+        precheck_token(dev_token(nbf=int(time.time()) + 10), settings)
+        self.assertEqual(sum(rejections.stats().values()), 0)
+
+    def test_missing_kid(self):
+        token = jwt.encode({"iss": ISSUER}, PRIVATE_KEY, "RS256")
+        self.assertRejected(token, "kid")
+
+    def test_rejection_is_a_value_error(self):
+        with self.assertRaises(ValueError):
+            precheck_token("garbage", config)
+
+    def test_reject_reason_metric(self):
+        invocation = metrics.start_invocation()
+        self.addCleanup(metrics.start_invocation, enabled=False)
+        with self.assertRaises(TokenRejected):
+            precheck_token("garbage", config)
+        self.assertEqual(invocation.properties["RejectReason"], "malformed")
+
+
+class TestUnknownKid(unittest.TestCase):
+    def setUp(self):
+        self.server = JWKSServer({"keys": [PUBLIC_JWK]}).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.now = 1000.0
+        self.cache = verify_cognito_token.JWKSCache(
+            self.server.url, refresh_min_interval=60, clock=lambda: self.now
+        )
+        patcher = patch.object(
+            verify_cognito_token, "get_pool_jwks_cache", return_value=self.cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rejections.clear()
+        self.addCleanup(rejections.clear)
+
+    def test_unknown_kid_passes_before_the_keys_are_loaded(self):
+        precheck_token(cognito_token(kid="otherKid"), config)
+        self.assertEqual(self.server.requests, 0)
+
+    def test_unknown_kid_is_rejected_while_refresh_is_rate_limited(self):
+        self.cache.refresh()
+        precheck_token(cognito_token(), config)
+        with self.assertRaises(TokenRejected) as cm:
+            precheck_token(cognito_token(kid="otherKid"), config)
+        self.assertEqual(cm.exception.reason, "kid")
+        self.assertEqual(self.server.requests, 1)
+
+        # Once a refresh is allowed again, the kid may have been rotated in
+        self.now += 60
+        precheck_token(cognito_token(kid="otherKid"), config)
+        self.assertEqual(rejections.stats()["kid"], 1)
@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+from authorizer_lambda import metrics
+from authorizer_lambda.config import config
+from authorizer_lambda.resilience import (
+    JWKS,
+    OWNER_LOOKUP,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    call_with_deadline,
+    get_executor,
+    submit,
+    wait_with_deadline,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            "test", failure_threshold=3, reset_timeout=10, clock=self.clock
+        )
+
+    def open_breaker(self):
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                self.breaker.call(fail)
+
+    def test_closed(self):
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                self.breaker.call(fail)
+        self.breaker.call(lambda: "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.open_breaker()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        calls = []
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: calls.append(1))
+        self.assertEqual(calls, [])
+
+    def test_trial_call_closes_breaker(self):
+        self.open_breaker()
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_call_opens_breaker_again(self):
+        self.open_breaker()
+        self.clock.now = 10
+        with self.assertRaises(RuntimeError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 19
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "ok")
+
+    def test_single_trial_call(self):
+        self.open_breaker()
+        self.clock.now = 10
+        started = threading.Event()
+        release = threading.Event()
+
+        def trial():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=self.breaker.call, args=(trial,))
+        thread.start()
+        started.wait(5)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "ok")
+        release.set()
+        thread.join(5)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_reset(self):
+        self.open_breaker()
+        self.breaker.reset()
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+
+
+class TestCallWithDeadline(unittest.TestCase):
+    def test_result(self):
+        self.assertEqual(call_with_deadline(1, max, 1, 2), 2)
+        self.assertEqual(call_with_deadline(None, max, 1, 2), 2)
+
+    def test_error(self):
+        with self.assertRaises(RuntimeError):
+            call_with_deadline(1, fail)
+
+    def test_deadline_exceeded(self):
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            call_with_deadline(0.05, time.sleep, 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_runs_in_current_context(self):
+        invocation = metrics.start_invocation()
+        try:
+
+            def timed():
+                with metrics.stage("worker"):
+                    pass
+
+            call_with_deadline(1, timed)
+            self.assertIn("worker", invocation.stages)
+        finally:
+            metrics.start_invocation(enabled=False)
+
+
+class TestSubmit(unittest.TestCase):
+    def test_wait_with_deadline(self):
+        future = submit(max, 1, 2)
+        self.assertEqual(wait_with_deadline(future, 1, "max"), 2)
+
+    def test_wait_with_deadline_exceeded(self):
+        future = submit(time.sleep, 1)
+        with self.assertRaises(DeadlineExceeded):
+            wait_with_deadline(future, 0.05, "sleep")
+
+    def test_pool_per_dependency(self):
+        self.assertIsNot(get_executor(JWKS), get_executor(OWNER_LOOKUP))
+        self.assertIs(get_executor(JWKS), get_executor(JWKS))
+        self.assertEqual(get_executor(JWKS)._max_workers, config.jwks_workers)
+
+    def test_hanging_dependency_doesnt_hold_up_the_others(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for _ in range(config.owner_lookup_workers + 1):
+            submit(release.wait, 5, executor=OWNER_LOOKUP)
+        with self.assertRaises(DeadlineExceeded):
+            call_with_deadline(0.05, max, 1, 2, executor=OWNER_LOOKUP)
+        self.assertEqual(call_with_deadline(1, max, 1, 2, executor=JWKS), 2)
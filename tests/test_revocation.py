@@ -0,0 +1,190 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import jwt
+
+from authorizer_lambda import main, util
+from authorizer_lambda.config import config
+from authorizer_lambda.precheck import TokenRejected, rejections
+from authorizer_lambda.revocation import (
+    RevocationChecker,
+    RevocationList,
+    jti_digest,
+    main_cli,
+    revocation_digest,
+    set_revocation_checker,
+    token_digest,
+    write_snapshot,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def dev_token(**claims):
+    payload = {"iss": util.DEV_ISSUER, "owner_uuid": "a-b-c-d", **claims}
+    return jwt.encode(payload, config.dev_jwt_secret, algorithm="HS256")
+
+
+class TestRevocationList(unittest.TestCase):
+    def test_revoked_digests(self):
+        revoked = RevocationList.build(jti_digest(f"jti-{i}") for i in range(1000))
+        self.assertEqual(len(revoked), 1000)
+        for i in range(1000):
+            self.assertIn(jti_digest(f"jti-{i}"), revoked)
+        self.assertNotIn(jti_digest("jti-1000"), revoked)
+
+    def test_false_positives_are_caught_by_the_exact_set(self):
+        revoked = RevocationList.build(
+            [jti_digest(f"jti-{i}") for i in range(100)], false_positive_rate=0.5
+        )
+        others = [jti_digest(f"other-{i}") for i in range(2000)]
+        self.assertFalse(any(digest in revoked for digest in others))
+
+    def test_empty(self):
+        revoked = RevocationList.build([])
+        self.assertEqual(len(revoked), 0)
+        self.assertNotIn(jti_digest("jti"), revoked)
+
+    def test_snapshot_round_trip(self):
+        revoked = RevocationList.build(jti_digest(f"jti-{i}") for i in range(10))
+        loaded = RevocationList.from_bytes(revoked.to_bytes())
+        self.assertIn(jti_digest("jti-3"), loaded)
+        self.assertEqual(loaded.stats(), revoked.stats())
+
+    def test_invalid_snapshots(self):
+        blob = RevocationList.build([jti_digest("jti")]).to_bytes()
+        for invalid in [b"", b"RVK0" + blob[4:], blob[:-1], blob + b"x"]:
+            with self.subTest(size=len(invalid)):
+                with self.assertRaises(ValueError):
+                    RevocationList.from_bytes(invalid)
+        with self.assertRaises(ValueError):
+            RevocationList.build([b"short"])
+
+    def test_stats(self):
+        revoked = RevocationList.build(
+            (jti_digest(f"jti-{i}") for i in range(10000)), false_positive_rate=0.01
+        )
+        stats = revoked.stats()
+        self.assertEqual(stats["revoked"], 10000)
+        self.assertEqual(stats["exact_bytes"], 160000)
+        # About 1.2 bytes per token for a 1% false positive rate
+        self.assertLess(stats["filter_bytes"], 13000)
+        self.assertAlmostEqual(stats["false_positive_rate"], 0.01, delta=0.002)
+
+    def test_revocation_digest(self):
+        self.assertEqual(revocation_digest({"jti": "abc"}, "token"), jti_digest("abc"))
+        for claims in [{}, {"jti": ""}, {"jti": 1}]:
+            with self.subTest(claims=claims):
+                self.assertEqual(
+                    revocation_digest(claims, "token"), token_digest("token")
+                )
+
+
+class TestRevocationChecker(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "revoked.bin"
+        self.clock = FakeClock()
+
+    def write(self, *jtis):
+        write_snapshot(self.path, RevocationList.build(map(jti_digest, jtis)))
+
+    def test_hot_reload(self):
+        self.write("a")
+        checker = RevocationChecker(self.path, check_interval=10, clock=self.clock)
+        self.assertTrue(checker.is_revoked({"jti": "a"}, "token"))
+        self.assertFalse(checker.is_revoked({"jti": "b"}, "token"))
+
+        self.write("a", "b")
+        self.clock.now = 9
+        self.assertFalse(checker.is_revoked({"jti": "b"}, "token"))
+        self.clock.now = 10
+        self.assertTrue(checker.is_revoked({"jti": "b"}, "token"))
+
+    def test_unchanged_file_isnt_reloaded(self):
+        self.write("a")
+        checker = RevocationChecker(self.path, check_interval=10, clock=self.clock)
+        current = checker.current()
+        self.clock.now = 10
+        self.assertIs(checker.current(), current)
+
+    def test_missing_or_invalid_file_keeps_the_current_snapshot(self):
+        with self.assertLogs("authorizer_lambda.revocation", "WARNING"):
+            checker = RevocationChecker(self.path, check_interval=10, clock=self.clock)
+        self.assertIsNone(checker.current())
+        self.assertFalse(checker.is_revoked({"jti": "a"}, "token"))
+
+        self.write("a")
+        self.clock.now = 10
+        self.assertTrue(checker.is_revoked({"jti": "a"}, "token"))
+
+        self.path.write_bytes(b"garbage")
+        self.clock.now = 20
+        with self.assertLogs("authorizer_lambda.revocation", "WARNING"):
+            self.assertTrue(checker.is_revoked({"jti": "a"}, "token"))
+        os.unlink(self.path)
+        self.clock.now = 30
+        with self.assertLogs("authorizer_lambda.revocation", "WARNING"):
+            self.assertTrue(checker.is_revoked({"jti": "a"}, "token"))
+
+    def test_cli(self):
+        jti_file = self.path.with_name("jtis.txt")
+        jti_file.write_text("a\nb\n\n")
+        token_file = self.path.with_name("tokens.txt")
+        token_file.write_text("some.token.value\n")
+        args = [str(self.path), "--jti-file", str(jti_file)]
+        self.assertEqual(main_cli(args + ["--token-file", str(token_file)]), 0)
+
+        revoked = RevocationList.from_bytes(self.path.read_bytes())
+        self.assertEqual(len(revoked), 3)
+        self.assertIn(jti_digest("b"), revoked)
+        self.assertIn(token_digest("some.token.value"), revoked)
+
+
+class TestRevokedTokens(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "revoked.bin"
+        self.clock = FakeClock()
+        self.token = dev_token(jti="revoked-jti")
+        write_snapshot(self.path, RevocationList.build([]))
+        set_revocation_checker(
+            RevocationChecker(self.path, check_interval=1, clock=self.clock)
+        )
+        rejections.clear()
+        self.addCleanup(rejections.clear)
+
+    def revoke(self, digest):
+        write_snapshot(self.path, RevocationList.build([digest]))
+        self.clock.now += 1
+
+    def test_revoked_jti_is_rejected(self):
+        self.revoke(jti_digest("revoked-jti"))
+        with self.assertRaises(TokenRejected) as cm:
+            main.authorize(self.token)
+        self.assertEqual(cm.exception.reason, "revoked")
+        self.assertEqual(rejections.stats()["revoked"], 1)
+        self.assertEqual(main.authorize(dev_token(jti="other-jti")), "a-b-c-d")
+
+    def test_token_without_jti(self):
+        token = dev_token()
+        self.revoke(token_digest(token))
+        with self.assertRaises(TokenRejected):
+            main.authorize(token)
+
+    def test_cached_token_is_rejected_once_revoked(self):
+        self.assertEqual(main.authorize(self.token), "a-b-c-d")
+        self.revoke(jti_digest("revoked-jti"))
+        with self.assertRaises(TokenRejected):
+            main.authorize(self.token)
+        self.assertEqual(main.verified_tokens.stats()["hits"], 1)
@@ -0,0 +1,267 @@
+import http.client
+import json
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import jwt
+from authorizer_lambda import main, server, util, verify_cognito_token
+from authorizer_lambda.config import config
+from authorizer_lambda.owner_resolvers import StaticOwnerResolver, set_owner_resolver
+from tests.stubs import make_rsa_key
+
+PRIVATE_KEY, _ = make_rsa_key("testKid")
+
+
+def dev_token(owner_uuid="a-b-c-d", **claims):
+    payload = {"iss": util.DEV_ISSUER, "owner_uuid": owner_uuid, **claims}
+    return jwt.encode(payload, config.dev_jwt_secret, algorithm="HS256")
+
+
+def cognito_token(sub="sub"):
+    issuer = verify_cognito_token.cognito_issuer(config.cognito_user_pool_id)
+    return jwt.encode(
+        {"iss": issuer, "sub": sub}, PRIVATE_KEY, "RS256", headers={"kid": "testKid"}
+    )
+
+
+class TestAuthorizeRequest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(config, "metrics_enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def authorize(self, path, headers):
+        return server.authorize_request(path, headers, config)
+
+    def test_allowed(self):
+        status, headers, body = self.authorize(
+            "/api/a-b-c-d/property", {"Authorization": f"Bearer {dev_token()}"}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, {"X-Owner-Uuid": "a-b-c-d"})
+        self.assertEqual(body, {"principalId": "a-b-c-d"})
+
+    def test_token_in_query_string(self):
+        status, _, _ = self.authorize(f"/api/a-b-c-d/x?token={dev_token()}", {})
+        self.assertEqual(status, 200)
+
+    def test_missing_token(self):
+        status, _, body = self.authorize("/api/a-b-c-d/x", {})
+        self.assertEqual((status, body), (401, {"message": "Missing token"}))
+
+    def test_invalid_token(self):
+        status, _, body = self.authorize("/api/a-b-c-d/x", {"Authorization": "x.y.z"})
+        self.assertEqual((status, body), (401, {"message": "Invalid token"}))
+
+    def test_path_of_other_owner(self):
+        headers = {"Authorization": dev_token()}
+        for path in ["/api/other/x", "/api/a-b-c-d", "/other/api/a-b-c-d/x"]:
+            with self.subTest(path=path):
+                self.assertEqual(self.authorize(path, headers)[0], 403)
+
+    def test_owner_with_slash_is_rejected(self):
+        headers = {"Authorization": dev_token("a-b-c-d/x")}
+        self.assertEqual(self.authorize("/api/a-b-c-d/x/y", headers)[0], 401)
+
+    def test_settings_are_used_to_verify_the_token(self):
+        headers = {"Authorization": dev_token(exp=int(time.time()) - 10)}
+        self.assertEqual(self.authorize("/api/a-b-c-d/x", headers)[0], 401)
+        settings = config.copy(update={"token_clock_skew": 30})
+        status, _, _ = server.authorize_request("/api/a-b-c-d/x", headers, settings)
+        self.assertEqual(status, 200)
+
+    def test_path_traversal(self):
+        headers = {"Authorization": dev_token()}
+        for path in [
+            "/api/a-b-c-d/../other/x",
+            "/api/a-b-c-d/%2e%2e/other/x",
+            "/api/a-b-c-d/%2E%2E%2Fother/x",
+            "/api/a-b-c-d/./x",
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(self.authorize(path, headers)[0], 403)
+
+    def test_path_is_percent_decoded(self):
+        headers = {"Authorization": dev_token()}
+        self.assertEqual(self.authorize("/api/a-b-c-d/x%20y", headers)[0], 200)
+        self.assertEqual(self.authorize("/api/a%2Db-c-d/x", headers)[0], 200)
+
+    def test_original_path_header(self):
+        settings = config.copy(update={"server_original_path_header": "X-Original-URI"})
+        headers = {"Authorization": dev_token(), "x-original-uri": "/api/other/x"}
+        self.assertEqual(server.authorize_request("/auth", headers, settings)[0], 403)
+        headers["x-original-uri"] = "/api/a-b-c-d/x"
+        self.assertEqual(server.authorize_request("/auth", headers, settings)[0], 200)
+
+    def test_original_path_header_is_off_by_default(self):
+        headers = {"Authorization": dev_token(), "X-Original-URI": "/api/a-b-c-d/x"}
+        self.assertEqual(self.authorize("/api/other/x", headers)[0], 403)
+
+    def test_other_original_path_headers_are_ignored(self):
+        settings = config.copy(update={"server_original_path_header": "X-Original-URI"})
+        # A client spoofing the header of another proxy can't override the path
+        headers = {
+            "Authorization": dev_token(),
+            "X-Original-URI": "/api/other/x",
+            "X-Envoy-Original-Path": "/api/a-b-c-d/x",
+        }
+        self.assertEqual(server.authorize_request("/auth", headers, settings)[0], 403)
+
+    def test_unknown_owner(self):
+        set_owner_resolver(StaticOwnerResolver({}))
+        with patch.object(
+            main.verify_cognito_token,
+            "verify_cognito_token",
+            return_value={"sub": "sub"},
+        ):
+            status, _, _ = self.authorize(
+                "/api/x/y", {"Authorization": cognito_token()}
+            )
+        self.assertEqual(status, 403)
+
+    def test_unexpected_error(self):
+        with patch.object(main, "authorize", side_effect=RuntimeError("boom")):
+            with self.assertLogs("authorizer_lambda.server", "ERROR"):
+                status, _, body = self.authorize(
+                    "/api/x/y", {"Authorization": dev_token()}
+                )
+        self.assertEqual(status, 500)
+        self.assertEqual(body["message"], "An unexpected error occurred: boom")
+
+
+class TestOwnerPath(unittest.TestCase):
+    def test_owner_uuid_is_matched_literally(self):
+        pattern = server.owner_path("a.c", config)
+        self.assertTrue(pattern.match("/api/a.c/x"))
+        self.assertFalse(pattern.match("/api/abc/x"))
+
+    def test_path_prefix(self):
+        settings = config.copy(update={"server_path_prefix": "/stage/"})
+        pattern = server.owner_path("a", settings)
+        self.assertTrue(pattern.match("/stage/api/a/x"))
+        self.assertFalse(pattern.match("/api/a/x"))
+
+
+class TestAuthorizerServer(unittest.TestCase):
+    def setUp(self):
+        settings = config.copy(update={"metrics_enabled": False, "server_workers": 2})
+        self.server = server.AuthorizerServer(("127.0.0.1", 0), settings)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.port = self.server.server_address[1]
+
+    def connect(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_keep_alive(self):
+        connection = self.connect()
+        token = dev_token()
+        for method in ["GET", "POST", "HEAD"]:
+            connection.request(
+                method, "/api/a-b-c-d/x", headers={"Authorization": token}
+            )
+            response = connection.getresponse()
+            body = response.read()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader("X-Owner-Uuid"), "a-b-c-d")
+            if method != "HEAD":
+                self.assertEqual(json.loads(body), {"principalId": "a-b-c-d"})
+        # The verified token cache is shared across requests
+        self.assertEqual(main.verified_tokens.stats()["hits"], 2)
+
+    def test_concurrent_requests(self):
+        def request(owner_uuid):
+            connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            try:
+                connection.request(
+                    "GET",
+                    f"/api/{owner_uuid}/x",
+                    headers={"Authorization": dev_token(owner_uuid)},
+                )
+                response = connection.getresponse()
+                response.read()
+                return response.status, response.getheader("X-Owner-Uuid")
+            finally:
+                connection.close()
+
+        owners = [f"owner-{i}" for i in range(20)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(request, owners))
+        self.assertEqual(results, [(200, owner) for owner in owners])
+
+    def test_idle_connections_dont_hold_on_to_workers(self):
+        token = dev_token()
+        # More idle keep-alive connections than workers
+        for _ in range(self.server.settings.server_workers + 2):
+            connection = self.connect()
+            connection.request(
+                "GET", "/api/a-b-c-d/x", headers={"Authorization": token}
+            )
+            connection.getresponse().read()
+        connection = self.connect()
+        start = time.monotonic()
+        connection.request("GET", "/api/a-b-c-d/x", headers={"Authorization": token})
+        self.assertEqual(connection.getresponse().status, 200)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_pipelined_requests(self):
+        request = f"GET /api/a-b-c-d/x HTTP/1.1\r\nAuthorization: {dev_token()}\r\n\r\n"
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(request.encode() * 2)
+            responses = b""
+            while responses.count(b"HTTP/1.1 200") < 2:
+                data = sock.recv(4096)
+                self.assertTrue(data)
+                responses += data
+
+    def test_idle_connections_are_closed(self):
+        self.server.settings = self.server.settings.copy(
+            update={"server_keepalive_timeout": 0.2}
+        )
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            request = f"GET /api/a-b-c-d/x HTTP/1.1\r\nAuthorization: {dev_token()}"
+            sock.sendall(request.encode() + b"\r\n\r\n")
+            self.assertIn(b"200", sock.recv(4096))
+            # The server closes the connection once it's been idle for the timeout
+            self.assertEqual(sock.recv(4096), b"")
+
+    def test_server_settings_are_used(self):
+        self.server.settings = self.server.settings.copy(
+            update={"token_clock_skew": 30}
+        )
+        connection = self.connect()
+        token = dev_token(exp=int(time.time()) - 10)
+        connection.request("GET", "/api/a-b-c-d/x", headers={"Authorization": token})
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 200)
+
+    def test_unauthorized(self):
+        connection = self.connect()
+        connection.request("GET", "/api/a-b-c-d/x")
+        response = connection.getresponse()
+        self.assertEqual(response.status, 401)
+        self.assertEqual(json.loads(response.read()), {"message": "Missing token"})
+
+
+class TestMainCli(unittest.TestCase):
+    def test_serves_until_interrupted(self):
+        with patch.object(
+            server.AuthorizerServer, "serve_forever", side_effect=KeyboardInterrupt
+        ), patch.object(main, "prewarm") as prewarm:
+            self.assertEqual(server.main_cli(["--port", "0", "--workers", "2"]), 0)
+        self.assertEqual(prewarm.call_args[0][0].server_workers, 2)
+
+    def test_no_prewarm(self):
+        with patch.object(
+            server.AuthorizerServer, "serve_forever", side_effect=KeyboardInterrupt
+        ), patch.object(main, "prewarm") as prewarm:
+            server.main_cli(["--port", "0", "--no-prewarm"])
+        prewarm.assert_not_called()
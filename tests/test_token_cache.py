@@ -0,0 +1,75 @@
+import unittest
+from authorizer_lambda.token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(max_entries=2, max_ttl=60, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("token"))
+        self.cache.put("token", {"sub": "abc"}, "owner", "cognito")
+
+        entry = self.cache.get("token")
+        self.assertEqual(entry.claims, {"sub": "abc"})
+        self.assertEqual(entry.owner_uuid, "owner")
+        self.assertEqual(entry.token_type, "cognito")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_expires_at_max_ttl(self):
+        self.cache.put("token", {"exp": 5000}, "owner")
+        self.clock.now = 1059
+        self.assertIsNotNone(self.cache.get("token"))
+        self.clock.now = 1060
+        self.assertIsNone(self.cache.get("token"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_expires_at_token_exp(self):
+        self.cache.put("token", {"exp": 1010}, "owner")
+        self.clock.now = 1009
+        self.assertIsNotNone(self.cache.get("token"))
+        self.clock.now = 1010
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put("a", {}, "owner_a")
+        self.cache.put("b", {}, "owner_b")
+        self.cache.get("a")
+        self.cache.put("c", {}, "owner_c")
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_max_bytes(self):
+        cache = TokenCache(max_entries=100, max_bytes=4000, clock=self.clock)
+        for i in range(20):
+            cache.put(f"token-{i}", {"sub": "x" * 100}, "owner")
+        stats = cache.stats()
+        self.assertLessEqual(stats["bytes"], 4000)
+        self.assertLess(stats["size"], 20)
+        self.assertEqual(stats["evictions"], 20 - stats["size"])
+        self.assertIsNotNone(cache.get("token-19"))
+
+    def test_disabled(self):
+        cache = TokenCache(max_entries=0)
+        cache.put("token", {}, "owner")
+        self.assertIsNone(cache.get("token"))
+
+    def test_clear(self):
+        self.cache.put("token", {}, "owner")
+        self.cache.get("token")
+        self.cache.clear()
+        self.assertFalse(any(self.cache.stats().values()))
@@ -0,0 +1,91 @@
+import time
+import unittest
+import jwt
+from authorizer_lambda.tokens import ParsedToken, parse_token, validate_time_claims
+
+
+class TestParseToken(unittest.TestCase):
+    def test_parse_token(self):
+        token = jwt.encode(
+            {"iss": "dev.myapp.ai", "sub": "abc"},
+            "secret",
+            algorithm="HS256",
+            headers={"kid": "key1"},
+        )
+        parsed = parse_token(token)
+
+        self.assertEqual(parsed.raw, token)
+        self.assertEqual(parsed.payload, {"iss": "dev.myapp.ai", "sub": "abc"})
+        self.assertEqual(parsed.alg, "HS256")
+        self.assertEqual(parsed.kid, "key1")
+        self.assertEqual(parsed.issuer, "dev.myapp.ai")
+        self.assertEqual(parsed.signing_input, token.rsplit(".", 1)[0].encode())
+        self.assertEqual(len(parsed.signature), 32)
+
+    def test_parsed_token_is_returned_as_is(self):
+        parsed = parse_token(jwt.encode({}, "secret"))
+        self.assertIs(parse_token(parsed), parsed)
+
+    def test_malformed_tokens(self):
+        valid = jwt.encode({}, "secret")
+        header, payload, signature = valid.split(".")
+        for token in [
+            "",
+            "invalid_token",
+            "a.b",
+            f"{header}.{payload}",
+            f"{header}.{payload}.{signature}.extra",
+            f"{header}.bm90IGpzb24.{signature}",
+            f"{header}.WzFd.{signature}",
+            f"{header}.{payload}.$$$",
+            f".{payload}.{signature}",
+            "é.é.é",
+            None,
+        ]:
+            with self.subTest(token=token):
+                with self.assertRaises(ValueError) as context:
+                    parse_token(token)  # type: ignore
+                self.assertEqual(str(context.exception), "Invalid token")
+
+
+class TestValidateTimeClaims(unittest.TestCase):
+    def test_valid(self):
+        now = int(time.time())
+        validate_time_claims({})
+        validate_time_claims({"exp": now + 60, "nbf": now - 60, "iat": now})
+
+    def test_expired(self):
+        with self.assertRaises(ValueError) as context:
+            validate_time_claims({"exp": int(time.time()) - 1})
+        self.assertEqual(str(context.exception), "Expired token")
+
+    def test_leeway(self):
+        now = int(time.time())
+        validate_time_claims({"exp": now - 5, "nbf": now + 5}, leeway=30)
+
+    def test_not_yet_valid(self):
+        with self.assertRaises(ValueError) as context:
+            validate_time_claims({"nbf": int(time.time()) + 60})
+        self.assertEqual(str(context.exception), "Invalid token")
+
+    def test_claims_must_be_numbers(self):
+        for claims in [
+            {"exp": "soon"},
+            {"nbf": True},
+            {"iat": [1]},
+            {"exp": None},
+            {"nbf": None},
+            {"iat": None},
+        ]:
+            with self.subTest(claims=claims):
+                with self.assertRaises(ValueError) as context:
+                    validate_time_claims(claims)
+                self.assertEqual(str(context.exception), "Invalid token")
+
+
+class TestParsedToken(unittest.TestCase):
+    def test_missing_header_fields(self):
+        parsed = ParsedToken("raw", {}, {}, b"", b"")
+        self.assertIsNone(parsed.alg)
+        self.assertIsNone(parsed.kid)
+        self.assertIsNone(parsed.issuer)
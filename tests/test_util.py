@@ -1,7 +1,8 @@
+import time
 import unittest
 import jwt
 from authorizer_lambda import util
-from unittest.mock import patch
+from authorizer_lambda.tokens import parse_token
 
 
 class TestIsDevToken(unittest.TestCase):
@@ -9,50 +10,70 @@ class TestIsDevToken(unittest.TestCase):
         token = jwt.encode({"iss": "dev.myapp.ai"}, "secret", algorithm="HS256")
         self.assertTrue(util.is_dev_token(token))
 
+    def test_parsed_dev_token(self):
+        token = jwt.encode({"iss": "dev.myapp.ai"}, "secret", algorithm="HS256")
+        self.assertTrue(util.is_dev_token(parse_token(token)))
+
     def test_invalid_issuer(self):
         token = jwt.encode({"iss": "not_dev.myapp.ai"}, "secret", algorithm="HS256")
         self.assertFalse(util.is_dev_token(token))
 
+    def test_invalid_algorithm(self):
+        token = jwt.encode({"iss": "dev.myapp.ai"}, "secret", algorithm="HS512")
+        self.assertFalse(util.is_dev_token(token))
+
     def test_invalid_token(self):
         self.assertFalse(util.is_dev_token("invalid_token"))
 
 
 class TestVerifyDevJwt(unittest.TestCase):
-    @patch("jwt.decode")
-    def test_valid_dev_jwt(self, mocked_decode):
+    def test_valid_dev_jwt(self):
         mock_payload = {"iss": "dev.myapp.ai", "owner_uuid": "1234"}
         valid_token = jwt.encode(mock_payload, "mock_secret", algorithm="HS256")
 
         secret = "mock_secret"
 
-        mocked_decode.return_value = mock_payload
         payload = util.verify_dev_token(valid_token, secret)
-        self.assertEqual(payload["iss"], "dev.myapp.ai")
+        self.assertEqual(payload, mock_payload)
+
+        payload = util.verify_dev_token(parse_token(valid_token), secret)
+        self.assertEqual(payload, mock_payload)
 
-    @patch("jwt.decode")
-    def test_invalid_dev_jwt(self, mocked_decode):
+    def test_invalid_dev_jwt(self):
         invalid_token = "invalid token"
         secret = "mock_secret"
 
-        mocked_decode.side_effect = jwt.InvalidTokenError
         with self.assertRaises(ValueError):
             util.verify_dev_token(invalid_token, secret)
 
-    @patch("jwt.decode")
-    def test_expired_dev_jwt(self, mocked_decode):
+    def test_wrong_secret_dev_jwt(self):
+        token = jwt.encode({"iss": "dev.myapp.ai"}, "other_secret", algorithm="HS256")
+
+        with self.assertRaises(ValueError) as context:
+            util.verify_dev_token(token, "mock_secret")
+        self.assertEqual(str(context.exception), "Invalid token")
+
+    def test_wrong_algorithm_dev_jwt(self):
+        token = jwt.encode({"iss": "dev.myapp.ai"}, "mock_secret", algorithm="HS512")
+
+        with self.assertRaises(ValueError) as context:
+            util.verify_dev_token(token, "mock_secret")
+        self.assertEqual(str(context.exception), "Invalid token")
+
+    def test_expired_dev_jwt(self):
         expired_token = jwt.encode(
-            {"iss": "dev.myapp.ai"}, "mock_secret", algorithm="HS256"
+            {"iss": "dev.myapp.ai", "exp": int(time.time()) - 10},
+            "mock_secret",
+            algorithm="HS256",
         )
 
         secret = "mock_secret"
 
-        mocked_decode.side_effect = jwt.ExpiredSignatureError
         with self.assertRaises(ValueError) as context:
             util.verify_dev_token(expired_token, secret)
         self.assertEqual(str(context.exception), "Expired token")
 
-    @patch("jwt.decode")
-    def test_invalid_issuer_dev_jwt(self, mocked_decode):
+    def test_invalid_issuer_dev_jwt(self):
         mock_payload = {"iss": "invalid.issuer", "owner_uuid": "1234"}
         invalid_issuer_token = jwt.encode(
             mock_payload, "mock_secret", algorithm="HS256"
@@ -60,7 +81,6 @@ class TestVerifyDevJwt(unittest.TestCase):
 
         secret = "mock_secret"
 
-        mocked_decode.return_value = mock_payload
         with self.assertRaises(ValueError) as context:
             util.verify_dev_token(invalid_issuer_token, secret)
         self.assertEqual(str(context.exception), "Invalid issuer")
@@ -0,0 +1,189 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import jwt
+
+from authorizer_lambda import util, verify_cognito_token
+from authorizer_lambda.config import config
+from authorizer_lambda.dev_keyring import DevKeyring, SettingsSecretSource
+from authorizer_lambda.tokens import parse_token
+from authorizer_lambda.verifiers import (
+    BACKENDS,
+    CryptographyVerifier,
+    JoseVerifier,
+    PyJWTVerifier,
+    create_token_verifier,
+    get_token_verifier,
+    set_token_verifier,
+)
+from tests.stubs import JWKSServer, make_rsa_key
+
+SECRET = "secret" * 8
+
+
+def verifiers():
+    return [
+        create_token_verifier(config.copy(update={"token_verifier": backend}))
+        for backend in BACKENDS
+    ]
+
+
+class TestTokenVerifiers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key, cls.public_jwk = make_rsa_key("testKid")
+        cls.other_private_key, cls.other_jwk = make_rsa_key("otherKid")
+
+    def test_hs256(self):
+        token = parse_token(jwt.encode({"sub": "sub"}, SECRET, "HS256"))
+        for verifier in verifiers():
+            with self.subTest(backend=verifier.name):
+                key = verifier.hmac_key(SECRET.encode())
+                self.assertTrue(
+                    verifier.verify_hs256(token.signing_input, key, token.signature)
+                )
+                other_key = verifier.hmac_key(b"other" * 8)
+                self.assertFalse(
+                    verifier.verify_hs256(
+                        token.signing_input, other_key, token.signature
+                    )
+                )
+                self.assertFalse(verifier.verify_hs256(token.signing_input, key, b""))
+
+    def test_rs256(self):
+        token = parse_token(jwt.encode({"sub": "sub"}, self.private_key, "RS256"))
+        for verifier in verifiers():
+            with self.subTest(backend=verifier.name):
+                key = verifier.rsa_key(self.public_jwk)
+                self.assertTrue(
+                    verifier.verify_rs256(token.signing_input, key, token.signature)
+                )
+                other_key = verifier.rsa_key(self.other_jwk)
+                self.assertFalse(
+                    verifier.verify_rs256(
+                        token.signing_input, other_key, token.signature
+                    )
+                )
+                self.assertFalse(
+                    verifier.verify_rs256(token.signing_input, key, b"garbage")
+                )
+
+    def test_unusable_jwks(self):
+        for jwk in [
+            {"kty": "EC", "crv": "P-256", "x": "AA", "y": "AA"},
+            {"kty": "RSA", "e": "AQAB"},
+            {"kty": "RSA", "e": "AQAB", "n": "!!"},
+            {"kty": "RSA", "e": 1, "n": self.public_jwk["n"]},
+        ]:
+            for verifier in verifiers():
+                with self.subTest(backend=verifier.name, jwk=jwk):
+                    with self.assertRaises(ValueError):
+                        verifier.rsa_key(jwk)
+
+    def test_create_token_verifier(self):
+        for name, cls in [
+            ("cryptography", CryptographyVerifier),
+            ("pyjwt", PyJWTVerifier),
+            ("jose", JoseVerifier),
+        ]:
+            with self.subTest(name=name):
+                settings = config.copy(update={"token_verifier": name})
+                verifier = create_token_verifier(settings)
+                self.assertIsInstance(verifier, cls)
+                self.assertEqual(verifier.name, name)
+                verifier.load()
+        with self.assertRaises(ValueError):
+            create_token_verifier(config.copy(update={"token_verifier": "x"}))
+
+    def test_process_wide_verifier(self):
+        self.assertIs(get_token_verifier(), get_token_verifier())
+        self.assertEqual(get_token_verifier().name, config.token_verifier)
+        verifier = JoseVerifier()
+        set_token_verifier(verifier)
+        self.assertIs(get_token_verifier(), verifier)
+
+
+class TestSameBehaviourWithEveryBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key, cls.public_jwk = make_rsa_key("testKid")
+
+    def setUp(self):
+        self.server = JWKSServer({"keys": [self.public_jwk]}).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        patcher = patch.object(
+            verify_cognito_token, "jwks_url", lambda *args, **kwargs: self.server.url
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def outcomes(self, verify, tokens):
+        """Verify every token with every backend, and return the outcomes."""
+        outcomes = {}
+        for verifier in verifiers():
+            set_token_verifier(verifier)
+            verify_cognito_token.clear_jwks_caches()
+            results = []
+            for token in tokens:
+                try:
+                    results.append(verify(token))
+                except ValueError as e:
+                    results.append((type(e), str(e)))
+            outcomes[verifier.name] = results
+        return outcomes
+
+    def assertSameOutcomes(self, outcomes):
+        first = next(iter(outcomes.values()))
+        for name, results in outcomes.items():
+            with self.subTest(backend=name):
+                self.assertEqual(results, first)
+
+    def test_dev_tokens(self):
+        def dev_token(secret=SECRET, **claims):
+            payload = {"iss": util.DEV_ISSUER, "owner_uuid": "a-b-c-d", **claims}
+            return jwt.encode(payload, secret, "HS256")
+
+        tokens = [
+            dev_token(),
+            dev_token(secret="other" * 8),
+            dev_token(exp=int(time.time()) - 10),
+            dev_token()[:-2],
+            jwt.encode({"iss": util.DEV_ISSUER}, self.private_key, "RS256"),
+        ]
+        settings = config.copy(update={"dev_jwt_secret": SECRET})
+
+        def verify(token):
+            keyring = DevKeyring(SettingsSecretSource(settings))
+            return util.verify_dev_token(token, SECRET), util.verify_dev_token(
+                token, keyring
+            )
+
+        outcomes = self.outcomes(verify, tokens)
+        self.assertSameOutcomes(outcomes)
+        self.assertEqual(outcomes["cryptography"][0][0]["owner_uuid"], "a-b-c-d")
+
+    def test_cognito_tokens(self):
+        other_private_key, _ = make_rsa_key("testKid")
+
+        def cognito_token(private_key=self.private_key, kid="testKid", **claims):
+            payload = {"sub": "sub", "exp": int(time.time()) + 60, **claims}
+            return jwt.encode(payload, private_key, "RS256", headers={"kid": kid})
+
+        tokens = [
+            cognito_token(),
+            cognito_token(private_key=other_private_key),
+            cognito_token(kid="unknownKid"),
+            cognito_token(exp=int(time.time()) - 10),
+            cognito_token(aud="other"),
+            cognito_token()[:-4],
+        ]
+
+        def verify(token):
+            return verify_cognito_token.verify_cognito_token(
+                token, config.cognito_user_pool_id
+            )
+
+        outcomes = self.outcomes(verify, tokens)
+        self.assertSameOutcomes(outcomes)
+        self.assertEqual(outcomes["cryptography"][0]["sub"], "sub")
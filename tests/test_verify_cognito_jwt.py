@@ -1,10 +1,16 @@
 import unittest
 from authorizer_lambda import verify_cognito_token as util
 from unittest.mock import patch, Mock
-from jose.exceptions import JOSEError
+import tempfile
+import time
+import jwt
 import requests
-
-token_header = {"alg": "RS256", "typ": "JWT", "kid": "testKid"}
+from authorizer_lambda.clients import Clients, set_clients
+from authorizer_lambda.config import CognitoPool, config
+from authorizer_lambda.disk_cache import DiskCache
+from authorizer_lambda.resilience import CircuitBreaker, CircuitOpenError
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from tests.stubs import JWKSServer, make_rsa_key
 
 token_payload = {"sub": "1234567890", "name": "John Doe", "admin": True}
 
@@ -25,72 +31,489 @@ jwks = {
 
 
 class TestVerifyCognitoJwt(unittest.TestCase):
-    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks")
-    @patch("jose.jwt.decode")
-    @patch("jose.jwt.get_unverified_header")
-    def test_valid_cognito_jwt(self, mock_header, mock_decode, mock_fetch_jwks):
-        mock_fetch_jwks.return_value = jwks
-        mock_header.return_value = token_header
-        mock_decode.return_value = token_payload
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_valid_cognito_jwt(self, mock_fetch_jwks):
+        private_key, public_jwk = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk]}
+        token = jwt.encode(
+            token_payload, private_key, algorithm="RS256", headers={"kid": "testKid"}
+        )
 
         cognito_pool_id = "cognito_user_pool_id"
-        payload = util.verify_cognito_token(encoded_token, cognito_pool_id)
+        payload = util.verify_cognito_token(token, cognito_pool_id)
 
         expected_sub = "1234567890"
         self.assertEqual(payload["sub"], expected_sub)
 
-        mock_fetch_jwks.assert_called_once_with(cognito_pool_id)
+        mock_fetch_jwks.assert_called_once_with(util.jwks_url(cognito_pool_id))
+
+        # The key set is cached for subsequent tokens
+        util.verify_cognito_token(token, cognito_pool_id)
+        mock_fetch_jwks.assert_called_once()
+
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_wrong_signature_cognito_jwt(self, mock_fetch_jwks):
+        _, public_jwk = make_rsa_key("testKid")
+        other_private_key, _ = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk]}
+        token = jwt.encode(
+            token_payload,
+            other_private_key,
+            algorithm="RS256",
+            headers={"kid": "testKid"},
+        )
+
+        with self.assertRaises(ValueError) as context:
+            util.verify_cognito_token(token, "cognito_user_pool_id")
+
+        self.assertEqual(str(context.exception), "Invalid token")
 
-    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks")
-    @patch("jose.jwt.decode")
-    @patch("jose.jwt.get_unverified_header")
-    def test_invalid_cognito_jwt(self, mock_header, mock_decode, mock_fetch_jwks):
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_invalid_cognito_jwt(self, mock_fetch_jwks):
         mock_fetch_jwks.return_value = jwks
-        mock_header.return_value = token_header
-        mock_decode.side_effect = JOSEError
 
         with self.assertRaises(ValueError) as context:
             util.verify_cognito_token(encoded_token, "cognito_user_pool_id")
 
         self.assertEqual(str(context.exception), "Invalid token")
+        mock_fetch_jwks.assert_not_called()
+
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_wrong_algorithm_cognito_jwt(self, mock_fetch_jwks):
+        token = jwt.encode(token_payload, "secret", headers={"kid": "testKid"})
+
+        with self.assertRaises(ValueError) as context:
+            util.verify_cognito_token(token, "cognito_user_pool_id")
+
+        self.assertEqual(str(context.exception), "Invalid token")
+        mock_fetch_jwks.assert_not_called()
+
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_expired_cognito_jwt(self, mock_fetch_jwks):
+        private_key, public_jwk = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk]}
+        token = jwt.encode(
+            dict(token_payload, exp=int(time.time()) - 10),
+            private_key,
+            algorithm="RS256",
+            headers={"kid": "testKid"},
+        )
+
+        with self.assertRaises(ValueError) as context:
+            util.verify_cognito_token(token, "cognito_user_pool_id")
+
+        self.assertEqual(str(context.exception), "Invalid token")
 
-    @patch("requests.get")
-    def test_fetch_jwks_success(self, mock_get):
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_audience_cognito_jwt(self, mock_fetch_jwks):
+        private_key, public_jwk = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk]}
+
+        for audience in ["cognito_user_pool_id", ["other", "cognito_user_pool_id"]]:
+            token = jwt.encode(
+                dict(token_payload, aud=audience),
+                private_key,
+                algorithm="RS256",
+                headers={"kid": "testKid"},
+            )
+            payload = util.verify_cognito_token(token, "cognito_user_pool_id")
+            self.assertEqual(payload["aud"], audience)
+
+        token = jwt.encode(
+            dict(token_payload, aud="other"),
+            private_key,
+            algorithm="RS256",
+            headers={"kid": "testKid"},
+        )
+        with self.assertRaises(ValueError) as context:
+            util.verify_cognito_token(token, "cognito_user_pool_id")
+        self.assertEqual(str(context.exception), "Invalid token")
+
+    def test_fetch_jwks_success(self):
+        mock_session = Mock()
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = jwks
 
-        mock_get.return_value = mock_response
+        mock_session.get.return_value = mock_response
+        set_clients(Clients(http=mock_session))
 
         user_pool_id = "cognito_user_pool_id"
         result = util.fetch_jwks(user_pool_id)
 
         self.assertEqual(result, jwks)
-        mock_get.assert_called_once_with(
-            f"https://cognito-idp.us-east-1.amazonaws.com/{user_pool_id}/.well-known/jwks.json"
+        mock_session.get.assert_called_once_with(
+            f"https://cognito-idp.us-east-1.amazonaws.com/{user_pool_id}/.well-known/jwks.json",
+            timeout=(config.http_connect_timeout, config.http_read_timeout),
         )
 
-    @patch("requests.get")
-    def test_fetch_jwks_failure(self, mock_get):
+    def test_fetch_jwks_failure(self):
+        mock_session = Mock()
         mock_response = Mock()
         mock_response.status_code = 404
         mock_response.raise_for_status.side_effect = requests.RequestException
 
-        mock_get.return_value = mock_response
+        mock_session.get.return_value = mock_response
+        set_clients(Clients(http=mock_session))
 
         user_pool_id = "cognito_user_pool_id"
         with self.assertRaises(requests.RequestException):
             util.fetch_jwks(user_pool_id)
 
-    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks")
-    @patch("jose.jwt.decode")
-    @patch("jose.jwt.get_unverified_header")
-    def test_none_cognito_jwt(self, mock_header, mock_decode, mock_fetch_jwks):
-        mock_fetch_jwks.return_value = None
-        mock_header.return_value = token_header
-        mock_decode.side_effect = JOSEError
+    def test_fetch_jwks_from_url(self):
+        with JWKSServer(jwks) as server:
+            self.assertEqual(util.fetch_jwks_from_url(server.url), jwks)
+            self.assertEqual(util.fetch_jwks_from_url(server.url), jwks)
+            self.assertEqual(server.requests, 2)
+
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_unknown_kid_cognito_jwt(self, mock_fetch_jwks):
+        private_key, _ = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": []}
+        token = jwt.encode(
+            token_payload, private_key, algorithm="RS256", headers={"kid": "testKid"}
+        )
 
         with self.assertRaises(ValueError) as context:
-            util.verify_cognito_token(encoded_token, "cognito_user_pool_id")
+            util.verify_cognito_token(token, "cognito_user_pool_id")
 
         self.assertEqual(str(context.exception), "Invalid token")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestJWKSCache(unittest.TestCase):
+    def setUp(self):
+        self.server = JWKSServer(jwks).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.clock = FakeClock()
+        self.cache = util.JWKSCache(
+            self.server.url,
+            ttl=100,
+            stale_ttl=50,
+            refresh_min_interval=10,
+            clock=self.clock,
+        )
+
+    def test_keys_are_cached_until_ttl(self):
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.clock.now = 99
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.assertEqual(self.server.requests, 1)
+
+    def test_stale_keys_are_served_while_refreshing(self):
+        self.cache.get_key("testKid")
+        self.server.jwks = {"keys": [dict(jwks["keys"][0], n="rotatedN")]}
+        self.clock.now = 120
+
+        self.assertEqual(self.cache.get_key("testKid")["n"], "testN")
+        self.cache._background_refresh.join()
+        self.assertEqual(self.cache.get_key("testKid")["n"], "rotatedN")
+        self.assertEqual(self.server.requests, 2)
+
+    def test_expired_keys_are_refreshed_synchronously(self):
+        self.cache.get_key("testKid")
+        self.server.jwks = {"keys": [dict(jwks["keys"][0], n="rotatedN")]}
+        self.clock.now = 150
+
+        self.assertEqual(self.cache.get_key("testKid")["n"], "rotatedN")
+        self.assertEqual(self.server.requests, 2)
+
+    def test_failed_background_refresh_keeps_stale_keys(self):
+        self.cache.get_key("testKid")
+        self.server.status = 500
+        self.clock.now = 120
+
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.cache._background_refresh.join()
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+
+    def test_unknown_kid_forces_rate_limited_refresh(self):
+        self.cache.get_key("testKid")
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get_key("bogusKid"))
+        self.assertEqual(self.server.requests, 2)
+
+        # A flood of unknown kids doesn't cause more refreshes
+        for _ in range(5):
+            self.assertIsNone(self.cache.get_key("bogusKid"))
+        self.assertEqual(self.server.requests, 2)
+
+        # A rotated-in key is picked up by the next allowed refresh
+        self.server.jwks = {"keys": jwks["keys"] + [dict(jwks["keys"][0], kid="new")]}
+        self.clock.now = 20
+        self.assertEqual(self.cache.get_key("new")["kid"], "new")
+        self.assertEqual(self.server.requests, 3)
+
+    def test_initial_fetch_failure_raises(self):
+        self.server.status = 503
+        with self.assertRaises(requests.HTTPError):
+            self.cache.get_key("testKid")
+
+
+class TestJWKSCacheFallback(unittest.TestCase):
+    def setUp(self):
+        self.server = JWKSServer(jwks).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            "jwks", failure_threshold=2, reset_timeout=30, clock=self.clock
+        )
+        self.cache = util.JWKSCache(
+            self.server.url,
+            ttl=100,
+            stale_ttl=50,
+            refresh_min_interval=10,
+            max_stale=1000,
+            deadline=0.5,
+            breaker=self.breaker,
+            clock=self.clock,
+        )
+        self.cache.get_key("testKid")
+
+    def test_stale_keys_are_served_while_cognito_fails(self):
+        self.server.status = 500
+        self.clock.now = 200
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.clock.now = 300
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        # While the breaker is open, Cognito isn't called at all
+        requests_made = self.server.requests
+        self.clock.now = 310
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.assertIsNone(self.cache.get_key("otherKid"))
+        self.assertEqual(self.server.requests, requests_made)
+
+    def test_stale_keys_expire(self):
+        self.server.status = 500
+        self.clock.now = 1150
+        with self.assertRaises(CircuitOpenError):
+            for _ in range(3):
+                try:
+                    self.cache.get_key("testKid")
+                except requests.HTTPError:
+                    pass
+
+    def test_slow_cognito_misses_the_deadline(self):
+        self.server.delay = 2
+        self.clock.now = 200
+        start = time.monotonic()
+        self.assertEqual(self.cache.get_key("testKid"), jwks["keys"][0])
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_recovers_after_reset_timeout(self):
+        self.server.status = 500
+        self.clock.now = 200
+        self.cache.get_key("testKid")
+        self.clock.now = 210
+        self.cache.get_key("testKid")
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.server.status = 200
+        self.server.jwks = {"keys": [dict(jwks["keys"][0], n="rotatedN")]}
+        self.clock.now = 240
+        self.assertEqual(self.cache.get_key("testKid")["n"], "rotatedN")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestJWKSCacheOnDisk(unittest.TestCase):
+    def setUp(self):
+        self.server = JWKSServer(jwks).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.wall_clock = FakeClock()
+        self.disk_cache = DiskCache(directory.name, clock=self.wall_clock)
+
+    def make_cache(self):
+        return util.JWKSCache(
+            self.server.url,
+            ttl=100,
+            stale_ttl=50,
+            refresh_min_interval=10,
+            disk_cache=self.disk_cache,
+            clock=FakeClock(),
+        )
+
+    def test_restarted_cache_uses_keys_on_disk(self):
+        self.make_cache().get_key("testKid")
+        self.assertEqual(self.server.requests, 1)
+
+        self.wall_clock.now = 90
+        cache = self.make_cache()
+        self.assertEqual(cache.get_key("testKid"), jwks["keys"][0])
+        self.assertEqual(self.server.requests, 1)
+
+    def test_keys_on_disk_keep_their_age(self):
+        self.make_cache().get_key("testKid")
+        self.server.jwks = {"keys": [dict(jwks["keys"][0], n="rotatedN")]}
+        self.wall_clock.now = 120
+
+        cache = self.make_cache()
+        self.assertEqual(cache.get_key("testKid")["n"], "testN")
+        cache._background_refresh.join()
+        self.assertEqual(cache.get_key("testKid")["n"], "rotatedN")
+
+    def test_expired_keys_on_disk_are_ignored(self):
+        self.make_cache().get_key("testKid")
+        self.server.jwks = {"keys": [dict(jwks["keys"][0], n="rotatedN")]}
+        self.wall_clock.now = 150
+
+        self.assertEqual(self.make_cache().get_key("testKid")["n"], "rotatedN")
+        self.assertEqual(self.server.requests, 2)
+
+
+class TestKids(unittest.TestCase):
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_kids_of_usable_keys(self, mock_fetch_jwks):
+        _, public_jwk = make_rsa_key("goodKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk, jwks["keys"][0]]}
+        cache = util.JWKSCache("some_url")
+        with self.assertLogs("authorizer_lambda.verify_cognito_token", "WARNING"):
+            self.assertEqual(cache.kids(), ["goodKid"])
+        mock_fetch_jwks.assert_called_once()
+
+
+class TestGetJwksCache(unittest.TestCase):
+    def test_cache_per_user_pool(self):
+        cache = util.get_jwks_cache("pool_a")
+        self.assertIs(util.get_jwks_cache("pool_a"), cache)
+        self.assertIsNot(util.get_jwks_cache("pool_b"), cache)
+        self.assertEqual(cache.url, util.jwks_url("pool_a"))
+        self.assertEqual(cache.ttl, config.jwks_cache_ttl)
+
+
+class TestCognitoPools(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.jwks = {}
+        cls.keys = {}
+        for name in ["pool_a", "pool_b"]:
+            cls.keys[name], cls.jwks[name] = make_rsa_key(f"{name}Kid")
+
+    def setUp(self):
+        self.servers = {}
+        self.pools = {}
+        for name, region in [("pool_a", "us-east-1"), ("pool_b", "eu-west-1")]:
+            server = JWKSServer({"keys": [self.jwks[name]]}).__enter__()
+            self.addCleanup(server.__exit__, None, None, None)
+            self.servers[name] = server
+            self.pools[name] = CognitoPool(
+                user_pool_id=name, region=region, jwks_url=server.url
+            )
+        self.settings = config.copy(update={"cognito_pools": list(self.pools.values())})
+
+    def token(self, name, pool=None, **claims):
+        pool = self.pools[pool or name]
+        return jwt.encode(
+            {"iss": util.cognito_issuer(pool.user_pool_id, pool.region), **claims},
+            self.keys[name],
+            algorithm="RS256",
+            headers={"kid": f"{name}Kid"},
+        )
+
+    def test_route_by_issuer(self):
+        pools = util.get_cognito_pools(self.settings)
+        self.assertEqual(len(pools), 2)
+        self.assertIs(
+            pools.route("https://cognito-idp.eu-west-1.amazonaws.com/pool_b"),
+            self.pools["pool_b"],
+        )
+        self.assertIsNone(
+            pools.route("https://cognito-idp.us-east-1.amazonaws.com/pool_b")
+        )
+        self.assertIsNone(pools.route(None))
+
+    def test_pools_are_indexed_once(self):
+        pools = util.get_cognito_pools(self.settings)
+        self.assertIs(util.get_cognito_pools(self.settings), pools)
+        self.assertIs(util.get_cognito_pools(self.settings.copy()), pools)
+        settings = self.settings.copy(update={"cognito_pools": []})
+        self.assertEqual(
+            list(util.get_cognito_pools(settings)),
+            [CognitoPool(user_pool_id=config.cognito_user_pool_id)],
+        )
+
+    def test_each_pool_uses_its_own_key_set(self):
+        for name, pool in self.pools.items():
+            with self.subTest(pool=name):
+                payload = util.verify_cognito_token(self.token(name, sub=name), pool)
+                self.assertEqual(payload["sub"], name)
+        self.assertEqual(self.servers["pool_a"].requests, 1)
+        self.assertEqual(self.servers["pool_b"].requests, 1)
+
+    def test_key_of_another_pool_is_rejected(self):
+        token = self.token("pool_b", pool="pool_a")
+        with self.assertRaises(ValueError):
+            util.verify_cognito_token(token, self.pools["pool_a"])
+
+    def test_jwks_settings_per_pool(self):
+        pool = self.pools["pool_b"].copy(
+            update={"jwks_cache_ttl": 60, "jwks_refresh_min_interval": 5}
+        )
+        cache = util.get_pool_jwks_cache(pool)
+        self.assertEqual(cache.url, self.servers["pool_b"].url)
+        self.assertEqual((cache.ttl, cache.refresh_min_interval), (60, 5))
+        cache = util.get_pool_jwks_cache(CognitoPool(user_pool_id="pool_c"))
+        self.assertEqual(cache.url, util.jwks_url("pool_c"))
+        self.assertEqual(cache.ttl, config.jwks_cache_ttl)
+
+    def test_audience(self):
+        pool = self.pools["pool_a"].copy(update={"audience": ("client",)})
+        for claims in [
+            {"aud": "client"},
+            {"aud": ["x", "client"]},
+            {"client_id": "client"},
+        ]:
+            with self.subTest(claims=claims):
+                util.verify_cognito_token(self.token("pool_a", **claims), pool)
+        for claims in [{}, {"aud": "pool_a"}, {"client_id": "other"}]:
+            with self.subTest(claims=claims):
+                with self.assertRaises(ValueError):
+                    util.verify_cognito_token(self.token("pool_a", **claims), pool)
+
+    def test_refresh_jwks_caches(self):
+        util.refresh_jwks_caches(self.settings)
+        self.assertEqual(self.servers["pool_a"].requests, 1)
+        self.assertEqual(self.servers["pool_b"].requests, 1)
+
+        # A failing pool doesn't keep the others from being refreshed
+        self.servers["pool_a"].status = 500
+        with self.assertLogs("authorizer_lambda.verify_cognito_token", "WARNING"):
+            with self.assertRaises(requests.RequestException):
+                util.refresh_jwks_caches(self.settings)
+        self.assertEqual(self.servers["pool_b"].requests, 2)
+
+
+class TestVerifiers(unittest.TestCase):
+    @patch("authorizer_lambda.verify_cognito_token.fetch_jwks_from_url")
+    def test_verifiers_are_built_once_per_key_set(self, mock_fetch_jwks):
+        _, public_jwk = make_rsa_key("testKid")
+        mock_fetch_jwks.return_value = {"keys": [public_jwk]}
+        cache = util.JWKSCache("some_url")
+
+        verifier = cache.get_verifier("testKid")
+        self.assertIsInstance(verifier, RSAPublicKey)
+        self.assertIs(cache.get_verifier("testKid"), verifier)
+
+        # A rotated key set gets new verifiers
+        cache.refresh()
+        self.assertIsNot(cache.get_verifier("testKid"), verifier)
+
+    def test_build_verifiers_skips_unusable_keys(self):
+        _, public_jwk = make_rsa_key("good")
+        keys = {
+            "good": public_jwk,
+            "malformed": dict(jwks["keys"][0], kid="malformed"),
+            "ec": {"kty": "EC", "kid": "ec"},
+            "hs": dict(public_jwk, kid="hs", alg="HS256"),
+        }
+        self.assertEqual(list(util._build_verifiers(keys)), ["good"])